@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+ann_recall.py
+- گزارش recall ایندکس تقریبی (recommendation/ann.py) در برابر لیست‌های ذخیره‌شده similar_products.json
+- کنار recall: سهم جفت‌هایی که بررسی شدند (candidates) و زمان، در برابر زمان محاسبه دقیق
+- recall و هزینه میانگین چند seed است (--seeds)
+- python Test/ann_recall.py [--bands 32 --rows 2 --max-bucket 500] [--seeds 10] [--sweep]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from similar_products import INPUT_PATH, OUTPUT_PATH, SIM_THRESHOLD, load_products, build_corpus_and_tokens
+from recommendation.ann import DEFAULT_BANDS, DEFAULT_MAX_BUCKET, DEFAULT_ROWS, MinHashLSH
+
+# (bands, rows, max_bucket)
+SWEEP = [(16, 1, None), (32, 2, None), (32, 2, DEFAULT_MAX_BUCKET), (48, 2, DEFAULT_MAX_BUCKET),
+         (48, 3, DEFAULT_MAX_BUCKET), (64, 3, DEFAULT_MAX_BUCKET), (64, 4, DEFAULT_MAX_BUCKET)]
+
+
+def exact_lists(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {int(pid): set(ids) for pid, ids in data["similar_products"].items()}
+
+
+def exact_seconds(X, threshold):
+    """زمان همه جفت‌ها مثل catalog.thresholded_similarities (فقط برای مقایسه هزینه)"""
+    started = time.perf_counter()
+    Xn = normalize(sp.csr_matrix(X, dtype=float))
+    sims = (Xn @ Xn.T).tocsr()
+    sims.data[sims.data < threshold] = 0.0
+    sims.eliminate_zeros()
+    return time.perf_counter() - started
+
+
+def run_once(ids, X, exact, bands, rows, max_bucket, seed):
+    lsh = MinHashLSH(bands=bands, rows=rows, seed=seed, max_bucket=max_bucket)
+    started = time.perf_counter()
+    neighbours = lsh.neighbours(X, SIM_THRESHOLD)
+    elapsed = time.perf_counter() - started
+
+    found = total = 0
+    for idx, pid in enumerate(ids):
+        row = neighbours.indices[neighbours.indptr[idx]:neighbours.indptr[idx + 1]]
+        want = exact.get(pid, set())
+        found += len(want & {ids[j] for j in row if j != idx})
+        total += len(want)
+    stats = lsh.stats
+    return (found / total if total else 1.0,
+            stats["candidates"] / max(1, stats["total_pairs"]),
+            stats["skipped_buckets"],
+            elapsed)
+
+
+def report(ids, X, exact, exact_time, bands, rows, max_bucket, seeds):
+    runs = np.array([run_once(ids, X, exact, bands, rows, max_bucket, seed) for seed in range(seeds)])
+    recall, candidates, skipped, elapsed = runs.mean(axis=0)
+    print(f"bands={bands:<3} rows={rows} max_bucket={str(max_bucket):<5} "
+          f"recall={recall:.4f} (min {runs[:, 0].min():.4f} over {seeds} seeds)  "
+          f"candidates={candidates:.1%} skipped buckets={skipped:.1f}  "
+          f"time={elapsed * 1000:.1f}ms ({elapsed / max(exact_time, 1e-9):.2f}x exact)")
+    return recall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=INPUT_PATH, help="products JSON (same format as products.json)")
+    parser.add_argument("--exact", default=OUTPUT_PATH, help="similar_products.json of the same products")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS)
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--max-bucket", type=int, default=DEFAULT_MAX_BUCKET, help="0 = keep all buckets")
+    parser.add_argument("--seeds", type=int, default=10)
+    parser.add_argument("--sweep", action="store_true", help="report a few (bands, rows, max_bucket) settings")
+    args = parser.parse_args()
+
+    products = load_products(args.input)
+    ids = [p.get("id") for p in products]
+    corpus, _ = build_corpus_and_tokens(products)
+    X = TfidfVectorizer().fit_transform(corpus).tocsr()
+    exact = exact_lists(args.exact)
+    exact_time = exact_seconds(X, SIM_THRESHOLD)
+    links = sum(len(v) for v in exact.values()) // 2
+    print(f"Products: {len(ids)}, stored links (>= {SIM_THRESHOLD}): {links}, "
+          f"exact time={exact_time * 1000:.1f}ms")
+    settings = SWEEP if args.sweep else [(args.bands, args.rows, args.max_bucket or None)]
+    for bands, rows, max_bucket in settings:
+        report(ids, X, exact, exact_time, bands, rows, max_bucket, args.seeds)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,48 +4,32 @@ find_similar_with_hazm.py
 - از Hazm برای نرمال‌سازی و توکنایز استفاده می‌کند
 - سپس TF-IDF و شباهت کسینوسی را محاسبه می‌کند
 - خروجی: similar_products.json (شامل توکن‌ها و مشابه‌ها)
+- با --ann همسایه‌ها از ایندکس تقریبی recommendation/ann.py می‌آیند (recall: ann_recall.py)
 """
 
-import json, os, re
+import json, os, sys
 from datetime import datetime
 from typing import List, Dict
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
-# Hazm
-from hazm import Normalizer, word_tokenize, Stemmer
-
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # مسیر پوشه فعلی اسکریپت
 INPUT_PATH = os.path.join(BASE_DIR, "products.json")
 OUTPUT_PATH = os.path.join(BASE_DIR, "similar_products.json")
 SIM_THRESHOLD = 0.4
 
-# ---------- Hazm setup ----------
-normalizer = Normalizer()
-stemmer = Stemmer()
+# Hazm (ماژول مشترک پروژه: regexهای از پیش کامپایل‌شده + کش stem)
+sys.path.insert(0, os.path.dirname(BASE_DIR))
+from recommendation.text_processing import normalize_text, tokenize, tokenize_many
 
 # ---------- نرمال‌سازی با Hazm ----------
 def normalize_persian_hazm(text: str) -> str:
-    if not text:
-        return ""
-    s = str(text)
-    s = normalizer.normalize(s)   # حذف فاصله‌های اضافی، تبدیل ي->ی و ... (Hazm)
-    # در صورت نیاز می‌توانیم نگارشی اضافی را حذف کنیم:
-    s = re.sub(r"[^\w\s\u0600-\u06FF]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return normalize_text(text)
 
 # ---------- توکنایز با Hazm + (اختیاری) استمینگ ----------
 def tokenize_hazm(text: str, do_stem: bool = True) -> List[str]:
-    s = normalize_persian_hazm(text)
-    if not s:
-        return []
-    toks = word_tokenize(s)  # توکنایزر لغت Hazm
-    if do_stem:
-        toks = [stemmer.stem(t) for t in toks if t.strip() != ""]
-    # حذف توکن‌های خیلی کوتاه یا stopwords در صورت نیاز می‌تواند اینجا انجام شود
-    return toks
+    return tokenize(text, do_stem=do_stem)
 
 # ---------- بارگذاری ----------
 def load_products(path: str) -> List[Dict]:
@@ -73,8 +57,8 @@ def build_corpus_and_tokens(products: List[Dict]) -> (List[str], Dict[int, Dict]
         for lf in list_fields:
             val = p.get(lf, []) or []
             lf_tokens = []
-            for item in val:
-                lf_tokens += tokenize_hazm(item, do_stem=True)
+            for item_tokens in tokenize_many(val):
+                lf_tokens += item_tokens
             prop_tokens[lf] = lf_tokens
             pieces.extend(lf_tokens)
 
@@ -116,14 +100,29 @@ def save_output(output_path: str, tokens_map: Dict[int, Dict], similar_map: Dict
         json.dump(out, f, ensure_ascii=False, indent=2)
     print("Saved:", output_path)
 
+# ---------- همسایه‌های تقریبی (MinHash LSH، بدون ماتریس n x n) ----------
+def find_similars_approximate(products: List[Dict], corpus: List[str], threshold: float):
+    from recommendation.ann import approximate_similarities
+    X = TfidfVectorizer().fit_transform(corpus)
+    neighbours = approximate_similarities(X, threshold)
+    idx_to_id = [p.get("id") for p in products]
+    result = {}
+    for i, pid in enumerate(idx_to_id):
+        row = neighbours.indices[neighbours.indptr[i]:neighbours.indptr[i + 1]]
+        result[pid] = sorted((idx_to_id[j] for j in row if j != i), reverse=True)
+    return result
+
 def main():
     if not os.path.exists(INPUT_PATH):
         raise FileNotFoundError(f"Input file not found: {INPUT_PATH}")
     products = load_products(INPUT_PATH)
     print("Loaded products:", len(products))
     corpus, tokens_map = build_corpus_and_tokens(products)
-    sim_matrix = compute_similarity(corpus)
-    similar_map = find_similars(products, sim_matrix, SIM_THRESHOLD)
+    if "--ann" in sys.argv[1:]:
+        similar_map = find_similars_approximate(products, corpus, SIM_THRESHOLD)
+    else:
+        sim_matrix = compute_similarity(corpus)
+        similar_map = find_similars(products, sim_matrix, SIM_THRESHOLD)
     save_output(OUTPUT_PATH, tokens_map, similar_map)
     total_pairs = sum(len(v) for v in similar_map.values())
     print(f"Total similar links (>= {SIM_THRESHOLD}): {total_pairs}")
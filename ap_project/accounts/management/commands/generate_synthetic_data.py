@@ -0,0 +1,54 @@
+"""
+
+cd ap_project
+python manage.py generate_synthetic_data --products 10000 --users 100000 --seed 1
+python manage.py generate_synthetic_data --products 1000 --users 500 --visits-per-user 50
+
+کاربران: syn000000, syn000001, ... با رمز testpass
+
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.synthetic import SyntheticScale, generate_synthetic_data
+
+
+class Command(BaseCommand):
+    help = "Insert a seeded synthetic catalog with profiles, visits, favorites, comments and orders"
+
+    def add_arguments(self, parser):
+        defaults = SyntheticScale()
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--visits-per-user', type=int, default=defaults.visits_per_user, help="Average")
+        parser.add_argument('--favorites-per-user', type=int, default=defaults.favorites_per_user, help="Average")
+        parser.add_argument('--comments-per-product', type=int, default=defaults.comments_per_product, help="Average")
+        parser.add_argument('--orders-per-user', type=int, default=defaults.orders_per_user, help="Average")
+        parser.add_argument('--items-per-order', type=int, default=defaults.items_per_order, help="Average")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='syn', help="Username prefix")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        scale = SyntheticScale(
+            products=options['products'],
+            users=options['users'],
+            visits_per_user=options['visits_per_user'],
+            favorites_per_user=options['favorites_per_user'],
+            comments_per_product=options['comments_per_product'],
+            orders_per_user=options['orders_per_user'],
+            items_per_order=options['items_per_order'],
+        )
+        if scale.products < 1 or scale.users < 0:
+            raise CommandError("--products must be >= 1 and --users >= 0")
+        from django.contrib.auth import get_user_model
+        if get_user_model().objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users with prefix {options['prefix']!r} already exist; use another --prefix")
+        started = time.perf_counter()
+        counts = generate_synthetic_data(scale, seed=options['seed'], batch_size=options['batch_size'],
+                                         prefix=options['prefix'], log=self.stdout.write)
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Synthetic data {scale.label} (seed {options['seed']}): {summary} in {time.perf_counter() - started:.1f}s"
+        ))
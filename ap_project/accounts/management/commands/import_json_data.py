@@ -9,6 +9,9 @@ python manage.py migrate
 python manage.py import_json_data
 python manage.py populate_seasonal_keywords
 
+حالت bulk برای فیدهای بزرگ محصولات (stream + توکن‌سازی موازی + bulk_create):
+python manage.py import_json_data --bulk --products path/to/products.json --batch-size 2000 --workers 4
+
 needs reconnect in my sql
 
 username='u1', password='testpass'
@@ -21,13 +24,259 @@ import os
 import json
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from products.models import Product
-from accounts.models import Profile
+from products.models import Product, normalize_category
+from accounts.models import Profile, ProductVisit, parse_visit_time
 from orders.models import Order, OrderItem
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.db import transaction
+from django.db.models import Max
+
+
+# ---------------- حالت bulk ----------------
+
+_PRODUCTS_KEY_RE = re.compile(r'"products"\s*:\s*\[')
+
+
+def iter_json_products(path, chunk_size=1 << 16):
+    """
+    محصولات را یکی‌یکی از فایل می‌خواند بدون بارگذاری کل فایل در حافظه.
+    قالب‌ها: {"products": [...]}، یک لیست JSON در سطح اول، یا JSON Lines (.jsonl)
+    """
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size)
+        eof = not buf
+        # پیدا کردن شروع آرایه محصولات
+        while True:
+            stripped = buf.lstrip()
+            if stripped.startswith('['):
+                pos = len(buf) - len(stripped) + 1
+                break
+            m = _PRODUCTS_KEY_RE.search(buf)
+            if m:
+                pos = m.end()
+                break
+            if eof:
+                raise ValueError(f"No products array found in {path}")
+            more = f.read(chunk_size)
+            eof = not more
+            buf += more
+
+        while True:
+            # رد کردن فاصله و کاما
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"Unexpected end of file in {path}")
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield obj
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+
+def tokenize_product_payload(pdata):
+    # همان pipeline نرمال‌ساز/استمر Hazm در update_product_and_similarity (در پروسه‌های worker اجرا می‌شود)
+    from accounts.management.commands.update_product_and_similarity import build_tokens_from_payload
+    tokens_dict, _ = build_tokens_from_payload(pdata)
+    return tokens_dict
+
+
+def _concerns_targeted(suitable_for):
+    if not suitable_for:
+        return ''
+    if isinstance(suitable_for, list):
+        return ', '.join([str(c) for c in suitable_for])
+    return str(suitable_for)
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else float('inf')
+
+
+def bulk_import(command, profile, products_path, purchases, batch_size=1000, workers=None):
+    """
+    1) stream محصولات، 2) توکن‌سازی در process pool، 3) bulk_create دسته‌ای در تراکنش‌های جدا
+    4) محاسبه similar_products برای کل کاتالوگ (محصولات قبلی هم) در یک پاس برداری و bulk_update
+    """
+    from products.models import Comment
+    from recommendation.catalog import build_catalog_model, replace_catalog_model, SIM_THRESHOLD
+    from recommendation.cache import bump_catalog_version, bump_user_version
+    from store.autocomplete import invalidate_prefix_trie
+    from store.search_index import invalidate_search_index
+    from store.seasonal import mark_seasonal_rankings_stale
+
+    out = command.stdout
+    started = time.perf_counter()
+    # شناسه‌ها را خودمان می‌دهیم چون bulk_create در MySQL شناسه برنمی‌گرداند
+    next_pid = (Product.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+    feed_to_pid = {}
+    visits = []
+    favorite_ids = []
+    n_products = n_comments = 0
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for batch in _batches(iter_json_products(products_path), batch_size):
+            if executor is not None:
+                chunksize = max(1, len(batch) // (workers * 4))
+                tokens_list = list(executor.map(tokenize_product_payload, batch, chunksize=chunksize))
+            else:
+                tokens_list = [tokenize_product_payload(pdata) for pdata in batch]
+
+            products, comments = [], []
+            for pdata, tokens_dict in zip(batch, tokens_list):
+                pid = next_pid
+                next_pid += 1
+                feed_to_pid[pdata.get('id', pid)] = pid
+                suitable_for = pdata.get('suitable_for', [])
+                rating = max(1, min(5, int(round(float(pdata.get('rating', 3))))))
+                products.append(Product(
+                    id=pid,
+                    name=pdata.get('name', ''),
+                    brand=pdata.get('brand', ''),
+                    category=pdata.get('category', ''),
+                    category_key=normalize_category(pdata.get('category', '')),
+                    description=pdata.get('description', ''),
+                    skin_type=pdata.get('skin_type', ''),
+                    suitable_for=suitable_for,
+                    concerns_targeted=_concerns_targeted(suitable_for),
+                    tags=pdata.get('tags', []),
+                    price=pdata.get('price', 0),
+                    stock=pdata.get('stock', 0),
+                    products_tokens=tokens_dict,
+                    similar_products=[],
+                    similarity_threshold=SIM_THRESHOLD,
+                    # bulk_create سیگنال Comment را اجرا نمی‌کند؛ ستون‌های امتیاز همین‌جا پر می‌شوند
+                    rating_sum=rating,
+                    rating_count=1,
+                    avg_rating=float(rating),
+                ))
+                comments.append(Comment(product_id=pid, user=profile, text='امتیاز کاربر اولیه', rating=rating))
+                for visit_time in pdata.get('visit_times', []):
+                    visited_at = parse_visit_time(visit_time)
+                    if visited_at is not None:
+                        visits.append(ProductVisit(user_id=profile.id, product_id=pid, visited_at=visited_at))
+                if pdata.get('is_favorite'):
+                    favorite_ids.append(pid)
+
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=batch_size)
+                Comment.objects.bulk_create(comments, batch_size=batch_size)
+            n_products += len(products)
+            n_comments += len(comments)
+            elapsed = time.perf_counter() - started
+            out.write(f"  {n_products} products inserted ({_rate(n_products, elapsed):.0f} rows/sec)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    insert_seconds = time.perf_counter() - started
+
+    with transaction.atomic():
+        profile.save()
+        ProductVisit.objects.bulk_create(visits, batch_size=batch_size)
+        Favorite = Profile.favorites.through
+        Favorite.objects.bulk_create(
+            [Favorite(profile_id=profile.id, product_id=pid) for pid in favorite_ids], batch_size=batch_size)
+    # bulk_create سیگنال post_save ندارد
+    bump_user_version(profile.user.username)
+
+    # خریدها
+    user = profile.user
+    next_order_id = (Order.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+    orders, items = [], []
+    prices = dict(Product.objects.filter(id__in=[feed_to_pid[p['productId']] for p in purchases if p.get('productId') in feed_to_pid])
+                  .values_list('id', 'price'))
+    for p in purchases:
+        pid = feed_to_pid.get(p.get('productId'))
+        if pid is None:
+            continue
+        orders.append(Order(id=next_order_id, user=user))
+        items.append(OrderItem(order_id=next_order_id, product_id=pid, quantity=p['quantity'], price=prices.get(pid, 0), date=p['date']))
+        next_order_id += 1
+    with transaction.atomic():
+        Order.objects.bulk_create(orders, batch_size=batch_size)
+        OrderItem.objects.bulk_create(items, batch_size=batch_size)
+
+    # شباهت‌ها در یک پاس برداری روی کل کاتالوگ؛ محصولات قبلی هم همسایه‌های جدید می‌گیرند
+    sim_started = time.perf_counter()
+    model = build_catalog_model()
+    neighbours = model.neighbours
+    updates = []
+    n_links = 0
+    for idx, pid in enumerate(model.ids):
+        row = neighbours.indices[neighbours.indptr[idx]:neighbours.indptr[idx + 1]]
+        similar_ids = sorted((model.ids[j] for j in row if j != idx), reverse=True)
+        n_links += len(similar_ids)
+        updates.append(Product(id=pid, similar_products=similar_ids, similarity_threshold=model.threshold))
+    for chunk in _batches(updates, batch_size):
+        with transaction.atomic():
+            Product.objects.bulk_update(chunk, ['similar_products', 'similarity_threshold'], batch_size=batch_size)
+    replace_catalog_model(model)
+    bump_catalog_version()
+    invalidate_search_index()
+    invalidate_prefix_trie()
+    mark_seasonal_rankings_stale()
+    sim_seconds = time.perf_counter() - sim_started
+
+    total_rows = n_products + n_comments + len(favorite_ids) + len(orders) + len(items)
+    total_seconds = time.perf_counter() - started
+    out.write(f"Products: {n_products} in {insert_seconds:.2f}s ({_rate(n_products, insert_seconds):.0f} rows/sec, "
+              f"{workers} tokenizer process{'es' if workers > 1 else ''})")
+    out.write(f"Similarity: {n_links} links in {sim_seconds:.2f}s")
+    out.write(f"Total: {total_rows} rows in {total_seconds:.2f}s ({_rate(total_rows, total_seconds):.0f} rows/sec)")
 
 class Command(BaseCommand):
     help = "Import products, purchases, and user data from JSON files"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true',
+                            help="Stream the products feed, tokenize in a process pool and insert with bulk_create")
+        parser.add_argument('--products', default=None,
+                            help="Products feed ({\"products\": [...]}, a JSON list or .jsonl); default Test/products.json")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None, help="Tokenizer processes (default: CPU count)")
+
     def handle(self, *args, **kwargs):
         # 1. حذف دیتابیس
         db_path = os.path.join(settings.BASE_DIR, 'db.sqlite3')
@@ -47,7 +296,7 @@ class Command(BaseCommand):
         BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
         # ساختن مسیرهای نسبی
-        products_data = load_json(os.path.join(BASE_DIR, "Test", "products.json"))["products"]
+        products_path = kwargs.get('products') or os.path.join(BASE_DIR, "Test", "products.json")
         user_prefs = load_json(os.path.join(BASE_DIR, "Test", "user_preferences.json"))
         keywords = load_json(os.path.join(BASE_DIR, "Test", "keywords.json"))
         purchases = load_json(os.path.join(BASE_DIR, "Test", "purchases.json"))
@@ -67,13 +316,13 @@ class Command(BaseCommand):
             profile.user_preferences = user_prefs
         if keywords:
             profile.keywords = keywords
-        # مقداردهی visited_items با قالب صحیح
-        visited_items = []
-        for pdata in products_data:
-            pid = pdata.get('id')
-            for visit_time in pdata.get('visit_times', []):
-                visited_items.append({"product_id": pid, "visit_time": visit_time})
-        profile.visited_items = visited_items
+
+        if kwargs.get('bulk'):
+            bulk_import(self, profile, products_path, purchases,
+                        batch_size=kwargs.get('batch_size') or 1000, workers=kwargs.get('workers'))
+            return
+
+        products_data = load_json(products_path)["products"]
         profile.save()
 
         # 4. افزودن محصولات
@@ -127,6 +376,12 @@ class Command(BaseCommand):
             # ثبت علاقه‌مندی‌ها
             if pdata.get('is_favorite'):
                 profile.favorites.add(product)
+            # بازدیدها
+            ProductVisit.objects.bulk_create([
+                ProductVisit(user=profile, product=product, visited_at=visited_at)
+                for visited_at in map(parse_visit_time, pdata.get('visit_times', []))
+                if visited_at is not None
+            ])
 
         # 5. افزودن خریدها
         for p in purchases:
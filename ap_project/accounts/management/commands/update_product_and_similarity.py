@@ -32,40 +32,30 @@
 
 cd ap_project
 python manage.py update_product_and_similarity
+python manage.py update_product_and_similarity --incremental
+
+--incremental: محصول جدید/ویرایش‌شده فقط با catalog model ذخیره‌شده مقایسه می‌شود
+(یک سطر sparse ضربدر ماتریس)، بدون fit دوباره TF-IDF روی کل corpus.
+واژه‌های جدیدی که در vocabulary نیستند تا build_catalog_model بعدی نادیده گرفته می‌شوند.
 
 """
 
 from django.core.management.base import BaseCommand
-import json, os, re
-from hazm import Normalizer, word_tokenize, Stemmer
+import json, os
 from django.db import transaction
 from datetime import datetime
+from recommendation.text_processing import normalize_text, tokenize, tokenize_many
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # مسیر پوشه فعلی اسکریپت
 INPUT_PATH = os.path.join(BASE_DIR, "new_or_edit_product.json")
 
 SIM_THRESHOLD = 0.4
 
-normalizer = Normalizer()
-stemmer = Stemmer()
-
 def normalize_persian_hazm(text):
-    if not text:
-        return ""
-    s = str(text)
-    s = normalizer.normalize(s)
-    s = re.sub(r"[^\w\s\u0600-\u06FF]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return normalize_text(text)
 
 def tokenize_hazm(text, do_stem=True):
-    s = normalize_persian_hazm(text)
-    if not s:
-        return []
-    toks = word_tokenize(s)
-    if do_stem:
-        toks = [stemmer.stem(t) for t in toks if t.strip() != ""]
-    return toks
+    return tokenize(text, do_stem=do_stem)
 
 def build_tokens_from_payload(product_dict):
     """مثل اسکریپت آفلاین: خروجی dict prop_tokens و string مرکب"""
@@ -81,8 +71,8 @@ def build_tokens_from_payload(product_dict):
     for lf in list_fields:
         val = product_dict.get(lf, []) or []
         lf_tokens = []
-        for item in val:
-            lf_tokens += tokenize_hazm(item, do_stem=True)
+        for item_tokens in tokenize_many(val):
+            lf_tokens += item_tokens
         prop_tokens[lf] = lf_tokens
         pieces.extend(lf_tokens)
     combined_tokens = list(dict.fromkeys(pieces))
@@ -132,20 +122,48 @@ def build_tokens_from_model_obj(p):
 def compute_similarities_for_corpus(corpus):
     """
     corpus: list[str] (هر عضو یک سندِ محصول)
-    خروجی: ماتریس شباهت (n x n) با استفاده از TF-IDF و cosine
+    خروجی: ماتریس شباهت sparse (n x n، CSR) با TF-IDF و cosine؛ فقط مقادیر >= SIM_THRESHOLD
+    به صورت بلوکی ساخته می‌شود و حافظه به اندازه بلوک است نه n x n
     """
     from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    from recommendation.catalog import thresholded_similarities
     if not corpus:
         return []
     vectorizer = TfidfVectorizer()
     X = vectorizer.fit_transform(corpus)
-    sim_matrix = cosine_similarity(X, X)
-    return sim_matrix
+    return thresholded_similarities(X, SIM_THRESHOLD)
+
+
+def similarity_row(sim_matrix, idx):
+    """Dense row idx of the sparse similarity matrix"""
+    return sim_matrix[idx].toarray().ravel()
+
+def product_field_values(product_data, tokens_dict, similar_ids):
+    return {
+        "name": product_data.get('name', ''),
+        "brand": product_data.get('brand', ''),
+        "category": product_data.get('category', ''),
+        "description": product_data.get('description', ''),
+        "skin_type": product_data.get('skin_type', []),
+        "suitable_for": product_data.get('suitable_for', []),
+        "concerns_targeted": ", ".join(product_data.get('suitable_for', [])) if product_data.get('suitable_for') else '',
+        "tags": product_data.get('tags', []),
+        "price": product_data.get('price', 0),
+        "stock": product_data.get('stock', 0),
+        "products_tokens": tokens_dict,
+        "similar_products": similar_ids,
+        "similarity_threshold": SIM_THRESHOLD,
+    }
 
 class Command(BaseCommand):
     help = "Add or edit a product and update similarity relations (TF-IDF on full corpus like offline script)"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help="Score the product against the persisted catalog model instead of refitting TF-IDF on the whole corpus",
+        )
+
     def handle(self, *args, **kwargs):
         if not os.path.exists(INPUT_PATH):
             self.stdout.write(self.style.ERROR(f"Input file not found: {INPUT_PATH}"))
@@ -156,6 +174,8 @@ class Command(BaseCommand):
 
         action = payload.get("action", "new")
         product_data = payload.get("product", {})
+        if kwargs.get('incremental'):
+            return self.handle_incremental(action, product_data)
         from products.models import Product
 
         # 1) جمع‌آوری همهٔ محصولات موجود و ساخت corpus اولیه (از tokens یا با تولید on-the-fly)
@@ -195,7 +215,7 @@ class Command(BaseCommand):
             sim_matrix = compute_similarities_for_corpus(corpus)
             # find similar ids for edited product
             target_idx = id_to_index[edit_id]
-            sims = sim_matrix[target_idx]
+            sims = similarity_row(sim_matrix, target_idx)
             similar_ids = [all_ids[j] for j in range(len(all_ids)) if j != target_idx and sims[j] >= SIM_THRESHOLD]
             self.stdout.write(f"DEBUG: similar_ids for edited product {edit_id}: {similar_ids}")
         else:
@@ -206,7 +226,7 @@ class Command(BaseCommand):
             sim_matrix = compute_similarities_for_corpus(corpus)
             # sims between new (index 0) and others (1..)
             if len(corpus) >= 2:
-                sims = sim_matrix[0]  # row 0
+                sims = similarity_row(sim_matrix, 0)  # row 0
                 similar_ids = [all_ids[i-1] for i in range(1, len(corpus)) if sims[i] >= SIM_THRESHOLD]
             else:
                 similar_ids = []
@@ -216,21 +236,7 @@ class Command(BaseCommand):
         with transaction.atomic():
             if action == "new":
                 # create, then use actual prod_obj.id
-                prod_obj = Product.objects.create(
-                    name=product_data.get('name', ''),
-                    brand=product_data.get('brand', ''),
-                    category=product_data.get('category', ''),
-                    description=product_data.get('description', ''),
-                    skin_type=product_data.get('skin_type', []),
-                    suitable_for=product_data.get('suitable_for', []),
-                    concerns_targeted=", ".join(product_data.get('suitable_for', [])) if product_data.get('suitable_for') else '',
-                    tags=product_data.get('tags', []),
-                    price=product_data.get('price', 0),
-                    stock=product_data.get('stock', 0),
-                    products_tokens=new_tokens_dict,
-                    similar_products=similar_ids,
-                    similarity_threshold=SIM_THRESHOLD,
-                )
+                prod_obj = Product.objects.create(**product_field_values(product_data, new_tokens_dict, similar_ids))
                 new_id = prod_obj.id
                 self.stdout.write(self.style.SUCCESS(f"Created product id={new_id}"))
                 # حالا برو و برای هر محصول موجود در corpus بررسی کن که آیا new_id باید در لیست مشابه‌ها باشد
@@ -262,19 +268,8 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.ERROR(f"Product id={edit_id} not found."))
                     return
                 # update fields & tokens & similar_products
-                prod_obj.name = product_data.get('name', '')
-                prod_obj.brand = product_data.get('brand', '')
-                prod_obj.category = product_data.get('category', '')
-                prod_obj.description = product_data.get('description', '')
-                prod_obj.skin_type = product_data.get('skin_type', [])
-                prod_obj.suitable_for = product_data.get('suitable_for', [])
-                prod_obj.concerns_targeted = ", ".join(product_data.get('suitable_for', [])) if product_data.get('suitable_for') else ''
-                prod_obj.tags = product_data.get('tags', [])
-                prod_obj.price = product_data.get('price', 0)
-                prod_obj.stock = product_data.get('stock', 0)
-                prod_obj.products_tokens = new_tokens_dict
-                prod_obj.similarity_threshold = SIM_THRESHOLD
-                prod_obj.similar_products = similar_ids
+                for field, value in product_field_values(product_data, new_tokens_dict, similar_ids).items():
+                    setattr(prod_obj, field, value)
                 prod_obj.save()
                 self.stdout.write(self.style.SUCCESS(f"Edited product id={edit_id} and set similar_products to {similar_ids}"))
 
@@ -305,4 +300,71 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f"Unknown action: {action}"))
                 return
 
-        self.stdout.write(self.style.SUCCESS(f"Done at {datetime.utcnow().isoformat()}"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Done at {datetime.utcnow().isoformat()}"))
+
+    def handle_incremental(self, action, product_data):
+        """
+        یک سطر sparse (محصول جدید/ویرایش‌شده) در ماتریس catalog model ضرب می‌شود: O(n)
+        و لیست همسایه‌های بقیه محصولات با یک bulk_update اصلاح می‌شود.
+        """
+        from products.models import Product
+        from recommendation.catalog import get_catalog_model, transform_document, upsert_product, replace_catalog_model, forbidden_check_tokens
+
+        if action not in ("new", "edit"):
+            self.stdout.write(self.style.ERROR(f"Unknown action: {action}"))
+            return
+        edit_id = product_data.get("id")
+        if action == "edit":
+            if edit_id is None:
+                self.stdout.write(self.style.ERROR("Edit action but no 'id' provided"))
+                return
+            if not Product.objects.filter(id=edit_id).exists():
+                self.stdout.write(self.style.ERROR(f"Product id={edit_id} not found."))
+                return
+
+        model = get_catalog_model()
+        new_tokens_dict, new_vec = build_tokens_from_payload(product_data)
+        row, sims = transform_document(model, new_vec)
+        self_idx = model.id_to_idx.get(edit_id) if action == "edit" else None
+        similar_ids = [model.ids[j] for j in range(model.n) if j != self_idx and sims[j] >= SIM_THRESHOLD]
+        self.stdout.write(f"DEBUG: similar_ids for product {edit_id if action == 'edit' else '(new)'}: {similar_ids}")
+
+        with transaction.atomic():
+            fields = product_field_values(product_data, new_tokens_dict, similar_ids)
+            if action == "new":
+                prod_obj = Product.objects.create(**fields)
+                old_neighbour_ids = set()
+                self.stdout.write(self.style.SUCCESS(f"Created product id={prod_obj.id}"))
+            else:
+                prod_obj = Product.objects.select_for_update().get(id=edit_id)
+                for field, value in fields.items():
+                    setattr(prod_obj, field, value)
+                prod_obj.save()
+                old_idx = model.id_to_idx.get(edit_id)
+                old_neighbour_ids = {model.ids[j] for j in model.neighbour_row(old_idx)[0]} if old_idx is not None else set()
+                self.stdout.write(self.style.SUCCESS(f"Edited product id={edit_id} and set similar_products to {similar_ids}"))
+            pid = prod_obj.id
+
+            # فقط محصولاتی که ممکن است لیستشان تغییر کند خوانده می‌شوند
+            new_neighbour_ids = set(similar_ids)
+            candidate_ids = (old_neighbour_ids | new_neighbour_ids) - {pid}
+            changed = []
+            for other in Product.objects.select_for_update().filter(id__in=candidate_ids).only('id', 'similar_products'):
+                lst = list(other.similar_products or [])
+                if other.id in new_neighbour_ids and pid not in lst:
+                    lst.append(pid)
+                elif other.id not in new_neighbour_ids and pid in lst:
+                    lst.remove(pid)
+                else:
+                    continue
+                other.similar_products = lst
+                changed.append(other)
+            Product.objects.bulk_update(changed, ['similar_products'], batch_size=500)
+
+        forbidden_tokens = forbidden_check_tokens({**product_data, 'products_tokens': new_tokens_dict})
+        updated_model = upsert_product(model, pid, row, sims, forbidden_tokens)
+        replace_catalog_model(updated_model)
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated similar_products of {len(changed)} products; catalog model now has {updated_model.n} products"
+        ))
+        self.stdout.write(self.style.SUCCESS(f"Done at {datetime.utcnow().isoformat()}"))
@@ -0,0 +1,74 @@
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import datetime, timezone as dt_timezone
+from django.db import migrations, models
+
+VISIT_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _parse_visit_time(value):
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    return dt
+
+
+def copy_visited_items(apps, schema_editor):
+    """Profile.visited_items (JSON) -> ProductVisit rows"""
+    Profile = apps.get_model('accounts', 'Profile')
+    Product = apps.get_model('products', 'Product')
+    ProductVisit = apps.get_model('accounts', 'ProductVisit')
+    product_ids = set(Product.objects.values_list('id', flat=True))
+    for profile in Profile.objects.exclude(visited_items__isnull=True).only('id', 'visited_items').iterator():
+        visits = []
+        for item in profile.visited_items or []:
+            if not isinstance(item, dict):
+                continue
+            pid = item.get('product_id')
+            visited_at = _parse_visit_time(item.get('visit_time'))
+            if pid in product_ids and visited_at is not None:
+                visits.append(ProductVisit(user_id=profile.id, product_id=pid, visited_at=visited_at))
+        ProductVisit.objects.bulk_create(visits, batch_size=1000)
+
+
+def copy_visits_back(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    ProductVisit = apps.get_model('accounts', 'ProductVisit')
+    for profile in Profile.objects.all().iterator():
+        rows = ProductVisit.objects.filter(user_id=profile.id).order_by('visited_at', 'id').values_list('product_id', 'visited_at')
+        profile.visited_items = [
+            {'product_id': pid, 'visit_time': visited_at.astimezone(dt_timezone.utc).strftime(VISIT_TIME_FORMAT)}
+            for pid, visited_at in rows
+        ]
+        profile.save(update_fields=['visited_items'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_remove_profile_concerns_remove_profile_preferences'),
+        ('products', '0012_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visited_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visits', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visits', to='accounts.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'visited_at'], name='visit_user_time_idx')],
+            },
+        ),
+        migrations.RunPython(copy_visited_items, copy_visits_back),
+        migrations.RemoveField(
+            model_name='profile',
+            name='visited_items',
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_productvisit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='visits_cleared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
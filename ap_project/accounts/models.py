@@ -4,8 +4,28 @@ from django.db import models
 from products.models import Product
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
 User = get_user_model()
 
+# قالب زمان بازدید در خروجی‌ها (UTC، مثل visited_items قبلی)
+VISIT_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def format_visit_time(dt):
+    return dt.astimezone(dt_timezone.utc).strftime(VISIT_TIME_FORMAT)
+
+
+def parse_visit_time(value):
+    """رشته ISO (بدون tz یعنی UTC) -> datetime آگاه؛ در صورت خطا None"""
+    try:
+        dt = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=dt_timezone.utc)
+    return dt
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -20,8 +40,26 @@ class Profile(models.Model):
     favorites = models.ManyToManyField(Product, blank=True, related_name='favorited_by')
     keywords = models.JSONField(blank=True, null=True, default=dict) 
     user_preferences = models.JSONField(blank=True, null=True, default=dict)
-    visited_items = models.JSONField(blank=True, null=True, default=list)  # آیتم‌های بازدیدشده توسط کاربر
+    # زمان آخرین پاک کردن تاریخچه بازدید؛ flush بافر هر پروسه بازدیدهای قبل از آن را نمی‌نویسد
+    visits_cleared_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f'Profile of {self.user.username}'
 
+
+class ProductVisit(models.Model):
+    """یک بازدید از محصول؛ فقط insert می‌شود (جایگزین Profile.visited_items)"""
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='visits')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='visits')
+    visited_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'visited_at'], name='visit_user_time_idx'),
+        ]
+
+    def visit_time(self):
+        return format_visit_time(self.visited_at)
+
+    def __str__(self):
+        return f'{self.user} -> {self.product_id} @ {self.visited_at}'
@@ -0,0 +1,318 @@
+"""
+داده مصنوعی قابل تکرار (seeded) برای سنجش کارایی در مقیاس بالا
+
+generate_synthetic_data() builds a catalog, profiles, visits, favorites,
+comments and orders of a given SyntheticScale from the ~100 products of
+Test/products.json. Every synthetic product mixes two seed products. Its
+tokens are put together from the seeds' Hazm tokens, so the pipeline runs
+once per seed instead of once per row. Product popularity follows a Zipf-like
+curve so that a few products collect most visits and orders. The same seed
+and scale always give the same rows and ids on an empty database.
+
+Rows are written with bulk_create, so the receivers do not run. Rating
+aggregates, category_key and similar_products are filled here, and the
+catalog model, search index and caches are refreshed at the end (see
+import_json_data --bulk).
+"""
+
+import bisect
+import json
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Max, Value, When
+
+from accounts.models import Profile, ProductVisit
+from orders.models import Order, OrderItem
+from products.models import Comment, Product, normalize_category
+
+SYNTHETIC_PASSWORD = 'testpass'
+# تاریخ‌ها نسبت به همان "اکنون" ثابت امتیازدهی (now_for_decay) ساخته می‌شوند
+HISTORY_END = datetime(2025, 8, 31, 23, 59, 59, tzinfo=dt_timezone.utc)
+HISTORY_DAYS = 240
+POPULARITY_EXPONENT = 0.8
+DATE_UPDATE_BATCH = 500
+NAME_VARIANTS = ['پلاس', 'اکسترا', 'مینی', 'پرو', 'لایت', 'اینتنس', 'سنسیتیو', 'مکس']
+COMMENT_TEXTS = ['عالی بود', 'راضی هستم', 'معمولی بود', 'برای پوست من مناسب نبود', 'دوباره می‌خرم']
+
+
+@dataclass
+class SyntheticScale:
+    products: int = 1000
+    users: int = 1000
+    visits_per_user: int = 20
+    favorites_per_user: int = 3
+    comments_per_product: int = 3
+    orders_per_user: int = 1
+    items_per_order: int = 2
+
+    @property
+    def label(self) -> str:
+        return f"{self.products}x{self.users}"
+
+    @classmethod
+    def parse(cls, text, **densities) -> 'SyntheticScale':
+        """'10000x100000' -> 10k products, 100k users"""
+        try:
+            products, users = (int(part) for part in str(text).lower().split('x'))
+        except ValueError:
+            raise ValueError(f"scale must look like PRODUCTSxUSERS, got {text!r}")
+        return cls(products=products, users=users, **densities)
+
+
+def _default_seed_path():
+    return os.path.join(settings.BASE_DIR, 'Test', 'products.json')
+
+
+def load_seed_products(path=None) -> List[Dict]:
+    from accounts.management.commands.import_json_data import tokenize_product_payload
+    with open(path or _default_seed_path(), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    seeds = data['products'] if isinstance(data, dict) else data
+    for seed in seeds:
+        seed['products_tokens'] = tokenize_product_payload(seed)
+    return seeds
+
+
+def _load_template(name):
+    with open(os.path.join(settings.BASE_DIR, 'Test', name), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _random_time(rnd):
+    return HISTORY_END - timedelta(seconds=rnd.randrange(HISTORY_DAYS * 24 * 3600))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class _Generator:
+    def __init__(self, scale: SyntheticScale, seed=0, batch_size=2000, prefix='syn', seed_products=None, log=None):
+        self.scale = scale
+        self.rnd = random.Random(seed)
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.log = log or (lambda message: None)
+        self.seeds = seed_products if seed_products is not None else load_seed_products()
+        self.counts = {}
+
+    # ---------------- کاربران ----------------
+
+    def users(self):
+        User = get_user_model()
+        rnd, scale = self.rnd, self.scale
+        prefs_template = _load_template('user_preferences.json')
+        keywords_template = _load_template('keywords.json')
+        concerns = sorted({c for s in self.seeds for c in (s.get('suitable_for') or [])})
+        features = sorted({t for s in self.seeds for t in (s.get('tags') or [])})
+        categories = sorted({s.get('category', '') for s in self.seeds})
+        skin_types = [choice for choice, _ in Product.SKIN_TYPE_CHOICES]
+        pool = sorted({tok for s in self.seeds for tok in s['products_tokens'].get('description', []) if len(tok) > 2})
+
+        # یک hash برای همه: PBKDF2 برای هر کاربر ساخت ۱۰۰ هزار کاربر را ساعت‌ها طول می‌دهد
+        password = make_password(SYNTHETIC_PASSWORD)
+        next_user = (User.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        next_profile = (Profile.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        self.user_ids, self.profile_ids, self.usernames = [], [], []
+        for start in range(0, scale.users, self.batch_size):
+            users, profiles = [], []
+            for i in range(start, min(start + self.batch_size, scale.users)):
+                user_id, profile_id = next_user + i, next_profile + i
+                username = f"{self.prefix}{i:06d}"
+                low = rnd.randrange(50_000, 600_000, 10_000)
+                skin_type = rnd.choice(skin_types)
+                prefs = dict(prefs_template,
+                             skin_type=skin_type,
+                             main_concern=rnd.sample(concerns, min(2, len(concerns))),
+                             product_type=rnd.choice(categories),
+                             features=rnd.sample(features, min(3, len(features))),
+                             budget={'min': low, 'max': low + rnd.randrange(100_000, 400_000, 10_000)})
+                keywords = dict(keywords_template,
+                                wishlist_feature=rnd.sample(pool, min(5, len(pool))),
+                                current_products=rnd.sample(pool, min(3, len(pool))))
+                users.append(User(id=user_id, username=username, password=password))
+                profiles.append(Profile(id=profile_id, user_id=user_id, skin_type=skin_type,
+                                        user_preferences=prefs, keywords=keywords))
+                self.user_ids.append(user_id)
+                self.profile_ids.append(profile_id)
+                self.usernames.append(username)
+            with transaction.atomic():
+                User.objects.bulk_create(users, batch_size=self.batch_size)
+                Profile.objects.bulk_create(profiles, batch_size=self.batch_size)
+        self.counts['users'] = scale.users
+        self.log(f"  {scale.users} users")
+
+    # ---------------- محصولات و نظرات ----------------
+
+    def _product(self, pid):
+        rnd = self.rnd
+        a, b = rnd.choice(self.seeds), rnd.choice(self.seeds)
+        extra_tokens = [t for t in b['products_tokens'].get('description', []) if len(t) > 1]
+        extra_tokens = rnd.sample(extra_tokens, min(8, len(extra_tokens)))
+        tokens = {field: list(values) for field, values in a['products_tokens'].items()}
+        tokens['description'] = tokens.get('description', []) + extra_tokens
+        extra_tags = rnd.sample(b.get('tags') or [], min(1, len(b.get('tags') or [])))
+        tags = list(dict.fromkeys((a.get('tags') or []) + extra_tags))
+        suitable_for = a.get('suitable_for') or []
+        category = a.get('category', '')
+        stock = 0 if rnd.random() < 0.05 else rnd.randint(1, 200)
+        return Product(
+            id=pid,
+            name=f"{a['name']} {rnd.choice(NAME_VARIANTS)} {pid}"[:100],
+            brand=rnd.choice(self.seeds).get('brand', ''),
+            category=category,
+            category_key=normalize_category(category),
+            description=f"{a.get('description', '')} {' '.join(extra_tokens)}",
+            skin_type=a.get('skin_type', ''),
+            suitable_for=suitable_for,
+            concerns_targeted=', '.join(str(c) for c in suitable_for),
+            tags=tags,
+            price=int(round(float(a.get('price', 100_000)) * rnd.uniform(0.6, 1.6), -2)),
+            stock=stock,
+            products_tokens=tokens,
+            similar_products=[],
+            similarity_threshold=0.0,
+        ), float(a.get('rating', 3))
+
+    def products(self):
+        rnd, scale = self.rnd, self.scale
+        next_pid = (Product.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        self.product_ids, self.prices, self.in_stock = [], {}, []
+        n_comments = 0
+        for start in range(0, scale.products, self.batch_size):
+            products, comments = [], []
+            for pid in range(next_pid + start, next_pid + min(start + self.batch_size, scale.products)):
+                product, base_rating = self._product(pid)
+                # bulk_create سیگنال Comment را اجرا نمی‌کند؛ ستون‌های امتیاز همین‌جا پر می‌شوند
+                ratings = [max(1, min(5, int(round(rnd.gauss(base_rating, 1.0)))))
+                           for _ in range(rnd.randint(0, 2 * scale.comments_per_product))]
+                if self.profile_ids:
+                    for rating in ratings:
+                        comments.append(Comment(product_id=pid, user_id=rnd.choice(self.profile_ids),
+                                                text=rnd.choice(COMMENT_TEXTS), rating=rating))
+                else:
+                    ratings = []
+                product.rating_sum = sum(ratings)
+                product.rating_count = len(ratings)
+                product.avg_rating = product.rating_sum / len(ratings) if ratings else 0.0
+                products.append(product)
+                self.product_ids.append(pid)
+                self.prices[pid] = product.price
+                if product.stock:
+                    self.in_stock.append(pid)
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=self.batch_size)
+                Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+            n_comments += len(comments)
+        # محبوبیت Zipf مانند: وزن 1/rank^s روی ترتیب تصادفی محصولات
+        ranked = list(self.product_ids)
+        rnd.shuffle(ranked)
+        self.popular = ranked
+        total, self.popularity = 0.0, []
+        for rank in range(len(ranked)):
+            total += 1.0 / (rank + 1) ** POPULARITY_EXPONENT
+            self.popularity.append(total)
+        self.counts.update(products=scale.products, comments=n_comments)
+        self.log(f"  {scale.products} products, {n_comments} comments")
+
+    def _popular_product(self):
+        x = self.rnd.random() * self.popularity[-1]
+        return self.popular[min(bisect.bisect_left(self.popularity, x), len(self.popular) - 1)]
+
+    # ---------------- بازدید، علاقه‌مندی و سفارش ----------------
+
+    def activity(self):
+        rnd, scale = self.rnd, self.scale
+        Favorite = Profile.favorites.through
+        next_order = (Order.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        next_item = (OrderItem.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        n_visits = n_favorites = n_orders = n_items = 0
+        users = list(zip(self.user_ids, self.profile_ids))
+        for batch in _batches(users, self.batch_size):
+            visits, favorites, orders, items, item_dates = [], [], [], [], []
+            for user_id, profile_id in batch:
+                for _ in range(rnd.randint(0, 2 * scale.visits_per_user)):
+                    visits.append(ProductVisit(user_id=profile_id, product_id=self._popular_product(),
+                                               visited_at=_random_time(rnd)))
+                liked = {self._popular_product() for _ in range(rnd.randint(0, 2 * scale.favorites_per_user))}
+                favorites.extend(Favorite(profile_id=profile_id, product_id=pid) for pid in sorted(liked))
+                for _ in range(rnd.randint(0, 2 * scale.orders_per_user)):
+                    orders.append(Order(id=next_order, user_id=user_id))
+                    for _ in range(rnd.randint(1, 2 * scale.items_per_order)):
+                        pid = self._popular_product()
+                        items.append(OrderItem(id=next_item, order_id=next_order, product_id=pid,
+                                               quantity=rnd.randint(1, 3), price=self.prices[pid]))
+                        item_dates.append((next_item, _random_time(rnd)))
+                        next_item += 1
+                    next_order += 1
+            with transaction.atomic():
+                ProductVisit.objects.bulk_create(visits, batch_size=self.batch_size)
+                Favorite.objects.bulk_create(favorites, batch_size=self.batch_size)
+                Order.objects.bulk_create(orders, batch_size=self.batch_size)
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+                # date با auto_now_add پر می‌شود؛ تاریخ خرید روی امتیاز اثر دارد و باید ثابت بماند
+                for chunk in _batches(item_dates, DATE_UPDATE_BATCH):
+                    OrderItem.objects.filter(id__in=[item_id for item_id, _ in chunk]).update(date=Case(
+                        *[When(id=item_id, then=Value(date)) for item_id, date in chunk],
+                        output_field=DateTimeField(),
+                    ))
+            n_visits += len(visits)
+            n_favorites += len(favorites)
+            n_orders += len(orders)
+            n_items += len(items)
+        self.counts.update(visits=n_visits, favorites=n_favorites, orders=n_orders, order_items=n_items)
+        self.log(f"  {n_visits} visits, {n_favorites} favorites, {n_orders} orders ({n_items} items)")
+
+    # ---------------- شباهت‌ها و کش‌ها ----------------
+
+    def finish(self):
+        from recommendation.cache import bump_catalog_version
+        from recommendation.catalog import build_catalog_model, replace_catalog_model
+        from recommendation.models import SeasonalKeyword
+        from store.autocomplete import invalidate_prefix_trie
+        from store.search_index import invalidate_search_index
+        from store.seasonal import mark_seasonal_rankings_stale
+
+        if not SeasonalKeyword.objects.exists():
+            from io import StringIO
+            from django.core.management import call_command
+            call_command('populate_seasonal_keywords', stdout=StringIO())
+
+        model = build_catalog_model()
+        neighbours = model.neighbours
+        updates = []
+        n_links = 0
+        for idx, pid in enumerate(model.ids):
+            row = neighbours.indices[neighbours.indptr[idx]:neighbours.indptr[idx + 1]]
+            similar_ids = sorted((model.ids[j] for j in row if j != idx), reverse=True)
+            n_links += len(similar_ids)
+            updates.append(Product(id=pid, similar_products=similar_ids, similarity_threshold=model.threshold))
+        for chunk in _batches(updates, self.batch_size):
+            with transaction.atomic():
+                Product.objects.bulk_update(chunk, ['similar_products', 'similarity_threshold'], batch_size=self.batch_size)
+        replace_catalog_model(model)
+        bump_catalog_version()
+        invalidate_search_index()
+        invalidate_prefix_trie()
+        mark_seasonal_rankings_stale()
+        self.counts['neighbour_links'] = n_links
+
+
+def generate_synthetic_data(scale: SyntheticScale, seed=0, batch_size=2000, prefix='syn',
+                            seed_products: Optional[List[Dict]] = None, log=None) -> Dict[str, int]:
+    """Insert a synthetic dataset of `scale`; returns row counts per kind"""
+    gen = _Generator(scale, seed=seed, batch_size=batch_size, prefix=prefix, seed_products=seed_products, log=log)
+    gen.users()
+    gen.products()
+    gen.activity()
+    gen.finish()
+    return gen.counts
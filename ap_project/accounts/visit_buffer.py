@@ -0,0 +1,242 @@
+"""
+بافر نوشتن بازدیدهای محصول (write-behind)
+
+add-visited only appends (profile_id, product_id, username, visited_at) to an
+in-memory queue of the worker process. The queue is written with one
+bulk_create when it reaches VISIT_BUFFER_FLUSH_SIZE events, when the oldest
+pending event is VISIT_BUFFER_FLUSH_INTERVAL seconds old (background thread)
+and at interpreter exit. The queue is bounded by VISIT_BUFFER_MAX_SIZE; when it
+is full VISIT_BUFFER_OVERFLOW decides what happens:
+
+    'drop_oldest'  the oldest pending visit is discarded (default)
+    'drop_newest'  the new visit is discarded
+    'flush'        the request thread flushes synchronously
+
+bulk_create does not send post_save, so flush() bumps the recommendation
+cache version of every user it wrote visits for. Tests call flush_visits().
+
+Every worker has its own queue, so reads and clears never flush:
+pending_visits() returns only this process's queued visits of a profile for
+the reader to merge with ProductVisit rows, and clear_visit_history() stores
+Profile.visits_cleared_at. Any worker's flush skips visits at or before that
+cutoff.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'flush')
+
+
+class VisitBuffer:
+    def __init__(self, flush_size=200, flush_interval=5.0, max_size=10000, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.flush_size = max(1, int(flush_size))
+        self.flush_interval = float(flush_interval)
+        self.max_size = max(self.flush_size, int(max_size))
+        self.overflow = overflow
+        self.dropped = 0
+        self._events = deque()
+        self._oldest = None  # monotonic time of the oldest pending event
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._events)
+
+    # ---------------- صف ----------------
+
+    def add(self, profile_id, product_id, username, visited_at=None):
+        """Queue one visit; returns False if it was dropped by the overflow policy"""
+        event = (profile_id, product_id, username, visited_at or timezone.now())
+        self._ensure_thread()
+        flush_now = False
+        with self._lock:
+            if len(self._events) >= self.max_size:
+                if self.overflow == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                if self.overflow == 'drop_oldest':
+                    self._events.popleft()
+                    self.dropped += 1
+                else:
+                    flush_now = True
+            if not self._events:
+                self._oldest = time.monotonic()
+            self._events.append(event)
+            if len(self._events) >= self.flush_size:
+                flush_now = flush_now or self.overflow == 'flush'
+                self._wakeup.set()
+        if flush_now:
+            self.flush()
+        return True
+
+    def discard(self, profile_id):
+        """Drop pending visits of one profile (e.g. before clearing its history)"""
+        with self._lock:
+            self._events = deque(e for e in self._events if e[0] != profile_id)
+            if not self._events:
+                self._oldest = None
+
+    def pending(self, profile_id):
+        """(product_id, visited_at) of this process's queued visits of one profile"""
+        with self._lock:
+            return [(e[1], e[3]) for e in self._events if e[0] == profile_id]
+
+    def _take(self):
+        with self._lock:
+            events, self._events = list(self._events), deque()
+            self._oldest = None
+        return events
+
+    def _requeue(self, events):
+        # نوشتن ناموفق: برگرداندن به ابتدای صف تا سقف max_size
+        with self._lock:
+            room = self.max_size - len(self._events)
+            keep = events[-room:] if room > 0 else []
+            self.dropped += len(events) - len(keep)
+            self._events.extendleft(reversed(keep))
+            if self._events and self._oldest is None:
+                self._oldest = time.monotonic()
+
+    # ---------------- نوشتن در DB ----------------
+
+    def flush(self) -> int:
+        """Write all pending visits with one bulk_create; returns the number of rows written"""
+        from accounts.models import ProductVisit, Profile
+        from products.models import Product
+        from recommendation.cache import bump_user_version
+
+        with self._flush_lock:
+            events = self._take()
+            if not events:
+                return 0
+            try:
+                # محصولی که بین ثبت و flush حذف شده باشد کل batch را با خطای FK رد می‌کند
+                existing = set(Product.objects.filter(id__in={e[1] for e in events}).values_list('id', flat=True))
+                # تاریخچه‌ای که در هر پروسه‌ای پاک شده دوباره نوشته نمی‌شود
+                cleared = dict(Profile.objects.filter(
+                    id__in={e[0] for e in events}, visits_cleared_at__isnull=False,
+                ).values_list('id', 'visits_cleared_at'))
+                events = [e for e in events if e[1] in existing and (e[0] not in cleared or e[3] > cleared[e[0]])]
+                rows = [ProductVisit(user_id=profile_id, product_id=product_id, visited_at=visited_at)
+                        for profile_id, product_id, _, visited_at in events]
+                ProductVisit.objects.bulk_create(rows, batch_size=self.flush_size)
+            except DatabaseError:
+                self._requeue(events)
+                raise
+        for username in {e[2] for e in events}:
+            bump_user_version(username)
+        return len(rows)
+
+    # ---------------- flush زمانی ----------------
+
+    def _ensure_thread(self):
+        # بعد از fork (gunicorn --preload) thread والد در فرزند وجود ندارد
+        if self.flush_interval <= 0:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='visit-buffer-flush', daemon=True)
+            self._thread.start()
+
+    def _due(self):
+        oldest = self._oldest
+        return len(self._events) >= self.flush_size or (
+            oldest is not None and time.monotonic() - oldest >= self.flush_interval)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if not self._due():
+                continue
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("visit buffer flush failed; %d visits pending", len(self))
+            finally:
+                close_old_connections()
+
+
+def buffer_from_settings() -> VisitBuffer:
+    return VisitBuffer(
+        flush_size=getattr(settings, 'VISIT_BUFFER_FLUSH_SIZE', 200),
+        flush_interval=getattr(settings, 'VISIT_BUFFER_FLUSH_INTERVAL', 5.0),
+        max_size=getattr(settings, 'VISIT_BUFFER_MAX_SIZE', 10000),
+        overflow=getattr(settings, 'VISIT_BUFFER_OVERFLOW', 'drop_oldest'),
+    )
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_visit_buffer() -> VisitBuffer:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = buffer_from_settings()
+    return _buffer
+
+
+def record_visit(profile, product_id, visited_at=None) -> bool:
+    return get_visit_buffer().add(profile.pk, product_id, profile.user.username, visited_at)
+
+
+def flush_visits() -> int:
+    """Flush hook for tests, management commands and shutdown"""
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+def discard_pending_visits(profile):
+    if _buffer is not None:
+        _buffer.discard(profile.pk)
+
+
+def pending_visits(profile):
+    """This process's queued visits of `profile`, not yet in ProductVisit"""
+    if _buffer is None:
+        return []
+    return _buffer.pending(profile.pk)
+
+
+def clear_visit_history(profile):
+    """Delete a profile's visits, including those still queued in other workers"""
+    from accounts.models import ProductVisit, Profile
+    from recommendation.cache import bump_user_version
+    cutoff = timezone.now()
+    Profile.objects.filter(pk=profile.pk).update(visits_cleared_at=cutoff)
+    profile.visits_cleared_at = cutoff
+    discard_pending_visits(profile)
+    ProductVisit.objects.filter(user=profile, visited_at__lte=cutoff).delete()
+    bump_user_version(profile.user.username)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush_visits()
+    except Exception:
+        logger.exception("visit buffer flush at exit failed")
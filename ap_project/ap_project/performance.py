@@ -0,0 +1,154 @@
+"""
+اندازه‌گیری کارایی هر درخواست: تعداد و زمان کوئری‌ها، زمان پایتون و spanهای نام‌دار
+
+PerformanceMiddleware wraps every request in a RequestProfile. The profile is
+kept in a ContextVar, so code deep in the call stack can add named spans
+without getting the request passed in:
+
+    with span('tfidf_fit'):
+        X = vectorizer.fit_transform(corpus)
+
+    @span('scoring')
+    def score_all_products(...): ...
+
+Queries are counted with connection.execute_wrapper, so only queries made
+by the request's own thread are counted (not those of the visit buffer
+thread). The totals go out as a Server-Timing header (browser dev tools show
+it under Timing) and as one JSON log line on the `ap_project.performance`
+logger. Queries slower than PERFORMANCE_SLOW_QUERY_MS are logged with the
+view that ran them. Outside a request span() measures nothing and records nothing.
+"""
+
+import json
+import logging
+import time
+from contextlib import ContextDecorator, ExitStack
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['RequestProfile']] = ContextVar('request_profile', default=None)
+
+SQL_PREVIEW_CHARS = 500
+
+
+class RequestProfile:
+    def __init__(self, slow_query_ms=None):
+        self.started = time.perf_counter()
+        self.view = None
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.spans: Dict[str, float] = {}
+        self.slow_query_ms = slow_query_ms
+
+    def add_span(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.sql_ms += ms
+            if self.slow_query_ms is not None and ms >= self.slow_query_ms:
+                logger.warning(json.dumps({
+                    'event': 'slow_query',
+                    'view': self.view,
+                    'alias': context['connection'].alias,
+                    'ms': round(ms, 2),
+                    'sql': str(sql)[:SQL_PREVIEW_CHARS],
+                }, ensure_ascii=False))
+
+    def summary(self) -> Dict:
+        total_ms = (time.perf_counter() - self.started) * 1000
+        return {
+            'total_ms': round(total_ms, 2),
+            'sql_ms': round(self.sql_ms, 2),
+            'python_ms': round(max(0.0, total_ms - self.sql_ms), 2),
+            'queries': self.queries,
+            'spans': {name: round(ms, 2) for name, ms in self.spans.items()},
+        }
+
+
+class span(ContextDecorator):
+    """Time a block (or a function, as a decorator) under `name` in the current request's profile"""
+
+    def __init__(self, name):
+        self.name = name
+        self._started = None
+
+    def _recreate_cm(self):
+        # هر فراخوانی تابع decorate‌شده زمان‌سنج خودش را دارد (بازگشتی/چند thread)
+        return span(self.name)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        profile = _current.get()
+        if profile is not None:
+            profile.add_span(self.name, (time.perf_counter() - self._started) * 1000)
+        return False
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def _view_name(view_func):
+    view = getattr(view_func, 'view_class', view_func)
+    return f"{view.__module__}.{view.__qualname__}"
+
+
+def server_timing(summary: Dict) -> str:
+    parts = [
+        f'total;dur={summary["total_ms"]}',
+        f'db;dur={summary["sql_ms"]};desc="{summary["queries"]} queries"',
+        f'py;dur={summary["python_ms"]}',
+    ]
+    parts += [f'{name};dur={ms}' for name, ms in summary['spans'].items()]
+    return ', '.join(parts)
+
+
+class PerformanceMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_query_ms = getattr(settings, 'PERFORMANCE_SLOW_QUERY_MS', None)
+        self.header = getattr(settings, 'PERFORMANCE_SERVER_TIMING', True)
+
+    def __call__(self, request):
+        profile = RequestProfile(slow_query_ms=self.slow_query_ms)
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        summary = profile.summary()
+        if self.header:
+            response['Server-Timing'] = server_timing(summary)
+        logger.info(json.dumps(dict({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'view': profile.view,
+            'status': response.status_code,
+        }, **summary), ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view = _view_name(view_func)
+        return None
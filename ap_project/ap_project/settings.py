@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # اول از همه تا زمان کل درخواست (شامل بقیه middlewareها) اندازه گرفته شود
+    'ap_project.performance.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -143,6 +145,54 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# مدل TF-IDF کاتالوگ (vocabulary + ماتریس محصولات + لیست همسایه‌ها) برای ریکامندیشن
+RECOMMENDATION_CATALOG_PATH = os.path.join(BASE_DIR, 'recommendation_catalog.pkl')
+# کش پیش‌فرض هر پروسه (LocMem). نسخه‌های باطل‌سازی ریکامندیشن در DB هستند (VersionCounter)، پس
+# نتیجه کهنه با چند worker هم سرو نمی‌شود؛ برای اشتراک خود نتایج بین workerها یک backend مشترک بگذارید:
+# {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'}}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# مدت نگهداری نتایج ریکامندیشن هر کاربر در کش (ثانیه)؛ با تغییر داده‌ها زودتر باطل می‌شود
+RECOMMENDATION_CACHE_TIMEOUT = 60 * 60
+# تعداد پیشنهادهای ذخیره‌شده برای هر کاربر توسط دستور precompute_recommendations
+RECOMMENDATION_PRECOMPUTE_TOP_N = 50
+# همسایه‌های محصولات با ایندکس تقریبی MinHash LSH (recommendation/ann.py) به جای همه جفت‌ها؛ برای کاتالوگ‌های 100k+
+# True یا پارامترها، مثلاً {'bands': 48, 'rows': 2, 'max_bucket': 500}
+RECOMMENDATION_APPROXIMATE_NEIGHBOURS = False
+
+# بافر بازدیدها (accounts.visit_buffer): flush با رسیدن به FLUSH_SIZE یا بعد از FLUSH_INTERVAL ثانیه
+VISIT_BUFFER_FLUSH_SIZE = 200
+VISIT_BUFFER_FLUSH_INTERVAL = 5.0
+# سقف صف در هر پروسه؛ OVERFLOW: 'drop_oldest' | 'drop_newest' | 'flush'
+VISIT_BUFFER_MAX_SIZE = 10000
+VISIT_BUFFER_OVERFLOW = 'drop_oldest'
+
+# حداقل فاصله (ثانیه) بین دو بازسازی خودکار جدول رتبه‌بندی فصلی (در پس‌زمینه، در همه پروسه‌ها) بعد از تغییر کاتالوگ/امتیازها
+SEASONAL_REBUILD_MIN_INTERVAL = 5 * 60
+
+# store.autocomplete: هر چند ثانیه نسخه نام/دسته از DB خوانده شود، و هر چند ثانیه وزن‌های محبوبیت تازه شوند
+AUTOCOMPLETE_VERSION_CHECK_INTERVAL = 2
+AUTOCOMPLETE_REFRESH_INTERVAL = 15 * 60
+
+# ap_project.performance: هدر Server-Timing و لاگ کوئری‌های کندتر از این آستانه (میلی‌ثانیه، None = خاموش)
+PERFORMANCE_SERVER_TIMING = True
+PERFORMANCE_SLOW_QUERY_MS = 200
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # یک خط JSON برای هر درخواست و هر کوئری کند
+        "ap_project.performance": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
@@ -0,0 +1,131 @@
+"""
+ثبت سفارش از سبد خرید در یک تراکنش
+
+The products of the cart are locked with SELECT ... FOR UPDATE (in id order,
+so concurrent checkouts cannot deadlock), stock is decremented for all
+fulfillable lines with one conditional UPDATE, order items are written with
+one bulk_create and only the fulfilled cart lines are removed. Lines without
+enough stock stay in the cart and are returned to the caller.
+
+On databases without row locks the UPDATE's `stock >= qty` condition is
+what prevents overselling. When it loses a race checkout_cart rolls back and
+raises StockConflict, and the view retries once with fresh stock.
+"""
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from django.db import transaction
+from django.db.models import Case, When, F, Q, PositiveIntegerField
+
+from cart.models import Cart, CartItem
+from cart.summary import set_cart_count
+from orders.models import Order, OrderItem
+from products.models import Product
+
+
+class StockConflict(Exception):
+    """Stock changed between reading it and the conditional UPDATE; nothing was written"""
+
+
+@dataclass
+class UnfulfilledLine:
+    item_id: int
+    product_id: int
+    name: str
+    requested: int
+    available: int
+
+    def as_dict(self):
+        return {
+            'item_id': self.item_id,
+            'product_id': self.product_id,
+            'name': self.name,
+            'requested': self.requested,
+            'available': self.available,
+        }
+
+
+@dataclass
+class CheckoutResult:
+    order: Optional[Order] = None
+    unfulfilled: List[UnfulfilledLine] = field(default_factory=list)
+
+
+def conflicting_lines(user) -> List[UnfulfilledLine]:
+    """Every cart line with the product's current stock, for a checkout that kept conflicting"""
+    return [
+        UnfulfilledLine(item['id'], item['product_id'], item['product__name'] or '', item['quantity'],
+                        item['product__stock'] or 0)
+        for item in CartItem.objects.filter(cart__user=user).order_by('id')
+        .values('id', 'product_id', 'quantity', 'product__name', 'product__stock')
+    ]
+
+
+def checkout_cart(user) -> CheckoutResult:
+    result = CheckoutResult()
+    with transaction.atomic():
+        # قفل سبد: دو checkout هم‌زمان یک کاربر پشت سر هم اجرا می‌شوند
+        cart = Cart.objects.select_for_update().filter(user=user).first()
+        if cart is None:
+            transaction.on_commit(lambda: set_cart_count(user.pk, 0))
+            return result
+        items = list(CartItem.objects.filter(cart=cart).order_by('id').values('id', 'product_id', 'quantity'))
+        if not items:
+            transaction.on_commit(lambda: set_cart_count(user.pk, 0))
+            return result
+        products = {
+            p.id: p for p in Product.objects.select_for_update()
+            .filter(id__in={i['product_id'] for i in items}).order_by('id').only('id', 'name', 'price', 'stock')
+        }
+
+        remaining = {pid: p.stock for pid, p in products.items()}
+        taken = {}
+        fulfilled = []
+        for item in items:
+            pid, qty = item['product_id'], item['quantity']
+            if qty <= 0:
+                continue
+            available = remaining.get(pid, 0)
+            if available < qty:
+                product = products.get(pid)
+                result.unfulfilled.append(UnfulfilledLine(
+                    item['id'], pid, product.name if product else '', qty, available))
+                continue
+            remaining[pid] = available - qty
+            taken[pid] = taken.get(pid, 0) + qty
+            fulfilled.append(item)
+        if not fulfilled:
+            # هیچ ردیفی حذف نشد؛ badge با تعداد خوانده‌شده زیر قفل هم‌سان می‌شود
+            transaction.on_commit(lambda: set_cart_count(user.pk, len(items)))
+            return result
+
+        # یک UPDATE برای همه محصولات؛ شرط stock >= qty در WHERE روی دیتابیس‌های بدون قفل سطری oversell را می‌گیرد
+        # (StockConflict؛ view یک بار دوباره تلاش می‌کند)
+        enough = Q()
+        for pid, qty in taken.items():
+            enough |= Q(id=pid, stock__gte=qty)
+        updated = Product.objects.filter(enough).update(stock=Case(
+            *[When(id=pid, then=F('stock') - qty) for pid, qty in taken.items()],
+            default=F('stock'),
+            output_field=PositiveIntegerField(),
+        ))
+        if updated != len(taken):
+            # رول‌بک کل تراکنش
+            raise StockConflict("stock changed while the checkout held its row locks")
+
+        order = Order.objects.create(user=user)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=item['product_id'], quantity=item['quantity'],
+                      price=products[item['product_id']].price)
+            for item in fulfilled
+        ])
+        CartItem.objects.filter(id__in=[item['id'] for item in fulfilled]).delete()
+        result.order = order
+
+        # update() و bulk_create سیگنال ندارند: خرید روی نتیجه خود کاربر اثر دارد؛
+        # موجودی موقع خواندن ریکامندیشن‌ها فیلتر می‌شود و نسخه کاتالوگ را عوض نمی‌کند
+        from recommendation.cache import bump_user_version
+        transaction.on_commit(lambda: bump_user_version(user.username))
+        transaction.on_commit(lambda: set_cart_count(user.pk, len(items) - len(fulfilled)))
+    return result
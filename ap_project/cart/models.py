@@ -11,7 +11,8 @@ class Cart(models.Model):
         return f"سبد خرید {self.user.username}"
 
     def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        from cart.summary import LINE_TOTAL
+        return self.items.aggregate(total=models.Sum(LINE_TOTAL))['total'] or 0
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -22,6 +23,10 @@ class CartItem(models.Model):
         return f"{self.quantity} × {self.product.name}"
 
     def total_price(self):
+        # line_total وقتی از cart_summary آمده باشد در SQL حساب شده است
+        line_total = getattr(self, 'line_total', None)
+        if line_total is not None:
+            return line_total
         return self.quantity * self.product.price
 
 
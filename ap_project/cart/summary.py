@@ -0,0 +1,73 @@
+"""
+خلاصه سبد خرید و شمارنده badge
+
+cart_summary() loads the lines with their products and SQL-computed line
+totals in one query; cart_totals() returns (total, line count) with one
+aggregate query for AJAX responses. The badge count (number of lines) is
+cached per user and adjusted by add/update/checkout, so it is only counted
+in the DB after a cache miss.
+"""
+
+from dataclasses import dataclass, field
+from typing import List
+
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Count, ExpressionWrapper, F, Sum
+
+from cart.models import CartItem
+
+CART_COUNT_KEY = "cart:count:{user_id}"
+CART_COUNT_TIMEOUT = 24 * 60 * 60
+
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('product__price'), output_field=BigIntegerField())
+
+
+@dataclass
+class CartSummary:
+    lines: List[CartItem] = field(default_factory=list)
+    total: int = 0
+
+    @property
+    def count(self):
+        return len(self.lines)
+
+
+def cart_summary(user) -> CartSummary:
+    lines = list(CartItem.objects.filter(cart__user=user).select_related('product')
+                 .annotate(line_total=LINE_TOTAL).order_by('id'))
+    summary = CartSummary(lines, sum(line.line_total or 0 for line in lines))
+    set_cart_count(user.pk, summary.count)
+    return summary
+
+
+def cart_totals(user):
+    """(grand total, number of lines) in one aggregate query"""
+    result = CartItem.objects.filter(cart__user=user).aggregate(total=Sum(LINE_TOTAL), count=Count('id'))
+    set_cart_count(user.pk, result['count'])
+    return int(result['total'] or 0), result['count']
+
+
+# ---------------- badge ----------------
+
+def _count_key(user_id):
+    return CART_COUNT_KEY.format(user_id=user_id)
+
+
+def get_cart_count(user) -> int:
+    count = cache.get(_count_key(user.pk))
+    if count is None:
+        count = CartItem.objects.filter(cart__user=user).count()
+        set_cart_count(user.pk, count)
+    return count
+
+
+def set_cart_count(user_id, count):
+    cache.set(_count_key(user_id), count, CART_COUNT_TIMEOUT)
+
+
+def adjust_cart_count(user_id, delta):
+    """Apply a known change; a missing key is left for get_cart_count to recount"""
+    try:
+        cache.incr(_count_key(user_id), delta)
+    except ValueError:
+        pass
@@ -1,3 +1,131 @@
-from django.test import TestCase
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from orders.models import Order, OrderItem
+from products.models import Product
+from .checkout import StockConflict, checkout_cart
+from .models import Cart, CartItem
+from .summary import get_cart_count
+
+
+def make_product(stock, price=100000):
+    return Product.objects.create(
+        name='کرم تست', brand='برند', category='مرطوب کننده', description='توضیح',
+        skin_type='خشک', concerns_targeted='', price=price, stock=stock,
+    )
+
+
+def make_cart(username, items):
+    user = User.objects.create_user(username=username, password='testpass')
+    cart = Cart.objects.create(user=user)
+    for product, quantity in items:
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+    return user
+
+
+class CheckoutTests(TestCase):
+    def test_partial_checkout_returns_unfulfilled_lines(self):
+        plenty, scarce = make_product(stock=5), make_product(stock=1)
+        user = make_cart('buyer', [(plenty, 2), (scarce, 3)])
+
+        result = checkout_cart(user)
+
+        self.assertIsNotNone(result.order)
+        self.assertEqual([(i.product_id, i.quantity) for i in result.order.items.all()], [(plenty.id, 2)])
+        self.assertEqual([(l.product_id, l.requested, l.available) for l in result.unfulfilled], [(scarce.id, 3, 1)])
+        plenty.refresh_from_db()
+        scarce.refresh_from_db()
+        self.assertEqual((plenty.stock, scarce.stock), (3, 1))
+        # قلم ناموفق در سبد می‌ماند
+        self.assertEqual(list(CartItem.objects.filter(cart__user=user).values_list('product_id', flat=True)), [scarce.id])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 8
+    stock = 3
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        product = make_product(stock=self.stock)
+        users = [make_cart(f'buyer{i}', [(product, 1)]) for i in range(self.buyers)]
+        barrier = threading.Barrier(self.buyers)
+        results, errors = [], []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                results.append(checkout_cart(user))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(sum(1 for r in results if r.order is not None), self.stock)
+        self.assertEqual(sum(len(r.unfulfilled) for r in results), self.buyers - self.stock)
+        self.assertEqual(sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True)), self.stock)
+
+
+class CheckoutViewConflictTests(TestCase):
+    def setUp(self):
+        self.product = make_product(stock=5)
+        self.user = make_cart('racer', [(self.product, 2)])
+        self.client.force_login(self.user)
+
+    def post_checkout(self):
+        return self.client.post('/cart/checkout/', HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_conflict_is_retried_once(self):
+        calls = []
+
+        def conflict_then_checkout(user):
+            calls.append(user)
+            if len(calls) == 1:
+                raise StockConflict()
+            return checkout_cart(user)
+
+        with mock.patch('cart.views.checkout_cart', side_effect=conflict_then_checkout):
+            data = self.post_checkout()
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['unfulfilled'], [])
+
+    def test_repeated_conflict_keeps_lines_in_cart(self):
+        with mock.patch('cart.views.checkout_cart', side_effect=StockConflict()):
+            data = self.post_checkout()
+        self.assertFalse(data['success'])
+        self.assertEqual([(l['product_id'], l['requested'], l['available']) for l in data['unfulfilled']],
+                         [(self.product.id, 2, 5)])
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 1)
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+
+
+class CartCountTests(TestCase):
+    def setUp(self):
+        self.scarce, self.other = make_product(stock=1), make_product(stock=5)
+        self.user = make_cart('counter', [(self.scarce, 3), (self.other, 1)])
+        self.client.force_login(self.user)
+
+    def test_badge_follows_lines_removed_before_a_failed_checkout(self):
+        self.assertEqual(get_cart_count(self.user), 2)
+        other_line = CartItem.objects.get(cart__user=self.user, product=self.other)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/cart/checkout/', {f'quantity_{other_line.id}': '0'},
+                             HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        # فقط قلم ناموجود مانده و هیچ چیز ثبت نشده
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+        self.assertEqual(get_cart_count(self.user), 1)
@@ -5,10 +5,14 @@ from products.models import Product
 from .models import Cart, CartItem
 from orders.models import Order, OrderItem
 from django.http import JsonResponse
+from django.contrib import messages
+from .checkout import CheckoutResult, StockConflict, checkout_cart, conflicting_lines
+from .summary import cart_summary, cart_totals, get_cart_count, adjust_cart_count, set_cart_count
 @login_required
 def cart_detail(request):
     cart, created = Cart.objects.get_or_create(user=request.user)
-    return render(request, 'cart/cart_detail.html', {'cart': cart})
+    # اقلام + محصول + جمع هر ردیف در یک کوئری
+    return render(request, 'cart/cart_detail.html', {'cart': cart, 'summary': cart_summary(request.user)})
 
 
 @login_required
@@ -31,6 +35,7 @@ def add_to_cart(request, pk):
     cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
     if created:
         cart_item.quantity = max(1, qty)
+        adjust_cart_count(request.user.pk, 1)
     else:
         cart_item.quantity += max(1, qty)
     cart_item.save()
@@ -40,7 +45,7 @@ def add_to_cart(request, pk):
     if requested_with == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
-            'cart_count': cart.items.count(),
+            'cart_count': get_cart_count(request.user),
             'item_id': cart_item.id,
             'item_quantity': cart_item.quantity,
         })
@@ -50,24 +55,24 @@ def add_to_cart(request, pk):
 @login_required
 def update_cart(request):
     if request.method == 'POST':
-        cart = Cart.objects.get(user=request.user)
         updated_item_info = None
         for key, value in request.POST.items():
             if key.startswith('quantity_'):
                 item_id = key.split('_')[1]
                 try:
-                    item = CartItem.objects.get(id=item_id, cart=cart)
+                    item = CartItem.objects.select_related('product').get(id=item_id, cart__user=request.user)
                     quantity = int(value)
                     if quantity > 0:
                         item.quantity = quantity
-                        item.save()
+                        item.save(update_fields=['quantity'])
                         updated_item_info = {
                             'item_id': item.id,
-                            'item_total': int(item.total_price()) if hasattr(item, 'total_price') else int(item.quantity * item.product.price),
+                            'item_total': int(item.total_price()),
                             'item_quantity': item.quantity,
                         }
                     else:
                         item.delete()
+                        adjust_cart_count(request.user.pk, -1)
                         updated_item_info = {
                             'item_id': int(item_id),
                             'item_total': 0
@@ -78,14 +83,9 @@ def update_cart(request):
         # If AJAX, return JSON with updated totals so frontend can update UI in-place
         requested_with = request.META.get('HTTP_X_REQUESTED_WITH') or request.headers.get('x-requested-with')
         if requested_with == 'XMLHttpRequest':
-            # cart.total_price may be Decimal; send as int for display (تومان)
-            try:
-                cart_total = int(cart.total_price)
-            except Exception:
-                # fallback: compute from items
-                cart_total = sum(int(i.total_price()) if hasattr(i, 'total_price') else int(i.quantity * i.product.price) for i in cart.items.all())
-
-            resp = {'cart_total': cart_total}
+            # جمع کل و تعداد اقلام با یک کوئری aggregate (تومان)
+            cart_total, cart_count = cart_totals(request.user)
+            resp = {'cart_total': cart_total, 'cart_count': cart_count}
             if updated_item_info:
                 resp.update(updated_item_info)
             return JsonResponse(resp)
@@ -100,6 +100,7 @@ def checkout(request):
 
         cart = Cart.objects.get(user=request.user)
         cart.items.all().delete()  # آیتم‌ها رو حذف میکنه (می‌تونی تغییر بدی)
+        set_cart_count(request.user.pk, 0)
 
         # هدایت به صفحه تشکر یا صفحه اصلی
         return redirect('home')  # آدرس صفحه اصلی یا صفحه تشکر
@@ -120,38 +121,41 @@ def checkout(request):
                     quantity = int(value)
                     if quantity > 0:
                         item.quantity = quantity
-                        item.save()
+                        item.save(update_fields=['quantity'])
                     else:
                         item.delete()
+                        adjust_cart_count(request.user.pk, -1)
                 except (CartItem.DoesNotExist, ValueError):
                     pass
 
-    if cart.items.count() == 0:
+    if not cart.items.exists():
         return redirect('cart-detail')
 
-    # سفارش جدید بسازیم
-    # Order model doesn't store total_price as a field; compute via order.total_price() when needed
-    order = Order.objects.create(user=request.user)
-
-    # آیتم‌های سبد خرید رو به سفارش منتقل کنیم
-    for item in cart.items.all():
-        # کم کردن موجودی محصول
-        product = item.product
-        if product.stock >= item.quantity:
-            product.stock -= item.quantity
-            product.save()
-        else:
-            # اگر موجودی کافی نبود، می‌توان پیام خطا یا هندل مناسب اضافه کرد
-            continue
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            quantity=item.quantity,
-            price=product.price
-        )
-
-    # سبد خرید رو خالی کنیم
-    cart.items.all().delete()
+    # کاهش موجودی، ثبت سفارش و خالی کردن سبد در یک تراکنش (cart.checkout)
+    try:
+        result = checkout_cart(request.user)
+    except StockConflict:
+        # موجودی بین خواندن و UPDATE عوض شد (دیتابیس بدون قفل سطری): یک بار دیگر با موجودی تازه
+        try:
+            result = checkout_cart(request.user)
+        except StockConflict:
+            # هیچ چیز ثبت نشده؛ همه اقلام با موجودی فعلی در سبد می‌مانند
+            result = CheckoutResult(unfulfilled=conflicting_lines(request.user))
+    unfulfilled = [line.as_dict() for line in result.unfulfilled]
+
+    requested_with = request.META.get('HTTP_X_REQUESTED_WITH') or request.headers.get('x-requested-with')
+    if requested_with == 'XMLHttpRequest':
+        return JsonResponse({
+            'success': result.order is not None,
+            'order_id': result.order.id if result.order else None,
+            'unfulfilled': unfulfilled,
+        })
+
+    # اقلامی که موجودی کافی نداشتند در سبد می‌مانند
+    for line in unfulfilled:
+        messages.warning(request, f"موجودی «{line['name']}» کافی نیست ({line['available']} عدد موجود است).")
+    if result.order is None:
+        return redirect('cart-detail')
 
     # انتقال به صفحه تاریخچه سفارش‌ها
-    return redirect('order-history')
\ No newline at end of file
+    return redirect('order-history')
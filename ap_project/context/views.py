@@ -1,7 +1,5 @@
 from django.shortcuts import render
 from products.models import Product
-from django.db.models import Avg, Count
-from django.db.models.functions import Coalesce
 import jdatetime
 
 def get_persian_season():
@@ -17,10 +15,7 @@ def get_persian_season():
 
 def seasonal_products_view(request):
     season = get_persian_season()
-    seasonal_products = Product.objects.filter(tags__contains=[season]).annotate(
-        avg_rating=Coalesce(Avg('comments__rating'), 0.0),
-        comment_count=Coalesce(Count('comments'), 0)
-    ).order_by('-avg_rating')
+    seasonal_products = Product.objects.filter(tags__contains=[season]).order_by('-avg_rating')
 
     return render(request, 'context/seasonal_products.html', {
         'season': season,
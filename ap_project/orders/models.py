@@ -6,10 +6,20 @@ class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # تاریخچه سفارش‌های هر کاربر (order_history)
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"سفارش {self.id} از {self.user.username}"
 
     def total_price(self):
+        # order_total وقتی از order_history آمده باشد در SQL حساب شده است
+        order_total = getattr(self, 'order_total', None)
+        if order_total is not None:
+            return order_total
         return sum(item.total_price() for item in self.items.all())
 
 
@@ -1,7 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from cart.models import Cart
+from cart.summary import set_cart_count
 from .models import Order, OrderItem
 
 @login_required
@@ -26,13 +29,23 @@ def checkout(request):
 
     # پاک کردن سبد خرید
     cart.items.all().delete()
+    set_cart_count(request.user.pk, 0)
 
     messages.success(request, "سفارش شما با موفقیت ثبت شد!")
     return redirect('order-history')
 
 
+ORDER_HISTORY_PAGE_SIZE = 10
+
+
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'orders/order_history.html', {'orders': orders})
+    # جمع هر سفارش در SQL، اقلام و محصولاتشان با دو کوئری prefetch برای کل صفحه
+    orders = (Order.objects.filter(user=request.user)
+              .annotate(order_total=Sum(ExpressionWrapper(
+                  F('items__quantity') * F('items__price'), output_field=DecimalField(max_digits=14, decimal_places=2))))
+              .prefetch_related('items__product')
+              .order_by('-created_at', '-id'))
+    page = Paginator(orders, ORDER_HISTORY_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, 'orders/order_history.html', {'orders': page.object_list, 'page_obj': page})
 
@@ -0,0 +1,35 @@
+"""
+
+cd ap_project
+python manage.py backfill_rating_aggregates
+
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+
+from products.models import Product, Comment
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.rating_sum / rating_count / avg_rating from the comments table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        aggregates = {
+            row['product_id']: row
+            for row in Comment.objects.values('product_id').annotate(total=Sum('rating'), count=Count('id'), avg=Avg('rating'))
+        }
+        changed = []
+        with transaction.atomic():
+            for p in Product.objects.select_for_update().only('id', 'rating_sum', 'rating_count', 'avg_rating'):
+                row = aggregates.get(p.id)
+                values = (row['total'] or 0, row['count'], float(row['avg'] or 0.0)) if row else (0, 0, 0.0)
+                if (p.rating_sum, p.rating_count, p.avg_rating) != values:
+                    p.rating_sum, p.rating_count, p.avg_rating = values
+                    changed.append(p)
+            Product.objects.bulk_update(changed, ['rating_sum', 'rating_count', 'avg_rating'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rating aggregates updated for {len(changed)} products"))
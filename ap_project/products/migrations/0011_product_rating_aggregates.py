@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Comment = apps.get_model('products', 'Comment')
+    rows = Comment.objects.values('product_id').annotate(total=Sum('rating'), count=Count('id'), avg=Avg('rating'))
+    for row in rows:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_sum=row['total'] or 0,
+            rating_count=row['count'],
+            avg_rating=float(row['avg'] or 0.0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_delete_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
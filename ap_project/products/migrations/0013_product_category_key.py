@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+# کپی products.models._CATEGORY_FOLD/normalize_category در زمان این migration؛
+# تغییر بعدی آن‌ها نباید backfill قدیمی را عوض کند
+_CATEGORY_FOLD = str.maketrans({
+    ' ': None, '\u200c': None, '\u200d': None, '\u0640': None,
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا',
+})
+
+
+def normalize_category(name):
+    return str(name or '').translate(_CATEGORY_FOLD).lower()
+
+
+def backfill_category_key(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    for category in Product.objects.values_list('category', flat=True).distinct():
+        Product.objects.filter(category=category).update(category_key=normalize_category(category))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_category_key, migrations.RunPython.noop),
+    ]
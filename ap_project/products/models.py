@@ -1,8 +1,23 @@
-from django.db import models
-from django.db.models import Avg
+from django.db import models, transaction
+from django.db.models import Avg, Count, Sum, F, Case, When, Value, FloatField
+from django.db.models.functions import Cast
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 
+# یکسان‌سازی نام دسته: حذف فاصله/نیم‌فاصله/کشیده و حروف عربی -> فارسی
+_CATEGORY_FOLD = str.maketrans({
+    ' ': None, '\u200c': None, '\u200d': None, '\u0640': None,
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا',
+})
+
+
+def normalize_category(name) -> str:
+    """'ضد آفتاب' / 'ضدآفتاب' / 'ضد‌آفتاب' -> 'ضدافتاب'"""
+    return str(name or '').translate(_CATEGORY_FOLD).lower()
+
+
 class Product(models.Model):
     name = models.CharField(max_length = 100)
     brand = models.CharField(max_length = 100)
@@ -22,6 +37,8 @@ class Product(models.Model):
     ('حساس', 'حساس'),
 ]
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
+    # normalize_category(category)؛ در save پر می‌شود تا فیلتر دسته یک lookup برابری روی ایندکس باشد
+    category_key = models.CharField(max_length=50, db_index=True, editable=False, default='')
     description = models.TextField()
     skin_type = models.CharField(max_length=50, choices=SKIN_TYPE_CHOICES)
     concerns_targeted = models.CharField(max_length=200)
@@ -34,10 +51,40 @@ class Product(models.Model):
     products_tokens = models.JSONField(blank=True, null=True, default=dict)
     similar_products = models.JSONField(blank=True, null=True, default=list)
     similarity_threshold = models.FloatField(blank=True, null=True, default=0.0)
+    # مجموع/تعداد امتیاز نظرات؛ با ثبت و حذف Comment به‌روز می‌شوند (backfill_rating_aggregates)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0.0, db_index=True)
+
+    class Meta:
+        # صفحه‌بندی keyset لیست محصولات: (ستون مرتب‌سازی، id)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.category_key = normalize_category(self.category)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'category' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'category_key'}
+        super().save(*args, **kwargs)
 
     def average_rating(self):
-        result = self.comments.aggregate(avg_rating=Avg('rating'))
-        return result['avg_rating'] or 0  # اگر کامنت نبود صفر برمی‌گردونه
+        return self.avg_rating or 0  # اگر کامنت نبود صفر برمی‌گردونه
+
+    def recalculate_rating(self, save=True):
+        """Recompute the rating columns from the comments table"""
+        result = self.comments.aggregate(total=Sum('rating'), count=Count('id'), avg=Avg('rating'))
+        self.rating_sum = result['total'] or 0
+        self.rating_count = result['count'] or 0
+        self.avg_rating = float(result['avg'] or 0.0)
+        if save:
+            Product.objects.filter(pk=self.pk).update(
+                rating_sum=self.rating_sum, rating_count=self.rating_count, avg_rating=self.avg_rating
+            )
+
     def __str__(self):
         return f"{self.name} ({self.brand})"
 
@@ -54,3 +101,39 @@ class Comment(models.Model):
         return f"{self.user} - {self.product.name} ({self.rating})"
 
 
+def _apply_rating_delta(product_id, rating_delta, count_delta):
+    """
+    Atomic F() update of the rating columns. avg_rating is set in a second
+    statement on the already locked row, so the result does not depend on the
+    order in which the database evaluates SET assignments.
+    """
+    with transaction.atomic():
+        qs = Product.objects.filter(pk=product_id)
+        if count_delta < 0:
+            qs = qs.filter(rating_count__gt=0)
+        updated = qs.update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+        if updated:
+            Product.objects.filter(pk=product_id).update(avg_rating=Case(
+                When(rating_count__gt=0, then=Cast(F('rating_sum'), FloatField()) / F('rating_count')),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved_update_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _apply_rating_delta(instance.product_id, instance.rating, 1)
+    else:
+        # ویرایش امتیاز یک نظر موجود: محاسبه مجدد از روی جدول نظرات
+        Product(pk=instance.product_id).recalculate_rating()
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted_update_rating(sender, instance, **kwargs):
+    _apply_rating_delta(instance.product_id, -instance.rating, -1)
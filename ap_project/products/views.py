@@ -2,17 +2,13 @@ from django.views.decorators.csrf import csrf_exempt
 
 # ثبت بازدید محصول توسط کاربر (AJAX)
 from django.utils import timezone
+from accounts.visit_buffer import record_visit
 def add_visited_product(request, pk):
     profile = getattr(request.user, 'profile', None)
     if not profile:
         return JsonResponse({'error': 'no profile'}, status=400)
-    visited = profile.visited_items or []
-    # اضافه کردن بازدید جدید (بدون حذف قبلی)
-    visit_time = timezone.now().strftime('%Y-%m-%dT%H:%M:%S')
-    visited.append({'product_id': pk, 'visit_time': visit_time})
-    # فقط 100 بازدید آخر نگه دار
-    profile.visited_items = visited[-100:]
-    profile.save()
+    # فقط در بافر حافظه صف می‌شود؛ نوشتن در DB دسته‌ای است (accounts.visit_buffer)
+    record_visit(profile, pk)
     return JsonResponse({'success': True})
 
 # حذف نظر توسط صاحب نظر
@@ -74,9 +70,7 @@ class ProductDetailView(DetailView):
         # محصولات همان برند با بیشترین میانگین امتیاز
         brand_products = Product.objects.filter(
             brand=product.brand
-        ).exclude(id=product.id).annotate(
-            avg_rating=Avg('comments__rating')
-        ).order_by('-avg_rating')[:5]
+        ).exclude(id=product.id).order_by('-avg_rating')[:5]
         context['brand_products'] = brand_products
 
         # وضعیت علاقه‌مندی محصول برای کاربر فعلی
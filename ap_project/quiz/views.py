@@ -4,13 +4,10 @@ from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.shortcuts import redirect
 from django.utils.http import url_has_allowed_host_and_scheme
-from hazm import Normalizer, word_tokenize, Stemmer
 from accounts.models import Profile
+from recommendation.text_processing import tokenize
 import json
 
-normalizer = Normalizer()
-stemmer = Stemmer()
-
 # --- سوال‌ها و گزینه‌ها ---
 QUESTIONS = {
     "skin_type": ["نرمال", "خشک", "چرب", "ترکیبی", "حساس"],
@@ -82,9 +79,7 @@ BUDGET_RANGES = [
 # --- پردازش متن با Hazm ---
 def extract_keywords(text):
     if not text: return []
-    t = normalizer.normalize(text)
-    tokens = word_tokenize(t)
-    stems = [stemmer.stem(tok) for tok in tokens if tok.isalpha() and len(tok) > 2]
+    stems = tokenize(text, clean=False, min_len=3, alpha_only=True)
     return list(set(stems))
 
 # --- نرمال کردن اندیس بودجه ---
@@ -0,0 +1,178 @@
+"""
+ایندکس همسایه تقریبی (MinHash LSH) برای شباهت محصولات در کاتالوگ‌های بزرگ
+
+The exact neighbour lists need every pair of TF-IDF rows (O(n^2)). Here the
+token set of each row (its non-zero columns) is summarized by a MinHash
+signature. Signatures are cut into `bands` of `rows` values, and products
+that agree on a whole band land in the same bucket. Only pairs that share a
+bucket are candidates. Every candidate's exact TF-IDF cosine is then
+computed, and the pair is kept if it is >= threshold. So there are no false
+positives. Recall depends on how likely a true pair is to share a bucket,
+which is 1 - (1 - J^rows)^bands for token-set Jaccard J. The curve is
+steepest near J = (1/bands)^(1/rows). Pairs at the 0.4 TF-IDF cosine
+threshold often have token Jaccard below 0.3, so the defaults (48 x 2) put
+the step near 0.14: a pair at J = 0.3 is a candidate with probability 0.99.
+Against the stored lists of Test/similar_products.json this gives recall
+about 0.98 (10 seeds); 64 x 4 only reaches about 0.66 there. More rows
+check fewer pairs but lose those low-Jaccard neighbours.
+
+The index only pays off when true neighbours are a small share of all pairs
+(large, varied catalogs). Test/ann_recall.py reports recall, the share of
+pairs checked and the wall time next to the exact computation.
+
+NumPy (+ the scipy.sparse matrix the vectorizer already returns) only; no
+Django imports, so Test/ scripts can use it as well.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+_MERSENNE_PRIME = np.int64((1 << 31) - 1)
+_BAND_HASH_BASE = np.int64(1_000_003)
+
+DEFAULT_BANDS = 48
+DEFAULT_ROWS = 2
+# بزرگ‌ترین bucket که زوج‌هایش بررسی می‌شوند (حداکثر ~125k زوج برای هر bucket)
+DEFAULT_MAX_BUCKET = 500
+SIGNATURE_BLOCK_ROWS = 2_000
+# بلوک‌های بررسی کاندیدها: حداکثر VERIFY_BLOCK_ROWS سطر و VERIFY_BLOCK_CELLS خانه dense (~32MB)
+VERIFY_BLOCK_ROWS = 256
+VERIFY_BLOCK_CELLS = 4_000_000
+
+
+def _band_keys(cols: np.ndarray) -> np.ndarray:
+    """One int64 per row of a band (polynomial hash, wrapping); a rare collision only adds a candidate"""
+    keys = cols[:, 0].astype(np.int64)
+    for k in range(1, cols.shape[1]):
+        keys = keys * _BAND_HASH_BASE + cols[:, k]
+    return keys
+
+
+class MinHashLSH:
+    """
+    bands x rows hash functions h(c) = (a*c + b) mod p over column ids.
+    max_bucket: buckets larger than this are skipped (they only hold very
+    common token combinations and would bring back quadratic cost); None keeps all.
+    """
+
+    def __init__(self, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=0, max_bucket: Optional[int] = DEFAULT_MAX_BUCKET):
+        self.bands = int(bands)
+        self.rows = int(rows)
+        self.num_perm = self.bands * self.rows
+        self.max_bucket = max_bucket
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=self.num_perm, dtype=np.int64)
+        self.stats = {}
+
+    # ---------------- امضا ----------------
+
+    def signatures(self, X) -> np.ndarray:
+        """(n x num_perm) MinHash signatures of the non-zero column sets of X; empty rows get -1"""
+        X = sp.csr_matrix(X)
+        n, dim = X.shape
+        # مقادیر < 2^31 هستند؛ int32 و ترتیب (ستون x hash) حافظه و زمان reduceat را نصف می‌کند
+        col_hash = ((np.arange(dim, dtype=np.int64)[:, None] * self._a + self._b) % _MERSENNE_PRIME).astype(np.int32)
+        sig = np.full((n, self.num_perm), -1, dtype=np.int32)
+        for start in range(0, n, SIGNATURE_BLOCK_ROWS):
+            block = X[start:start + SIGNATURE_BLOCK_ROWS]
+            lengths = np.diff(block.indptr)
+            nonempty = np.flatnonzero(lengths)
+            if not len(nonempty):
+                continue
+            hashed = col_hash[block.indices]  # nnz(block) x num_perm
+            sig[start + nonempty] = np.minimum.reduceat(hashed, block.indptr[nonempty], axis=0)
+        return sig
+
+    # ---------------- جفت‌های کاندید ----------------
+
+    def candidate_pairs(self, sig: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Unique (i, j), i < j, of rows sharing at least one band bucket"""
+        n = sig.shape[0]
+        valid = np.flatnonzero(sig[:, 0] >= 0)
+        keys = []
+        skipped = 0
+        for band in range(self.bands):
+            labels = _band_keys(sig[valid, band * self.rows:(band + 1) * self.rows])
+            order = np.argsort(labels, kind='stable')
+            sorted_labels = labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            sizes = np.diff(np.r_[starts, len(order)])
+            # گروه‌های هم‌اندازه با هم: members (g x s) و همه زوج‌های درون هر گروه
+            for size in np.unique(sizes[sizes > 1]):
+                if self.max_bucket is not None and size > self.max_bucket:
+                    skipped += int((sizes == size).sum())
+                    continue
+                group_starts = starts[sizes == size]
+                members = valid[order[group_starts[:, None] + np.arange(size)]]
+                iu, ju = np.triu_indices(size, 1)
+                a, b = members[:, iu].ravel(), members[:, ju].ravel()
+                lo, hi = np.minimum(a, b), np.maximum(a, b)
+                keys.append(lo * n + hi)
+        if not keys:
+            self.stats.update(candidates=0, skipped_buckets=skipped)
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        keys = np.unique(np.concatenate(keys))
+        self.stats.update(candidates=int(len(keys)), skipped_buckets=skipped)
+        return keys // n, keys % n
+
+    # ---------------- همسایه‌ها ----------------
+
+    def neighbours(self, X, threshold: float) -> sp.csr_matrix:
+        """
+        Sparse (n x n) cosine similarities >= threshold among candidate pairs,
+        symmetric and with the diagonal, like catalog.thresholded_similarities.
+        """
+        X = sp.csr_matrix(X, dtype=float)
+        n = X.shape[0]
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        Xn = sp.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)) @ X
+        Xn = Xn.tocsr()
+
+        i, j = self.candidate_pairs(self.signatures(X))
+        keep_i, keep_j, keep_s = [], [], []
+        # زوج‌ها بر اساس i مرتب‌اند: هر بلوک سطرها در برابر ستون‌های کاندید همان بلوک
+        step = max(1, min(VERIFY_BLOCK_ROWS, VERIFY_BLOCK_CELLS // max(1, n)))
+        starts = np.arange(0, n + step, step)
+        bounds = np.searchsorted(i, starts)
+        for start, lo, hi in zip(starts, bounds[:-1], bounds[1:]):
+            if lo == hi:
+                continue
+            bi, bj = i[lo:hi], j[lo:hi]
+            cand_cols, local_j = np.unique(bj, return_inverse=True)
+            block = (Xn[start:start + step] @ Xn[cand_cols].T).toarray()
+            sims = block[bi - start, local_j.ravel()]
+            mask = sims >= threshold
+            keep_i.append(bi[mask])
+            keep_j.append(bj[mask])
+            keep_s.append(sims[mask])
+        pi = np.concatenate(keep_i) if keep_i else np.empty(0, dtype=np.int64)
+        pj = np.concatenate(keep_j) if keep_j else np.empty(0, dtype=np.int64)
+        ps = np.concatenate(keep_s) if keep_s else np.empty(0)
+        diag = np.flatnonzero(norms > 0) if threshold <= 1.0 else np.empty(0, dtype=np.int64)
+        rows = np.concatenate([pi, pj, diag])
+        cols = np.concatenate([pj, pi, diag])
+        data = np.concatenate([ps, ps, np.ones(len(diag))])
+        out = sp.csr_matrix((data, (rows, cols)), shape=(n, n))
+        out.sort_indices()
+        self.stats.update(pairs=int(len(ps)), total_pairs=n * (n - 1) // 2)
+        return out
+
+
+def approximate_similarities(X, threshold: float, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=0,
+                             max_bucket=DEFAULT_MAX_BUCKET):
+    """Drop-in for catalog.thresholded_similarities using MinHash LSH candidates"""
+    return MinHashLSH(bands=bands, rows=rows, seed=seed, max_bucket=max_bucket).neighbours(X, threshold)
+
+
+def neighbour_recall(approx: sp.csr_matrix, exact: sp.csr_matrix) -> float:
+    """Share of the exact off-diagonal neighbour pairs that the approximate matrix also has"""
+    def pairs(m):
+        coo = sp.triu(m, k=1).tocoo()
+        return set(zip(coo.row.tolist(), coo.col.tolist()))
+    want = pairs(exact)
+    if not want:
+        return 1.0
+    return len(want & pairs(approx)) / len(want)
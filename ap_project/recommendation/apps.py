@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class RecommendationConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'recommendation'
+
+    def ready(self):
+        # مدل کاتالوگ ذخیره‌شده را هنگام شروع پروسه از دیسک بارگذاری کن (بدون کوئری به DB)
+        from recommendation.catalog import load_catalog_model
+        load_catalog_model()
@@ -0,0 +1,176 @@
+"""
+کش نتایج ریکامندیشن برای هر کاربر
+
+The scored arrays of score_all_products are cached per user; the full list
+and the top-K views are built from them on read. Keys carry a
+global catalog version and a per-user version; signal receivers in
+recommendation.models bump those versions when the user's visits,
+favorites, preferences/keywords or order items change, or when products or
+seasonal keywords change. Old entries are then never read again and simply
+expire.
+
+Stock and ratings change on every checkout and comment, so they do not touch
+the catalog version. Stock is applied when results are read: the scored
+arrays and precomputed sets are stock-free, and the only_in_stock preference
+and the in_stock filter are checked against current stock. Comments bump a
+separate ratings version. Cached results pick new ratings up when they expire
+(RECOMMENDATION_CACHE_TIMEOUT), and precomputed sets on the next
+precompute_recommendations run.
+
+Users covered by the precompute_recommendations command are served from the
+PrecomputedRecommendation table while its stored versions are current.
+
+The versions are VersionCounter rows in the database, not cache keys. Every
+worker process and the management commands therefore see the same versions,
+even with the default per-process LocMemCache. With LocMemCache each worker
+keeps its own result entries, and a shared backend in settings.CACHES
+(Redis/Memcached) lets the workers reuse each other's entries.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+import numpy as np
+
+from products.models import Product
+from recommendation.models import VersionCounter
+from recommendation.views import (
+    build_products_from_db, build_purchases_from_db, get_user_preferences_from_db,
+    score_all_products, recommendations_output, top_k_recommendations, current_season_key,
+)
+
+CATALOG_VERSION_KEY = "recs:catalog_version"
+RATINGS_VERSION_KEY = "recs:ratings_version"
+USER_VERSION_KEY = "recs:user_version:{user_id}"
+RESULT_KEY = "recs:user:{user_id}:{catalog_v}:{user_v}:{season}"
+
+
+def _cache_timeout():
+    return getattr(settings, 'RECOMMENDATION_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_catalog_version():
+    return VersionCounter.get(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    VersionCounter.bump(CATALOG_VERSION_KEY)
+
+
+def get_ratings_version():
+    return VersionCounter.get(RATINGS_VERSION_KEY)
+
+
+def bump_ratings_version():
+    VersionCounter.bump(RATINGS_VERSION_KEY)
+
+
+def get_user_version(user_id):
+    return VersionCounter.get(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def get_user_versions(user_ids, batch_size=500):
+    """user_id -> version, batch_size users per query"""
+    user_ids = list(user_ids)
+    versions = {}
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        found = VersionCounter.get_many(*(USER_VERSION_KEY.format(user_id=u) for u in batch))
+        versions.update((u, found[USER_VERSION_KEY.format(user_id=u)]) for u in batch)
+    return versions
+
+
+def bump_user_version(user_id):
+    if user_id:
+        VersionCounter.bump(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def _result_key(user_id):
+    user_key = USER_VERSION_KEY.format(user_id=user_id)
+    versions = VersionCounter.get_many(CATALOG_VERSION_KEY, user_key)
+    return RESULT_KEY.format(
+        user_id=user_id,
+        catalog_v=versions[CATALOG_VERSION_KEY],
+        user_v=versions[user_key],
+        season=current_season_key(),
+    )
+
+
+def get_user_scores(user_id):
+    """score_all_products output for user_id, served from cache when inputs are unchanged"""
+    key = _result_key(user_id)
+    scored = cache.get(key)
+    if scored is not None:
+        return scored
+    products = build_products_from_db(user_id=user_id)
+    purchases = build_purchases_from_db(user_id=user_id)
+    user_prefs, keywords = get_user_preferences_from_db(user_id=user_id)
+    scored = score_all_products(products, purchases, user_prefs or {}, keywords or {}, user_id=user_id)
+    cache.set(key, scored, _cache_timeout())
+    return scored
+
+
+def current_stock(scored):
+    """Current stock per index of scored (a cached result may be older than the last checkout)"""
+    stock_by_id = dict(Product.objects.values_list('id', 'stock'))
+    return np.array([stock_by_id.get(pid, 0) for pid in scored["ids"]])
+
+
+def _needs_stock(scored, in_stock=None):
+    return bool(in_stock or scored["params"].get("only_in_stock"))
+
+
+def get_precomputed_recommendations(user_id, k=None):
+    """
+    Output of the precompute_recommendations command for user_id (top k, or the
+    full list when the stored set holds every eligible product), or None when
+    the set is missing, too short or was computed from older inputs. Sets of
+    only_in_stock users are filtered by current stock here.
+    """
+    from recommendation.models import PrecomputedRecommendationSet
+    rec_set = PrecomputedRecommendationSet.objects.filter(
+        profile__user__username=user_id,
+        catalog_version=get_catalog_version(),
+        user_version=get_user_version(user_id),
+        season=current_season_key(),
+    ).first()
+    if rec_set is None:
+        return None
+    items = rec_set.items.order_by('rank')
+    only_in_stock = rec_set.params.get("only_in_stock", False)
+    if only_in_stock:
+        items = items.filter(product__stock__gt=0)
+    if k is not None:
+        items = items[:k]
+    entries = list(items.values_list('entry', flat=True))
+    if not rec_set.complete and (k is None or len(entries) < k):
+        return None
+    if only_in_stock and not entries:
+        # همه ناموجودند: مسیر زنده به همه eligible ها برمی‌گردد
+        return None
+    return {
+        "generated_at": rec_set.generated_at,
+        "user": user_id,
+        "params": rec_set.params,
+        "recommendations": entries,
+    }
+
+
+def get_user_recommendations(user_id):
+    """Same output as compute_recommendations (full ranking)"""
+    output = get_precomputed_recommendations(user_id)
+    if output is not None:
+        return output
+    scored = get_user_scores(user_id)
+    return recommendations_output(scored, stock=current_stock(scored) if _needs_stock(scored) else None)
+
+
+def get_user_top_recommendations(user_id, k, category=None, brand=None, in_stock=None, category_keys=None):
+    if category is None and brand is None and not in_stock and category_keys is None:
+        output = get_precomputed_recommendations(user_id, k)
+        if output is not None:
+            return output
+    scored = get_user_scores(user_id)
+    return top_k_recommendations(scored, k, category=category, brand=brand, in_stock=in_stock,
+                                 category_keys=category_keys,
+                                 stock=current_stock(scored) if _needs_stock(scored, in_stock) else None)
@@ -0,0 +1,369 @@
+"""
+Catalog model برای ریکامندیشن
+
+TF-IDF vocabulary, the product document matrix and the thresholded neighbour
+lists only depend on the catalog, not on the user. They are built once,
+pickled to settings.RECOMMENDATION_CATALOG_PATH and reused by every request.
+
+cd ap_project
+python manage.py build_catalog_model
+"""
+
+import os
+import pickle
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from django.conf import settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from ap_project.performance import span
+from products.models import Product
+from recommendation.text_processing import tokenize, tokenize_many
+
+SIM_THRESHOLD = 0.4
+# تعداد سطرهای هر بلوک در محاسبه شباهت‌ها (حافظه حداکثر ~ SIM_BLOCK_ROWS x n)
+SIM_BLOCK_ROWS = 2048
+# با هر تغییر در ساختار CatalogModel افزایش بده تا فایل‌های قدیمی دوباره ساخته شوند
+CATALOG_FORMAT_VERSION = 3
+
+# فیلدهایی که در ساخت corpus استفاده می‌شوند؛ تغییر بقیه فیلدها مدل را باطل نمی‌کند
+CORPUS_FIELDS = {"name", "description", "brand", "category", "skin_type", "suitable_for", "tags", "products_tokens"}
+# فیلدهایی که برای مواد ممنوعه بررسی می‌شوند (همان متن compute_forbidden_penalty_for_product)
+FORBIDDEN_FIELDS = ["name", "description", "brand", "tags"]
+
+_lock = threading.Lock()
+_model = None
+_model_mtime = None
+
+
+class CatalogModel:
+    """
+    ids: product ids, row i of X / neighbours belongs to ids[i]
+    X: sparse TF-IDF matrix (n x vocab), rows are L2-normalized by the vectorizer
+    neighbours: sparse CSR (n x n) holding cosine similarities >= threshold
+    membership: 0/1 CSR with the same pattern plus the diagonal, i.e. the set Q(p)
+    forbidden_index: stemmed token -> sorted array of row indices (name/description/brand/tags)
+    """
+
+    def __init__(self, vectorizer, ids, X, neighbours, threshold=SIM_THRESHOLD, forbidden_index=None):
+        self.vectorizer = vectorizer
+        self.ids = list(ids)
+        self.id_to_idx = {pid: idx for idx, pid in enumerate(self.ids)}
+        self.X = X
+        self.neighbours = neighbours
+        self.membership = neighbour_membership(neighbours)
+        self.forbidden_index = forbidden_index or {}
+        self.threshold = threshold
+        self.format_version = CATALOG_FORMAT_VERSION
+
+    @property
+    def n(self):
+        return len(self.ids)
+
+    def neighbour_row(self, idx):
+        """(indices, similarities) of products whose similarity with idx is >= threshold"""
+        start, end = self.neighbours.indptr[idx], self.neighbours.indptr[idx + 1]
+        return self.neighbours.indices[start:end], self.neighbours.data[start:end]
+
+    def covers(self, product_ids) -> bool:
+        return set(self.ids) == set(product_ids)
+
+    def forbidden_match_counts(self, forbidden_tokens) -> np.ndarray:
+        """Number of distinct forbidden tokens found in each product (aligned with ids)"""
+        counts = np.zeros(self.n, dtype=float)
+        for tok in set(forbidden_tokens or ()):
+            rows = self.forbidden_index.get(tok)
+            if rows is not None:
+                counts[rows] += 1.0
+        return counts
+
+
+# ---------------- ساخت corpus ----------------
+
+def product_tokens(p: Dict) -> List[str]:
+    # اگر products_tokens موجود باشد از آن استفاده کن
+    tok_list = []
+    pt = p.get('products_tokens') or {}
+    if isinstance(pt, dict):
+        if 'tokens' in pt and isinstance(pt['tokens'], list):
+            tok_list = pt['tokens']
+        else:
+            tmp = []
+            for v in pt.values():
+                if isinstance(v, list):
+                    tmp.extend(v)
+            tok_list = tmp
+    elif isinstance(pt, list):
+        tok_list = pt
+    if not tok_list:
+        pieces = []
+        fields = ["name", "description", "brand", "category"]
+        list_fields = ["tags", "suitable_for", "skin_type"]
+        for f in fields:
+            pieces += tokenize(p.get(f, ""), min_len=2)
+        for lf in list_fields:
+            for item_tokens in tokenize_many(p.get(lf) or [], min_len=2):
+                pieces += item_tokens
+        tok_list = pieces
+    return tok_list
+
+
+def build_product_corpus(products: List[Dict]):
+    corpus = []
+    ids = []
+    for p in products:
+        ids.append(p.get('id'))
+        corpus.append(" ".join(product_tokens(p)))
+    return corpus, ids
+
+
+def forbidden_check_tokens(p: Dict) -> List[str]:
+    """Stemmed tokens of name/description/brand/tags, from products_tokens when available"""
+    pt = p.get('products_tokens')
+    if isinstance(pt, dict) and all(isinstance(pt.get(f), list) for f in FORBIDDEN_FIELDS):
+        toks = []
+        for f in FORBIDDEN_FIELDS:
+            toks.extend(pt[f])
+        return toks
+    tags = p.get("tags", [])
+    text_parts = [p.get("name", ""), p.get("description", ""), p.get("brand", "")]
+    text_parts += tags if isinstance(tags, list) else []
+    return tokenize(" ".join([str(x) for x in text_parts if x]), min_len=2)
+
+
+def build_forbidden_index(token_lists) -> Dict[str, np.ndarray]:
+    postings = {}
+    for idx, toks in enumerate(token_lists):
+        for tok in set(toks):
+            postings.setdefault(tok, []).append(idx)
+    return {tok: np.asarray(rows, dtype=np.int64) for tok, rows in postings.items()}
+
+
+def catalog_products_from_db() -> List[Dict]:
+    return list(Product.objects.order_by('id').values(
+        'id', 'name', 'description', 'brand', 'category',
+        'skin_type', 'suitable_for', 'tags', 'products_tokens',
+    ))
+
+
+def _keep_top_k(block, top_k):
+    """Keep the top_k largest entries of every row of a CSR block"""
+    indptr, indices, data = [0], [], []
+    for r in range(block.shape[0]):
+        start, end = block.indptr[r], block.indptr[r + 1]
+        vals, cols = block.data[start:end], block.indices[start:end]
+        if len(vals) > top_k:
+            keep = np.argpartition(-vals, top_k - 1)[:top_k]
+            vals, cols = vals[keep], cols[keep]
+        indices.append(cols)
+        data.append(vals)
+        indptr.append(indptr[-1] + len(vals))
+    return sp.csr_matrix(
+        (np.concatenate(data) if data else [], np.concatenate(indices) if indices else [], indptr),
+        shape=block.shape,
+    )
+
+
+def blocked_similarities(X, threshold=None, top_k=None, block_rows=SIM_BLOCK_ROWS):
+    """
+    Cosine similarities of every row with every row, as a sparse CSR matrix
+    that keeps only entries >= threshold and/or the top_k largest per row.
+    Rows are processed block_rows at a time (block @ Xn.T), so peak memory is
+    about block_rows x n for one block, not n x n.
+    """
+    Xn = normalize(sp.csr_matrix(X, dtype=float))
+    XnT = Xn.T.tocsc()
+    blocks = []
+    for start in range(0, Xn.shape[0], block_rows):
+        block = (Xn[start:start + block_rows] @ XnT).tocsr()
+        if threshold is not None:
+            block.data[block.data < threshold] = 0.0
+            block.eliminate_zeros()
+        if top_k is not None:
+            block = _keep_top_k(block, top_k)
+        blocks.append(block)
+    sims = sp.vstack(blocks, format='csr') if blocks else sp.csr_matrix((0, X.shape[0]))
+    sims.sort_indices()
+    return sims
+
+
+def thresholded_similarities(X, threshold=SIM_THRESHOLD, block_rows=SIM_BLOCK_ROWS):
+    """Cosine similarity of every pair of rows, keeping only entries >= threshold (sparse CSR)"""
+    return blocked_similarities(X, threshold=threshold, block_rows=block_rows)
+
+
+def neighbour_membership(neighbours):
+    """Indicator matrix of Q(p): every product is always a member of its own neighbourhood"""
+    pattern = neighbours.astype(bool).astype(float)
+    return pattern.maximum(sp.identity(neighbours.shape[0], format='csr')).tocsr()
+
+
+def build_catalog_model(products: Optional[List[Dict]] = None, threshold=SIM_THRESHOLD, approximate=None) -> CatalogModel:
+    """
+    approximate: neighbour lists from the MinHash LSH index (recommendation.ann)
+    instead of all pairs; True, or a dict of LSH parameters (bands, rows,
+    max_bucket, seed). Defaults to settings.RECOMMENDATION_APPROXIMATE_NEIGHBOURS
+    """
+    if products is None:
+        products = catalog_products_from_db()
+    if approximate is None:
+        approximate = getattr(settings, 'RECOMMENDATION_APPROXIMATE_NEIGHBOURS', False)
+    corpus, ids = build_product_corpus(products)
+    vectorizer = TfidfVectorizer()
+    with span('tfidf_fit'):
+        X = vectorizer.fit_transform(corpus).tocsr()
+    with span('similarity'):
+        if approximate:
+            from recommendation.ann import approximate_similarities
+            params = approximate if isinstance(approximate, dict) else {}
+            neighbours = approximate_similarities(X, threshold, **params)
+        else:
+            neighbours = thresholded_similarities(X, threshold)
+    forbidden_index = build_forbidden_index(forbidden_check_tokens(p) for p in products)
+    return CatalogModel(vectorizer, ids, X, neighbours, threshold, forbidden_index)
+
+
+# ---------------- به‌روزرسانی افزایشی (بدون fit دوباره) ----------------
+
+def transform_document(model: CatalogModel, text: str):
+    """
+    Vectorize a document with the existing vocabulary/IDF and score it against
+    every catalog row. Returns (row, sims) where sims[i] is the cosine with ids[i].
+    Terms that are not in the vocabulary are ignored until the next full build.
+    """
+    row = model.vectorizer.transform([text]).tocsr()
+    sims = np.asarray((normalize(model.X) @ normalize(row).T).todense()).ravel()
+    return row, sims
+
+
+def upsert_product(model: CatalogModel, pid, row, sims, forbidden_tokens=None) -> CatalogModel:
+    """
+    Return a new CatalogModel where product pid has document row `row` and
+    neighbour similarities `sims` (aligned with the old model.ids).
+    forbidden_tokens: the product's tokens for the forbidden-ingredient index.
+    Cost is O(nnz), no n x n product is computed.
+    """
+    old_n = model.n
+    idx = model.id_to_idx.get(pid)
+    ids = list(model.ids)
+    if idx is None:
+        idx = old_n
+        ids.append(pid)
+        X = sp.vstack([model.X, row]).tocsr()
+        sims = np.append(sims, 0.0)
+    else:
+        X = sp.vstack([model.X[:idx], row, model.X[idx + 1:]]).tocsr()
+    n = len(ids)
+
+    # حذف سطر و ستون قبلی محصول و افزودن همسایه‌های جدید (متقارن)
+    coo = model.neighbours.tocoo()
+    keep = (coo.row != idx) & (coo.col != idx)
+    others = np.flatnonzero(sims >= model.threshold)
+    others = others[others != idx]
+    self_sim = float(normalize(row).multiply(normalize(row)).sum())
+    diag = [idx] if self_sim >= model.threshold else []
+    rows = np.concatenate([coo.row[keep], np.full(len(others), idx), others, diag]).astype(np.int64)
+    cols = np.concatenate([coo.col[keep], others, np.full(len(others), idx), diag]).astype(np.int64)
+    data = np.concatenate([coo.data[keep], sims[others], sims[others], [self_sim] * len(diag)])
+    neighbours = sp.csr_matrix((data, (rows, cols)), shape=(n, n))
+    neighbours.sort_indices()
+
+    forbidden_index = {}
+    for tok, rows in model.forbidden_index.items():
+        rows = rows[rows != idx]
+        if len(rows):
+            forbidden_index[tok] = rows
+    for tok in set(forbidden_tokens or ()):
+        forbidden_index[tok] = np.sort(np.append(forbidden_index.get(tok, np.empty(0, dtype=np.int64)), idx))
+    return CatalogModel(model.vectorizer, ids, X, neighbours, model.threshold, forbidden_index)
+
+
+# ---------------- ذخیره و بارگذاری ----------------
+
+def _catalog_path():
+    return getattr(settings, 'RECOMMENDATION_CATALOG_PATH', None)
+
+
+def save_catalog_model(model: CatalogModel):
+    global _model_mtime
+    path = _catalog_path()
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _model_mtime = os.path.getmtime(path)
+
+
+def load_catalog_model() -> Optional[CatalogModel]:
+    """Load the persisted model into the process cache (no DB access)."""
+    global _model, _model_mtime
+    path = _catalog_path()
+    if not path or not os.path.exists(path):
+        return None
+    with _lock:
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                model = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if getattr(model, 'format_version', None) != CATALOG_FORMAT_VERSION:
+            return None
+        _model, _model_mtime = model, mtime
+    return model
+
+
+def _disk_changed() -> bool:
+    path = _catalog_path()
+    if not path:
+        return False
+    try:
+        return os.path.getmtime(path) != _model_mtime
+    except OSError:
+        # فایل حذف شده یعنی مدل توسط پروسه دیگری باطل شده است
+        return _model_mtime is not None
+
+
+def get_catalog_model(products: Optional[List[Dict]] = None) -> CatalogModel:
+    """
+    Return the shared catalog model. It is reloaded when another process has
+    rewritten the file and rebuilt when it does not cover the given products.
+    """
+    global _model
+    model = _model
+    if model is None or _disk_changed():
+        model = load_catalog_model()
+    if model is not None and (products is None or model.covers([p.get('id') for p in products])):
+        return model
+    with _lock:
+        model = build_catalog_model(products)
+        _model = model
+        save_catalog_model(model)
+    return model
+
+
+def replace_catalog_model(model: CatalogModel):
+    """Install an already updated model (e.g. after upsert_product) and persist it"""
+    global _model
+    with _lock:
+        _model = model
+        save_catalog_model(model)
+
+
+def invalidate_catalog_model():
+    global _model, _model_mtime
+    with _lock:
+        _model = None
+        _model_mtime = None
+        path = _catalog_path()
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
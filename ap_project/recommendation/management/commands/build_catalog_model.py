@@ -0,0 +1,42 @@
+"""
+
+cd ap_project
+python manage.py build_catalog_model
+python manage.py build_catalog_model --ann   # همسایه‌های تقریبی (MinHash LSH) برای کاتالوگ‌های بزرگ
+python manage.py build_catalog_model --ann-bands 96 --ann-max-bucket 1000
+
+"""
+
+from django.core.management.base import BaseCommand
+from recommendation.ann import DEFAULT_BANDS, DEFAULT_MAX_BUCKET, DEFAULT_ROWS
+from recommendation.catalog import build_catalog_model, save_catalog_model, invalidate_catalog_model, SIM_THRESHOLD
+
+
+class Command(BaseCommand):
+    help = "Build the TF-IDF catalog model (vocabulary, document matrix, neighbour lists) used by recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=SIM_THRESHOLD)
+        parser.add_argument('--ann', action='store_true', default=None,
+                            help="Approximate neighbour lists (MinHash LSH) instead of all pairs")
+        # هر کدام از این‌ها --ann را هم روشن می‌کند
+        parser.add_argument('--ann-bands', type=int, help=f"LSH bands (default {DEFAULT_BANDS})")
+        parser.add_argument('--ann-rows', type=int, help=f"LSH rows per band (default {DEFAULT_ROWS})")
+        parser.add_argument('--ann-max-bucket', type=int,
+                            help=f"Skip LSH buckets larger than this, 0 = keep all (default {DEFAULT_MAX_BUCKET})")
+
+    def handle(self, *args, **options):
+        approximate = options['ann']
+        params = {name: options[f'ann_{name}'] for name in ('bands', 'rows', 'max_bucket')
+                  if options[f'ann_{name}'] is not None}
+        if params:
+            if params.get('max_bucket') == 0:
+                params['max_bucket'] = None
+            approximate = params
+        invalidate_catalog_model()
+        model = build_catalog_model(threshold=options['threshold'], approximate=approximate)
+        save_catalog_model(model)
+        self.stdout.write(self.style.SUCCESS(
+            f"Catalog model built: {model.n} products, {len(model.vectorizer.vocabulary_)} terms, "
+            f"{model.neighbours.nnz} neighbour links (>= {model.threshold})"
+        ))
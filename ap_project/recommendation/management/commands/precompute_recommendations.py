@@ -0,0 +1,42 @@
+"""
+
+cd ap_project
+python manage.py precompute_recommendations                       # کاربرانی که ورودی‌هایشان عوض شده
+python manage.py precompute_recommendations --users u1 u2 --top-n 20
+python manage.py precompute_recommendations --workers 4 --jsonl recs.jsonl --force
+
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from recommendation.precompute import default_top_n, precompute_recommendations
+
+
+class Command(BaseCommand):
+    help = ("Precompute the top-N recommendations of every active profile (or --users) in worker processes "
+            "sharing one catalog model, and store them in the PrecomputedRecommendation table")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', nargs='+', metavar='USERNAME', help="Only these usernames")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument('--top-n', type=int, default=None,
+                            help=f"Recommendations stored per user (default: {default_top_n()})")
+        parser.add_argument('--jsonl', metavar='PATH', help="Also write one JSON line per computed user")
+        parser.add_argument('--force', action='store_true',
+                            help="Recompute users whose stored recommendations are still current")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("--workers must be >= 1")
+        if options['top_n'] is not None and options['top_n'] < 1:
+            raise CommandError("--top-n must be >= 1")
+        started = time.perf_counter()
+        stats = precompute_recommendations(
+            usernames=options['users'], workers=options['workers'], top_n=options['top_n'],
+            jsonl_path=options['jsonl'], force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed recommendations for {stats['computed']} users "
+            f"({stats['up_to_date']} up to date) in {time.perf_counter() - started:.1f}s"
+        ))
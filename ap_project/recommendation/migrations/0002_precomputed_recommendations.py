@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_productvisit'),
+        ('products', '0013_product_category_key'),
+        ('recommendation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedRecommendationSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('catalog_version', models.PositiveIntegerField()),
+                ('user_version', models.PositiveIntegerField()),
+                ('season', models.CharField(max_length=10)),
+                ('generated_at', models.CharField(max_length=40)),
+                ('params', models.JSONField(default=dict)),
+                ('complete', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_recommendations', to='accounts.profile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PrecomputedRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('final_score', models.FloatField()),
+                ('entry', models.JSONField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('rec_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='recommendation.precomputedrecommendationset')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('rec_set', 'rank'), name='precomputed_rec_unique_rank')],
+            },
+        ),
+    ]
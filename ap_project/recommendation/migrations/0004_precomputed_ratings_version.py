@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendation', '0003_version_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='precomputedrecommendationset',
+            name='ratings_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
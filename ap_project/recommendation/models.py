@@ -1,4 +1,11 @@
-from django.db import models
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from products.models import Product, Comment
+from accounts.models import Profile, ProductVisit
+from orders.models import OrderItem
 
 class SeasonalKeyword(models.Model):
     season = models.CharField(max_length=50)
@@ -6,3 +13,191 @@ class SeasonalKeyword(models.Model):
 
     def __str__(self):
         return f"{self.season}: {self.keyword}"
+
+
+class VersionCounter(models.Model):
+    """
+    شمارنده نسخه ماندگار (recommendation.cache): catalog و هر کاربر. It is
+    kept in the DB so that every worker process sees a bump, whatever the
+    cache backend is.
+    """
+    name = models.CharField(max_length=200, unique=True)
+    value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+    @classmethod
+    def get_many(cls, *names):
+        """name -> value in one query; a counter that was never bumped is 1"""
+        found = dict(cls.objects.filter(name__in=names).values_list('name', 'value'))
+        return {name: found.get(name, 1) for name in names}
+
+    @classmethod
+    def get(cls, name):
+        return cls.get_many(name)[name]
+
+    @classmethod
+    def bump(cls, name):
+        # UPDATE اتمیک در DB: داخل تراکنش نویسنده، با rollback آن برمی‌گردد
+        if cls.objects.filter(name=name).update(value=F('value') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, value=2)
+        except IntegrityError:
+            # پروسه دیگری همین حالا ساختش
+            cls.objects.filter(name=name).update(value=F('value') + 1)
+
+
+class PrecomputedRecommendationSet(models.Model):
+    """
+    top-N ذخیره‌شده یک کاربر (دستور precompute_recommendations). Versions and
+    season are those of recommendation.cache at compute time; the set is served
+    only while they are still current.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='precomputed_recommendations')
+    catalog_version = models.PositiveIntegerField()
+    user_version = models.PositiveIntegerField()
+    # فقط برای انتخاب کاربران در اجرای بعدی؛ سرو شدن را متوقف نمی‌کند
+    ratings_version = models.PositiveIntegerField(default=1)
+    season = models.CharField(max_length=10)
+    generated_at = models.CharField(max_length=40)
+    params = models.JSONField(default=dict)
+    # همه محصولات eligible در top-N جا شده‌اند (لیست کامل هم از این جدول خوانده می‌شود)
+    complete = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.profile_id} @ {self.catalog_version}/{self.user_version}/{self.season}"
+
+
+class PrecomputedRecommendation(models.Model):
+    rec_set = models.ForeignKey(PrecomputedRecommendationSet, on_delete=models.CASCADE, related_name='items')
+    rank = models.PositiveIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    final_score = models.FloatField()
+    # همان dict خروجی _recommendation_entry
+    entry = models.JSONField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['rec_set', 'rank'], name='precomputed_rec_unique_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.rec_set_id}#{self.rank}: {self.product_id}"
+
+
+# ---------------- باطل کردن catalog model با تغییر محصولات ----------------
+
+@receiver(pre_save, sender=Product)
+def remember_changed_corpus_fields(sender, instance, update_fields=None, **kwargs):
+    """
+    Corpus fields whose value differs from the stored row, kept on the instance
+    for the post_save receivers: a plain save() writes every column, so
+    update_fields alone cannot tell whether the catalog text changed.
+    """
+    from recommendation.catalog import CORPUS_FIELDS
+    fields = CORPUS_FIELDS if update_fields is None else CORPUS_FIELDS.intersection(update_fields)
+    old = {}
+    if instance._state.adding or instance.pk is None:
+        old = None
+    elif fields:
+        old = Product.objects.filter(pk=instance.pk).values(*fields).first()
+    if old is None:
+        # ردیف جدید: همه فیلدها تغییر کرده‌اند
+        instance._changed_corpus_fields = set(fields)
+        return
+    instance._changed_corpus_fields = {f for f in fields if old[f] != getattr(instance, f)}
+
+
+def corpus_changed(instance, created):
+    """متن کاتالوگ در این save عوض شد (نتیجه remember_changed_corpus_fields)"""
+    return created or bool(getattr(instance, '_changed_corpus_fields', True))
+
+
+@receiver(post_save, sender=Product)
+def invalidate_catalog_on_product_save(sender, instance, created, **kwargs):
+    from recommendation.catalog import invalidate_catalog_model
+    if corpus_changed(instance, created):
+        invalidate_catalog_model()
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_on_product_delete(sender, instance, **kwargs):
+    from recommendation.catalog import invalidate_catalog_model
+    invalidate_catalog_model()
+
+
+# ---------------- باطل کردن کش نتایج ریکامندیشن ----------------
+
+# موجودی موقع خواندن فیلتر می‌شود و امتیازها نسخه جدا دارند (recommendation.cache)
+STOCK_AND_RATING_FIELDS = frozenset({'stock', 'rating_sum', 'rating_count', 'avg_rating'})
+
+
+@receiver(post_save, sender=Product)
+def invalidate_recommendations_on_product_save(sender, instance, created, update_fields=None, **kwargs):
+    from recommendation.cache import bump_catalog_version
+    if created or update_fields is None or not STOCK_AND_RATING_FIELDS.issuperset(update_fields):
+        bump_catalog_version()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=SeasonalKeyword)
+@receiver(post_delete, sender=SeasonalKeyword)
+def invalidate_recommendations_on_catalog_change(sender, **kwargs):
+    # قیمت، متن محصولات و کلمات فصلی روی نتیجه همه کاربران اثر دارند
+    from recommendation.cache import bump_catalog_version
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_recommendations_on_comment_change(sender, **kwargs):
+    from recommendation.cache import bump_ratings_version
+    bump_ratings_version()
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_recommendations_on_profile_save(sender, instance, update_fields=None, **kwargs):
+    # user_preferences / keywords
+    from recommendation.cache import bump_user_version
+    if update_fields is None or {'user_preferences', 'keywords'}.intersection(update_fields):
+        bump_user_version(instance.user.username)
+
+
+@receiver(m2m_changed, sender=Profile.favorites.through)
+def invalidate_recommendations_on_favorites_change(sender, instance, action, reverse, pk_set, **kwargs):
+    from recommendation.cache import bump_user_version
+    if not reverse:
+        if action.startswith('post_'):
+            bump_user_version(instance.user.username)
+        return
+    # تغییر از سمت محصول (product.favorited_by)
+    if action in ('post_add', 'post_remove'):
+        profiles = Profile.objects.filter(pk__in=pk_set or [])
+    elif action == 'pre_clear':
+        profiles = instance.favorited_by.all()
+    else:
+        return
+    for username in profiles.values_list('user__username', flat=True):
+        bump_user_version(username)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_recommendations_on_order_item_change(sender, instance, **kwargs):
+    from recommendation.cache import bump_user_version
+    try:
+        bump_user_version(instance.order.user.username)
+    except ObjectDoesNotExist:
+        pass
+
+
+@receiver(post_save, sender=ProductVisit)
+def invalidate_recommendations_on_visit(sender, instance, created, **kwargs):
+    # حذف بازدیدها (clear_visited_items) خودش نسخه کاربر را بالا می‌برد تا delete سریع بماند
+    from recommendation.cache import bump_user_version
+    username = Profile.objects.filter(pk=instance.user_id).values_list('user__username', flat=True).first()
+    bump_user_version(username)
@@ -0,0 +1,166 @@
+"""
+پیش‌محاسبه آفلاین top-N ریکامندیشن برای همه کاربران (جدول PrecomputedRecommendation)
+
+`python manage.py precompute_recommendations` scores every active profile (or
+the given usernames) in a pool of worker processes. The parent loads the
+catalog product dicts and the catalog model once before the pool is forked,
+so the workers share them copy-on-write instead of each rebuilding them; only
+the per-user inputs (visits, purchases, preferences) are read per task. The
+parent writes the results.
+
+Each stored set carries the catalog/user versions and season of
+recommendation.cache that were current when its inputs were read. Those
+versions are VersionCounter rows, bumped in the same database by every
+change to the user's inputs or the catalog. A later run skips users whose
+versions are unchanged. The request path (cache.get_precomputed_recommendations)
+serves a set only while they are still current, whichever process made the
+change.
+
+Sets are stock-free (the only_in_stock preference is applied on read) and
+also store the ratings version. A comment does not stop a set from being
+served, but the next run recomputes it.
+"""
+
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from recommendation.cache import get_catalog_version, get_ratings_version, get_user_versions
+from recommendation.catalog import get_catalog_model
+from recommendation.views import (
+    build_products_from_db, build_purchases_from_db, catalog_product_dicts, current_season_key,
+    eligible_mask, get_user_preferences_from_db, recommendations_output, score_all_products, top_k_indices,
+)
+
+# داده‌های مشترک کاتالوگ؛ قبل از fork در پروسه والد پر می‌شود
+_catalog_products: Optional[List[Dict]] = None
+
+
+def default_top_n() -> int:
+    return getattr(settings, 'RECOMMENDATION_PRECOMPUTE_TOP_N', 50)
+
+
+def users_to_precompute(usernames: Optional[Iterable[str]] = None, force=False) -> Tuple[List[str], int]:
+    """
+    (usernames to compute, number of selected profiles): active profiles,
+    optionally only `usernames`, whose stored set is missing or stale.
+    """
+    from accounts.models import Profile
+    profiles = Profile.objects.filter(user__is_active=True)
+    if usernames:
+        profiles = profiles.filter(user__username__in=list(usernames))
+    rows = list(profiles.order_by('id').values_list(
+        'user__username',
+        'precomputed_recommendations__catalog_version',
+        'precomputed_recommendations__user_version',
+        'precomputed_recommendations__ratings_version',
+        'precomputed_recommendations__season',
+    ))
+    if force:
+        return [row[0] for row in rows], len(rows)
+    catalog_v, ratings_v, season = get_catalog_version(), get_ratings_version(), current_season_key()
+    user_versions = get_user_versions(row[0] for row in rows)
+    stale = [username for username, *stored in rows
+             if tuple(stored) != (catalog_v, user_versions[username], ratings_v, season)]
+    return stale, len(rows)
+
+
+def compute_user(task) -> Dict:
+    """Worker: top-N output for one user plus the versions it was computed against"""
+    username, catalog_v, user_v, ratings_v, season, top_n = task
+    products = build_products_from_db(user_id=username, catalog_products=_catalog_products)
+    purchases = build_purchases_from_db(user_id=username)
+    user_prefs, keywords = get_user_preferences_from_db(user_id=username)
+    scored = score_all_products(products, purchases, user_prefs or {}, keywords or {}, user_id=username)
+    # بدون فیلتر موجودی؛ only_in_stock موقع خواندن اعمال می‌شود
+    eligible = eligible_mask(scored, only_in_stock=False)
+    indices = top_k_indices(scored, top_n, only_in_stock=False)
+    return {
+        "user": username,
+        "catalog_version": catalog_v,
+        "user_version": user_v,
+        "ratings_version": ratings_v,
+        "season": season,
+        "complete": len(indices) == int(eligible.sum()),
+        "output": recommendations_output(scored, indices),
+    }
+
+
+def save_user_result(result: Dict):
+    from accounts.models import Profile
+    from recommendation.models import PrecomputedRecommendation, PrecomputedRecommendationSet
+    output = result["output"]
+    with transaction.atomic():
+        profile = Profile.objects.filter(user__username=result["user"]).first()
+        if profile is None:
+            return
+        rec_set, _ = PrecomputedRecommendationSet.objects.update_or_create(profile=profile, defaults={
+            "catalog_version": result["catalog_version"],
+            "user_version": result["user_version"],
+            "ratings_version": result["ratings_version"],
+            "season": result["season"],
+            "generated_at": output["generated_at"],
+            "params": output["params"],
+            "complete": result["complete"],
+        })
+        rec_set.items.all().delete()
+        PrecomputedRecommendation.objects.bulk_create([
+            PrecomputedRecommendation(rec_set=rec_set, rank=rank, product_id=entry["product_id"],
+                                      final_score=entry["final_score"], entry=entry)
+            for rank, entry in enumerate(output["recommendations"])
+        ])
+
+
+def _init_worker():
+    # اتصال‌های DB بعد از fork مشترک نمی‌شوند؛ والد قبل از fork آن‌ها را بسته است
+    connections.close_all()
+
+
+def _write_results(results, jsonl=None) -> int:
+    written = 0
+    for result in results:
+        save_user_result(result)
+        if jsonl is not None:
+            jsonl.write(json.dumps(result["output"], ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+
+def precompute_recommendations(usernames=None, workers=None, top_n=None, jsonl_path=None, force=False,
+                               chunksize=8) -> Dict[str, int]:
+    global _catalog_products
+    top_n = default_top_n() if top_n is None else top_n
+    todo, selected = users_to_precompute(usernames, force=force)
+    catalog_v, ratings_v, season = get_catalog_version(), get_ratings_version(), current_season_key()
+    # نسخه‌ها قبل از خواندن ورودی‌ها گرفته می‌شوند: تغییر حین اجرا نتیجه را stale نگه می‌دارد
+    user_versions = get_user_versions(todo)
+    tasks = [(username, catalog_v, user_versions[username], ratings_v, season, top_n) for username in todo]
+    if not tasks:
+        return {"computed": 0, "up_to_date": selected}
+
+    _catalog_products = catalog_product_dicts()
+    get_catalog_model(_catalog_products)
+
+    workers = min(workers or multiprocessing.cpu_count(), len(tasks))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # بدون fork مدل مشترک به worker نمی‌رسد؛ همان پروسه محاسبه می‌کند
+        workers = 1
+
+    jsonl = open(jsonl_path, 'w', encoding='utf-8') if jsonl_path else None
+    try:
+        if workers > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                     initializer=_init_worker) as pool:
+                computed = _write_results(pool.map(compute_user, tasks, chunksize=chunksize), jsonl)
+        else:
+            computed = _write_results(map(compute_user, tasks), jsonl)
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+        _catalog_products = None
+    return {"computed": computed, "up_to_date": selected - len(tasks)}
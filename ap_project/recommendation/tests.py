@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from cart.checkout import checkout_cart
+from cart.models import Cart, CartItem
+from products.models import Product
+from recommendation.cache import get_precomputed_recommendations
+from recommendation.catalog import invalidate_catalog_model
+from recommendation.precompute import precompute_recommendations, users_to_precompute
+
+
+def make_product(name, category='آبرسان'):
+    return Product.objects.create(
+        name=name, brand='برند', category=category, description='کرم مرطوب کننده پوست خشک',
+        skin_type='خشک', concerns_targeted='', price=100000, stock=5,
+    )
+
+
+@override_settings(RECOMMENDATION_CATALOG_PATH=None)
+class PrecomputedRecommendationTests(TestCase):
+    def setUp(self):
+        invalidate_catalog_model()
+        self.product = make_product('کرم آبرسان')
+        make_product('ضدآفتاب روزانه', category='ضدآفتاب')
+        self.user = User.objects.create_user(username='reader', password='testpass')
+
+    def tearDown(self):
+        invalidate_catalog_model()
+
+    def test_preference_change_stops_serving_the_precomputed_set(self):
+        precompute_recommendations(workers=1)
+        self.assertIsNotNone(get_precomputed_recommendations('reader', k=1))
+        self.assertEqual(users_to_precompute()[0], [])
+
+        # پروسه دیگری ترجیحات را تغییر می‌دهد: کش این پروسه چیزی از آن نمی‌داند
+        cache.clear()
+        profile = self.user.profile
+        profile.user_preferences = {'skin_type': 'چرب'}
+        profile.save()
+        cache.clear()
+
+        self.assertIsNone(get_precomputed_recommendations('reader', k=1))
+        self.assertEqual(users_to_precompute()[0], ['reader'])
+
+    def test_checkout_does_not_invalidate_other_users_sets(self):
+        buyer = User.objects.create_user(username='buyer', password='testpass')
+        precompute_recommendations(workers=1)
+        CartItem.objects.create(cart=Cart.objects.create(user=buyer), product=self.product, quantity=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = checkout_cart(buyer)
+        self.assertIsNotNone(result.order)
+        cache.clear()
+
+        self.assertIsNotNone(get_precomputed_recommendations('reader', k=1))
+        self.assertEqual(users_to_precompute()[0], ['buyer'])
+
+    def test_only_in_stock_is_applied_to_the_precomputed_set_on_read(self):
+        profile = self.user.profile
+        profile.user_preferences = {'only_in_stock': True}
+        profile.save()
+        precompute_recommendations(workers=1)
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        output = get_precomputed_recommendations('reader')
+        self.assertNotIn(self.product.pk, [entry['product_id'] for entry in output['recommendations']])
+        self.assertEqual(users_to_precompute()[0], [])
+
+
+class CatalogModelInvalidationTests(TestCase):
+    def setUp(self):
+        self.product = make_product('کرم آبرسان')
+
+    def test_save_without_corpus_change_keeps_the_catalog_model(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = 120000
+        with mock.patch('recommendation.catalog.invalidate_catalog_model') as invalidate:
+            product.save()
+        invalidate.assert_not_called()
+
+    def test_corpus_change_invalidates_the_catalog_model(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.description = 'ضدآفتاب مناسب پوست چرب'
+        with mock.patch('recommendation.catalog.invalidate_catalog_model') as invalidate:
+            product.save()
+        invalidate.assert_called_once()
@@ -0,0 +1,86 @@
+"""
+پردازش متن فارسی با Hazm (مشترک بین ریکامندیشن، کوئیز، دستورات مدیریتی و Test/)
+
+Normalizer -> حذف علائم -> word_tokenize -> Stemmer
+Regexes are compiled once, stems are kept in a bounded LRU cache keyed by
+token and short strings (tags, categories, skin types, ...) keep their raw
+tokenization cached as well, since the cosmetics vocabulary is small and
+highly repetitive. No Django imports, so standalone scripts can use it too.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+from hazm import Normalizer, word_tokenize, Stemmer
+
+STEM_CACHE_SIZE = 50_000
+SHORT_TEXT_CACHE_SIZE = 10_000
+SHORT_TEXT_MAX_LEN = 64
+
+normalizer = Normalizer()
+stemmer = Stemmer()
+
+_NON_WORD_RE = re.compile(r"[^\w\s؀-ۿ]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text, clean: bool = True) -> str:
+    """Hazm normalization; with clean=True punctuation is dropped and spaces collapsed"""
+    if not text:
+        return ""
+    s = normalizer.normalize(str(text))
+    if clean:
+        s = _NON_WORD_RE.sub(" ", s)
+        s = _SPACES_RE.sub(" ", s).strip()
+    return s
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(token: str) -> str:
+    return stemmer.stem(token)
+
+
+def _raw_tokens_uncached(text: str, clean: bool):
+    s = normalize_text(text, clean=clean)
+    if not s:
+        return ()
+    return tuple(word_tokenize(s))
+
+
+_raw_tokens_cached = lru_cache(maxsize=SHORT_TEXT_CACHE_SIZE)(_raw_tokens_uncached)
+
+
+def raw_tokens(text, clean: bool = True):
+    text = str(text)
+    if len(text) <= SHORT_TEXT_MAX_LEN:
+        return _raw_tokens_cached(text, clean)
+    return _raw_tokens_uncached(text, clean)
+
+
+def tokenize(text, do_stem: bool = True, min_len: int = 1, clean: bool = True, alpha_only: bool = False) -> List[str]:
+    """
+    min_len: توکن‌های کوتاه‌تر از این طول (قبل از stem) حذف می‌شوند
+    alpha_only: فقط توکن‌های حرفی (مثل استخراج کلمات کلیدی کوئیز)
+    """
+    if not text:
+        return []
+    toks = [t for t in raw_tokens(text, clean=clean) if len(t) >= min_len and t.strip() != ""]
+    if alpha_only:
+        toks = [t for t in toks if t.isalpha()]
+    if do_stem:
+        toks = [stem(t) for t in toks]
+    return toks
+
+
+def tokenize_many(texts: Iterable, **kwargs) -> List[List[str]]:
+    """tokenize() for a batch of texts; repeated texts are processed once"""
+    texts = list(texts)
+    done = {}
+    out = []
+    for text in texts:
+        key = str(text) if text else ""
+        if key not in done:
+            done[key] = tokenize(text, **kwargs)
+        out.append(list(done[key]))
+    return out
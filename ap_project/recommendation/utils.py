@@ -13,14 +13,11 @@ django.setup()
 
 def compute_product_score(user, product_id):
     # Import the scoring logic from recommendation.views (or wherever the main logic is)
-    from recommendation.views import build_products_from_db, build_purchases_from_db, get_user_preferences_from_db, compute_recommendations
-    products = build_products_from_db(user_id=user)
-    purchases = build_purchases_from_db(user_id=user)
-    user_prefs, keywords = get_user_preferences_from_db(user_id=user)
-    recs = compute_recommendations(products, purchases, user_prefs or {}, keywords or {}, user_id=user)
-    for r in recs['recommendations']:
-        if str(r['product_id']) == str(product_id):
-            return r.get('final_score', None)
+    from recommendation.cache import get_user_scores
+    scored = get_user_scores(user)
+    for idx, pid in enumerate(scored['ids']):
+        if str(pid) == str(product_id):
+            return float(scored['final_score'][idx]) if scored['eligible'][idx] else None
     return None
 
 def application(environ, start_response):
@@ -16,23 +16,23 @@ import random
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from hazm import Normalizer, word_tokenize, Stemmer
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+from ap_project.performance import span
 
 # مدل‌ها - مسیر‌ها را بر اساس پروژه‌تان تنظیم کنید
-from products.models import Product
-from accounts.models import Profile
+from products.models import Product, normalize_category
+from accounts.models import Profile, ProductVisit, format_visit_time
 from orders.models import OrderItem
 from recommendation.models import SeasonalKeyword
-from products.models import Comment
+from recommendation.catalog import get_catalog_model, forbidden_check_tokens, SIM_THRESHOLD
+from recommendation.scoring import score_components
+from recommendation.text_processing import tokenize
 
 random.seed(12345)
-normalizer = Normalizer()
-stemmer = Stemmer()
 
 # -- پارامترها (همان‌هایی که در recommendation_pipeline.py بودند)
-SIM_THRESHOLD = 0.4
 KAPPA = 1.0
 HALF_LIFE_VISITS = 14.0
 HALF_LIFE_BUY = 60.0
@@ -82,15 +82,7 @@ def days_between(now_dt, past_dt):
 
 
 def normalize_and_tokenize(text: str) -> List[str]:
-    if not text:
-        return []
-    s = normalizer.normalize(str(text))
-    import re
-    s = re.sub(r"[^\w\s\u0600-\u06FF]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    toks = word_tokenize(s)
-    toks = [stemmer.stem(t) for t in toks if len(t) > 1]
-    return toks
+    return tokenize(text, min_len=2)
 
 
 def safe_cosine(a: np.ndarray, b: np.ndarray) -> float:
@@ -131,15 +123,10 @@ def compute_budget_penalty(price, budget_range, scale=0.2, cap=0.12):
 
 
 def compute_forbidden_penalty_for_product(product: Dict, forbidden_tokens_set: set, per_match=FORBIDDEN_PER_MATCH, cap=FORBIDDEN_PENALTY_CAP) -> float:
+    """Single-product version of the forbidden_index lookup in score_all_products"""
     if not forbidden_tokens_set:
         return 0.0
-    text_parts = []
-    text_parts.append(product.get("name", ""))
-    text_parts.append(product.get("description", ""))
-    text_parts.append(product.get("brand", ""))
-    text_parts += product.get("tags", []) if isinstance(product.get("tags", []), list) else []
-    full_text = " ".join([str(x) for x in text_parts if x])
-    prod_tokens = set(normalize_and_tokenize(full_text))
+    prod_tokens = set(forbidden_check_tokens(product))
     matches_set = prod_tokens.intersection(forbidden_tokens_set)
     matches = len(matches_set)
     if matches <= 0:
@@ -149,24 +136,9 @@ def compute_forbidden_penalty_for_product(product: Dict, forbidden_tokens_set: s
 
 # ---------------- تبدیل داده‌های DB به ساختار products.json-like ----------------
 
-def build_products_from_db(user_id=USER_ID_DEFAULT) -> List[Dict]:
+def catalog_product_dicts() -> List[Dict]:
+    """User-independent part of build_products_from_db (visit_times left empty)"""
     products = []
-    # جمع‌آوری visited items از profile
-    try:
-        profile = Profile.objects.get(user__username=user_id)
-        visited = profile.visited_items or []
-    except Profile.DoesNotExist:
-        visited = []
-
-    # map product_id -> list[visit_time]
-    visits_map = {}
-    for item in visited:
-        pid = item.get('product_id')
-        vt = item.get('visit_time')
-        if pid is None or vt is None:
-            continue
-        visits_map.setdefault(pid, []).append(vt)
-
     for p in Product.objects.all():
         # برخی فیلدها ممکن است از نوع JSONField در مدل باشند
         prod = {
@@ -174,6 +146,7 @@ def build_products_from_db(user_id=USER_ID_DEFAULT) -> List[Dict]:
             "name": getattr(p, 'name', '') or '',
             "brand": getattr(p, 'brand', '') or '',
             "category": getattr(p, 'category', '') or '',
+            "category_key": getattr(p, 'category_key', '') or '',
             "description": getattr(p, 'description', '') or '',
             "skin_type": getattr(p, 'skin_type', '') or '',
             "suitable_for": getattr(p, 'suitable_for', []) or [],
@@ -186,14 +159,30 @@ def build_products_from_db(user_id=USER_ID_DEFAULT) -> List[Dict]:
             "similar_products": getattr(p, 'similar_products', []),
             "similarity_threshold": getattr(p, 'similarity_threshold', SIM_THRESHOLD),
             "currency": getattr(p, 'currency', 'IRR'),
-            # visit_times from profile.visited_items
-            "visit_times": visits_map.get(getattr(p, 'id'), [])
+            "visit_times": [],
         }
         # اگر favorites relation exists on Profile we can't know per-user here; keep false
         products.append(prod)
     return products
 
 
+def build_products_from_db(user_id=USER_ID_DEFAULT, catalog_products=None) -> List[Dict]:
+    """
+    catalog_products: output of catalog_product_dicts() to reuse across users
+    (batch precompute); loaded from the DB when None.
+    """
+    # map product_id -> list[visit_time] از جدول بازدیدها (ایندکس user, visited_at)
+    visits_map = {}
+    visits = ProductVisit.objects.filter(user__user__username=user_id).order_by('visited_at', 'id')
+    for pid, visited_at in visits.values_list('product_id', 'visited_at'):
+        visits_map.setdefault(pid, []).append(format_visit_time(visited_at))
+
+    if catalog_products is None:
+        catalog_products = catalog_product_dicts()
+    # visit_times from ProductVisit
+    return [dict(p, visit_times=visits_map.get(p["id"], [])) for p in catalog_products]
+
+
 def build_purchases_from_db(user_id=USER_ID_DEFAULT) -> List[Dict]:
     recs = []
     q = OrderItem.objects.filter(order__user__username=user_id)
@@ -220,6 +209,16 @@ def get_user_preferences_from_db(user_id=USER_ID_DEFAULT) -> Dict:
     except Profile.DoesNotExist:
         return {}, {}
 
+def current_season_key(now=None) -> str:
+    month = (now or datetime.utcnow()).month
+    if month in (3, 4, 5):
+        return "spring"
+    elif month in (6, 7, 8):
+        return "summer"
+    elif month in (9, 10, 11):
+        return "autumn"
+    return "winter"
+
 # ---------------- اصلی: همان محاسباتِ recommendation_pipeline.py اما بدون I/O فایل ----------------
 WEAK_WORDS = ["نباشد", "نیست", "نیابد"]
 
@@ -238,72 +237,34 @@ def extract_u_test_vec_from_db(keywords, user_prefs, products, vectorizer):
     # اگر چیزی داریم تبدیلش به وکتور TF-IDF
     if u_text_parts:
         u_text = " ".join(u_text_parts)
-        u_test_vec = vectorizer.transform([u_text]).toarray().ravel()
+        u_test_vec = vectorizer.transform([u_text]).tocsr()
     else:
-        u_test_vec = np.zeros(len(vectorizer.get_feature_names_out()), dtype=float)
+        u_test_vec = sp.csr_matrix((1, len(vectorizer.vocabulary_)), dtype=float)
 
     return u_test_vec, forbidden
 
-def compute_recommendations(products: List[Dict], purchases: List[Dict], user_prefs: Dict, keywords: Dict, user_id=USER_ID_DEFAULT) -> Dict:
-    # ساخت corpus و tfidf
-    def build_product_corpus_local(products_list: List[Dict]):
-        corpus = []
-        ids = []
-        for p in products_list:
-            pid = p.get('id')
-            ids.append(pid)
-            # اگر products_tokens موجود باشد از آن استفاده کن
-            tok_list = []
-            pt = p.get('products_tokens') or {}
-            if isinstance(pt, dict):
-                if 'tokens' in pt and isinstance(pt['tokens'], list):
-                    tok_list = pt['tokens']
-                else:
-                    tmp = []
-                    for v in pt.values():
-                        if isinstance(v, list):
-                            tmp.extend(v)
-                    tok_list = tmp
-            elif isinstance(pt, list):
-                tok_list = pt
-            if not tok_list:
-                pieces = []
-                fields = ["name", "description", "brand", "category"]
-                list_fields = ["tags", "suitable_for", "skin_type"]
-                for f in fields:
-                    pieces += normalize_and_tokenize(p.get(f, ""))
-                for lf in list_fields:
-                    for item in (p.get(lf) or []):
-                        pieces += normalize_and_tokenize(item)
-                tok_list = pieces
-            corpus.append(" ".join(tok_list))
-        return corpus, ids
-
-    corpus, ids = build_product_corpus_local(products)
-    vectorizer = TfidfVectorizer()
-    X = vectorizer.fit_transform(corpus)
-    id_to_idx = {pid: idx for idx, pid in enumerate(ids)}
+@span('scoring')
+def score_all_products(products: List[Dict], purchases: List[Dict], user_prefs: Dict, keywords: Dict, user_id=USER_ID_DEFAULT) -> Dict:
+    """
+    امتیاز همه محصولات برای کاربر به صورت آرایه (بدون مرتب‌سازی و ساخت خروجی)؛
+    compute_recommendations و top_k_recommendations خروجی را از این ساختار می‌سازند.
+    """
+    # مدل کاتالوگ (tfidf + همسایه‌ها) یک بار ساخته و بین درخواست‌ها به اشتراک گذاشته می‌شود
+    model = get_catalog_model(products)
+    vectorizer = model.vectorizer
+    X = model.X
+    id_to_idx = model.id_to_idx
     idx_to_id = {idx: pid for pid, idx in id_to_idx.items()}
-    n = len(ids)
-    sim_matrix = cosine_similarity(X, X)
+    n = model.n
 
     # build u_test_vec from keywords or user_prefs
     u_test_vec, forbidden_tokens_set = extract_u_test_vec_from_db(keywords, user_prefs, products, vectorizer)
 
     # season: choose based on current date (UTC)
-    now = datetime.utcnow()
-    month = now.month
-    if month in (3, 4, 5):
-        season_key = "spring"
-    elif month in (6, 7, 8):
-        season_key = "summer"
-    elif month in (9, 10, 11):
-        season_key = "autumn"
-    else:
-        season_key = "winter"
+    season_key = current_season_key()
     season_kw_list = list(SeasonalKeyword.objects.filter(season=season_key).values_list('keyword', flat=True))
     s_text = " ".join(season_kw_list)
-    s_season_vec = vectorizer.transform([s_text]).toarray().ravel() if s_text else np.zeros(X.shape[1], dtype=float)
+    s_season_vec = vectorizer.transform([s_text]).tocsr() if s_text else sp.csr_matrix((1, X.shape[1]), dtype=float)
     # visits
     W_visit = np.zeros(n, dtype=float)
     now_for_decay = datetime(2025, 8, 31, 23, 59, 59)
@@ -325,29 +286,18 @@ def compute_recommendations(products: List[Dict], purchases: List[Dict], user_pr
         W_visit[idx] = math.log(1 + wsum)
     W_visit_total = float(W_visit.sum())
 
+    # پروفایل بازدید: جمع وزن‌دار سطرهای X با یک ضرب sparse (بردار sparse روی vocabulary)
     if W_visit_total > 0:
-        V_user_vec = np.zeros(X.shape[1], dtype=float)
-        for idx in range(n):
-            if W_visit[idx] > 0:
-                V_user_vec += (W_visit[idx] * X[idx].toarray().ravel())
-        norm = np.linalg.norm(V_user_vec)
-        if norm > 0:
-            V_user_vec = V_user_vec / norm
+        V_user_vec = normalize(sp.csr_matrix(W_visit) @ X)
     else:
-        V_user_vec = np.zeros(X.shape[1], dtype=float)
+        V_user_vec = sp.csr_matrix((1, X.shape[1]), dtype=float)
 
     # ratings & favs
-    pid_to_rating = {}
-    for c in Comment.objects.all():
-        pid = c.product_id
-        pid_to_rating.setdefault(pid, []).append(c.rating)
-
-    for pid, ratings in pid_to_rating.items():
-        pid_to_rating[pid] = sum(ratings) / len(ratings)  # میانگین
+    # میانگین امتیاز نظرات از ستون‌های نگهداری‌شده روی Product
+    pid_to_rating = dict(Product.objects.filter(rating_count__gt=0).values_list('id', 'avg_rating'))
 
     r_norm = np.zeros(n, dtype=float)
     fav_flags = np.zeros(n, dtype=int)
-    total_user_favs = 0
     for p in products:
         if p['id'] not in id_to_idx:
             continue
@@ -356,7 +306,6 @@ def compute_recommendations(products: List[Dict], purchases: List[Dict], user_pr
         r_norm[idx] = max(0.0, min(1.0, (float(rating) - 1.0) / 4.0))
         if p.get('is_favorite'):
             fav_flags[idx] = 1
-            total_user_favs += 1
 
     # purchases weights
     W_buy = np.zeros(n, dtype=float)
@@ -374,7 +323,6 @@ def compute_recommendations(products: List[Dict], purchases: List[Dict], user_pr
         delta_days = days_between(now_for_decay, dt)
         w = qty * math.exp(-LAMBDA_BUY * delta_days)
         W_buy[id_to_idx[pid]] += w
-    W_buy_total = float(W_buy.sum())
 
     # budget
     budget_choice = user_prefs.get('budget', None) if user_prefs else None
@@ -400,107 +348,54 @@ def compute_recommendations(products: List[Dict], purchases: List[Dict], user_pr
 
     product_map = {p["id"]: p for p in products}
 
-    # compute per-product scores
-    results = []
+    # compute all score components at once (sparse neighbours x vectors)
+    comps = score_components(model, u_test_vec, s_season_vec, V_user_vec, W_visit, W_buy, fav_flags, r_norm, KAPPA)
+    score_base_all = (W_T * comps["T"] + W_S * comps["S"] + W_VSIM * comps["V_sim"]
+                      + W_VRATIO * comps["ratio_visit"] + W_R * comps["R_Q"])
+    score_prime_all = score_base_all * (1.0 + BETA_FAV * comps["ratio_fav"]) * (1.0 + BETA_BUY * comps["ratio_buy"])
+
+    # penalties (per product, cheap)
+    present = np.zeros(n, dtype=bool)
+    eligible = np.zeros(n, dtype=bool)
+    budget_penalty_all = np.zeros(n, dtype=float)
+    forbidden_penalty_all = np.zeros(n, dtype=float)
+    final_all = np.zeros(n, dtype=float)
+    meta = [None] * n
+    # مواد ممنوعه: چند lookup در ایندکس معکوس catalog model به جای توکنایز همه محصولات
+    if forbidden_tokens_set:
+        match_counts = model.forbidden_match_counts(forbidden_tokens_set)
+        forbidden_penalty_all = np.clip(FORBIDDEN_PER_MATCH * match_counts, 0.0, FORBIDDEN_PENALTY_CAP)
     for idx in range(n):
         pid = idx_to_id[idx]
         p = product_map.get(pid)
         if not p:
             continue
-        v_p = X[idx].toarray().ravel()
-        sims = sim_matrix[idx]
-        q_idx = [j for j in range(n) if sims[j] >= SIM_THRESHOLD]
-        if idx not in q_idx:
-            q_idx.append(idx)
-        T_p = safe_cosine(u_test_vec, v_p)
-        S_p = safe_cosine(s_season_vec, v_p)
-        V_sim_p = safe_cosine(V_user_vec, v_p) if np.linalg.norm(V_user_vec) > 0 else 0.0
-        if W_visit_total > 0:
-            numerator = sum(W_visit[q] for q in q_idx)
-            ratio_visit_p = numerator / (W_visit_total + KAPPA)
-        else:
-            ratio_visit_p = 0.0
-        denom_R = sum(sim_matrix[idx][q] for q in q_idx)
-        if denom_R > 0:
-            R_Q_p = sum(sim_matrix[idx][q] * r_norm[q] for q in q_idx) / denom_R
-        else:
-            R_Q_p = 0.0
-                    
-        count_fav_in_Q = sum(int(fav_flags[q]) for q in q_idx)
-        ratio_fav_p = (count_fav_in_Q / (total_user_favs + KAPPA)) if total_user_favs > 0 else 0.0
-        ratio_buy_p = (sum(W_buy[q] for q in q_idx) / (W_buy_total + KAPPA)) if W_buy_total > 0 else 0.0
-        score_base = (W_T * T_p + W_S * S_p + W_VSIM * V_sim_p + W_VRATIO * ratio_visit_p + W_R * R_Q_p)
-        score_prime = score_base * (1.0 + BETA_FAV * ratio_fav_p) * (1.0 + BETA_BUY * ratio_buy_p)
-        budget_penalty = 0.0
+        present[idx] = True
+        score_prime = float(score_prime_all[idx])
         if budget_range_for_scoring:
             price = p.get('price', None)
-            budget_penalty = compute_budget_penalty(price, budget_range_for_scoring, scale=0.2, cap=0.12)
-            score_prime = score_prime * (1.0 - budget_penalty)
-        forbidden_penalty = compute_forbidden_penalty_for_product(p, forbidden_tokens_set, per_match=FORBIDDEN_PER_MATCH, cap=FORBIDDEN_PENALTY_CAP)
-        score_prime = score_prime * (1.0 - forbidden_penalty)
-        final_score = max(0.0, min(1.0, score_prime))
-        results.append({
-            "product_id": pid,
-            "index": idx,
-            "T": T_p,
-            "S": S_p,
-            "V_sim": V_sim_p,
-            "ratio_visit": ratio_visit_p,
-            "R_Q": R_Q_p,
-            "ratio_fav": ratio_fav_p,
-            "ratio_buy": ratio_buy_p,
-            "score_base": score_base,
-            "budget_penalty": budget_penalty,
-            "forbidden_penalty": forbidden_penalty,
-            "final_score": final_score
-        })
-
-    # hard filters
-    filtered = []
-    for r in results:
-        pid = r['product_id']
-        p = product_map.get(pid)
-        if not p:
-            continue
-        price = p.get('price', None)
-        if brand_pref and isinstance(brand_pref, str) and brand_pref != "برند مهم نیست":
-            if p.get('brand') != brand_pref:
-                continue
-        if only_in_stock and p.get('stock', 0) <= 0:
-            continue
-        filtered.append(r)
-    if not filtered:
-        filtered = results
-
-    filtered.sort(key=lambda x: x['final_score'], reverse=True)
-    out_list = []
-    for r in filtered:
-        pid = r['product_id']
-        p = product_map.get(pid)
-        if not p:
-            continue
-        out_list.append({
-            "product_id": pid,
+            budget_penalty_all[idx] = compute_budget_penalty(price, budget_range_for_scoring, scale=0.2, cap=0.12)
+            score_prime = score_prime * (1.0 - budget_penalty_all[idx])
+        score_prime = score_prime * (1.0 - forbidden_penalty_all[idx])
+        final_all[idx] = max(0.0, min(1.0, score_prime))
+        meta[idx] = {
             "name": p.get('name'),
             "brand": p.get('brand'),
             "category": p.get('category'),
+            "category_key": p.get('category_key') or normalize_category(p.get('category')),
             "price": p.get('price'),
             "currency": p.get('currency'),
-            "final_score": r['final_score'],
-            "details": {
-                "T": r['T'],
-                "S": r['S'],
-                "V_sim": r['V_sim'],
-                "ratio_visit": r['ratio_visit'],
-                "R_Q": r['R_Q'],
-                "ratio_fav": r['ratio_fav'],
-                "ratio_buy": r['ratio_buy'],
-                "budget_penalty": r.get('budget_penalty', 0.0),
-                "forbidden_penalty": r.get('forbidden_penalty', 0.0)
-            }
-        })
+            "stock": p.get('stock', 0),
+        }
+
+        # hard filters
+        if brand_pref and isinstance(brand_pref, str) and brand_pref != "برند مهم نیست":
+            if p.get('brand') != brand_pref:
+                continue
+        # only_in_stock موقع خواندن با موجودی فعلی اعمال می‌شود (eligible_mask)
+        eligible[idx] = True
 
-    output = {
+    return {
         "generated_at": datetime.utcnow().isoformat() + "Z",
         "user": user_id,
         "params": {
@@ -513,24 +408,157 @@ def compute_recommendations(products: List[Dict], purchases: List[Dict], user_pr
             "season_used": season_key,
             "season_keywords": season_kw_list,
             "forbidden_penalty_cap": FORBIDDEN_PENALTY_CAP,
-            "forbidden_per_match": FORBIDDEN_PER_MATCH
+            "forbidden_per_match": FORBIDDEN_PER_MATCH,
+            "only_in_stock": bool(only_in_stock),
         },
-        "recommendations": out_list
+        "ids": [idx_to_id[idx] for idx in range(n)],
+        "meta": meta,
+        "components": comps,
+        "budget_penalty": budget_penalty_all,
+        "forbidden_penalty": forbidden_penalty_all,
+        "final_score": final_all,
+        "present": present,
+        "eligible": eligible,
     }
-    return output
+
+
+def _recommendation_entry(scored: Dict, idx: int) -> Dict:
+    comps = scored["components"]
+    m = scored["meta"][idx]
+    return {
+        "product_id": scored["ids"][idx],
+        "name": m["name"],
+        "brand": m["brand"],
+        "category": m["category"],
+        "price": m["price"],
+        "currency": m["currency"],
+        "final_score": float(scored["final_score"][idx]),
+        "details": {
+            "T": float(comps["T"][idx]),
+            "S": float(comps["S"][idx]),
+            "V_sim": float(comps["V_sim"][idx]),
+            "ratio_visit": float(comps["ratio_visit"][idx]),
+            "R_Q": float(comps["R_Q"][idx]),
+            "ratio_fav": float(comps["ratio_fav"][idx]),
+            "ratio_buy": float(comps["ratio_buy"][idx]),
+            "budget_penalty": float(scored["budget_penalty"][idx]),
+            "forbidden_penalty": float(scored["forbidden_penalty"][idx])
+        }
+    }
+
+
+def _ranked(scored: Dict, candidates: np.ndarray) -> np.ndarray:
+    # مرتب‌سازی نزولی پایدار (در امتیاز برابر ترتیب کاتالوگ حفظ می‌شود)
+    order = np.argsort(-scored["final_score"][candidates], kind="stable")
+    return candidates[order]
+
+
+def eligible_mask(scored: Dict, in_stock=False, stock=None, only_in_stock=None) -> np.ndarray:
+    """
+    Products that may be recommended. scored["eligible"] holds the stock-free
+    filters; the user's only_in_stock preference and the in_stock filter are
+    applied here against `stock` (per index, current values), so cached and
+    precomputed scores do not depend on stock. Default stock: meta at scoring time.
+    """
+    if only_in_stock is None:
+        only_in_stock = scored["params"].get("only_in_stock", False)
+    stocked = None
+    if only_in_stock or in_stock:
+        if stock is None:
+            stock = np.array([(m or {}).get("stock", 0) or 0 for m in scored["meta"]])
+        stocked = np.asarray(stock) > 0
+    mask = scored["eligible"] & stocked if only_in_stock else scored["eligible"].copy()
+    if not mask.any():
+        mask = scored["present"].copy()
+    if in_stock:
+        mask &= stocked
+    return mask
+
+
+def recommendations_output(scored: Dict, indices=None, stock=None) -> Dict:
+    if indices is None:
+        indices = _ranked(scored, np.flatnonzero(eligible_mask(scored, stock=stock)))
+    return {
+        "generated_at": scored["generated_at"],
+        "user": scored["user"],
+        "params": scored["params"],
+        "recommendations": [_recommendation_entry(scored, int(idx)) for idx in indices]
+    }
+
+
+def _matches_category(category, wanted) -> bool:
+    if isinstance(wanted, str):
+        wanted = [wanted]
+    category = category or ''
+    return any(w and w in category for w in wanted)
+
+
+def top_k_indices(scored: Dict, k: int, category=None, brand=None, in_stock=None, category_keys=None,
+                  stock=None, only_in_stock=None) -> np.ndarray:
+    """
+    Indices of the k best eligible products, optionally restricted to a category
+    (a name or list of names matched like icontains), to products whose
+    normalized category key is in `category_keys`, a brand and stock > 0.
+    Uses partial selection; the order equals the prefix of the full ranking.
+    """
+    mask = eligible_mask(scored, in_stock=in_stock, stock=stock, only_in_stock=only_in_stock)
+    if category or brand or category_keys:
+        category_keys = set(category_keys or ())
+        for idx in np.flatnonzero(mask):
+            m = scored["meta"][idx]
+            if (category and not _matches_category(m["category"], category)) \
+                    or (category_keys and (m.get("category_key") or normalize_category(m["category"])) not in category_keys) \
+                    or (brand and m["brand"] != brand):
+                mask[idx] = False
+    candidates = np.flatnonzero(mask)
+    if k is None or k >= len(candidates):
+        return _ranked(scored, candidates)
+    if k <= 0:
+        return candidates[:0]
+    scores = scored["final_score"][candidates]
+    kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+    # همه محصولاتِ هم‌امتیاز با k-امین را نگه دار تا ترتیب با رتبه‌بندی کامل یکی باشد
+    winners = candidates[scores >= kth]
+    return _ranked(scored, winners)[:k]
+
+
+def top_k_recommendations(scored: Dict, k: int, category=None, brand=None, in_stock=None, category_keys=None,
+                          stock=None) -> Dict:
+    return recommendations_output(scored, top_k_indices(
+        scored, k, category=category, brand=brand, in_stock=in_stock, category_keys=category_keys, stock=stock))
+
+
+def compute_recommendations(products: List[Dict], purchases: List[Dict], user_prefs: Dict, keywords: Dict, user_id=USER_ID_DEFAULT) -> Dict:
+    scored = score_all_products(products, purchases, user_prefs, keywords, user_id=user_id)
+    return recommendations_output(scored)
 
 
 # ---------------- Django view ----------------
 
 class RecommendationsView(View):
-    """GET /recs/<username>/  -> returns JSON recommendations for username"""
+    """
+    GET /recs/<username>/  -> returns JSON recommendations for username
+    optional: ?limit=10&category=...&brand=...&in_stock=1 (top-K only)
+    """
     def get(self, request, username=None):
+        from recommendation.cache import get_user_recommendations, get_user_top_recommendations
         user_id = username or USER_ID_DEFAULT
-        products = build_products_from_db(user_id=user_id)
-        purchases = build_purchases_from_db(user_id=user_id)
-        user_prefs, keywords = get_user_preferences_from_db(user_id=user_id)
+        limit = request.GET.get('limit')
+        category = request.GET.get('category') or None
+        brand = request.GET.get('brand') or None
+        in_stock = request.GET.get('in_stock') in ('1', 'true', 'True')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return JsonResponse({"error": "limit must be an integer"}, status=400)
+            if limit < 0:
+                return JsonResponse({"error": "limit must be >= 0"}, status=400)
         try:
-            output = compute_recommendations(products, purchases, user_prefs or {}, keywords or {}, user_id=user_id)
+            if limit is not None or category or brand or in_stock:
+                output = get_user_top_recommendations(user_id, limit, category=category, brand=brand, in_stock=in_stock)
+            else:
+                output = get_user_recommendations(user_id)
         except Exception as e:
             return HttpResponse(f"Error computing recommendations: {str(e)}", status=500)
         return JsonResponse(output, safe=False, json_dumps_params={'ensure_ascii': False, 'indent': 2})
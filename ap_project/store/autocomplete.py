@@ -0,0 +1,193 @@
+"""
+Trie پیشوندی برای autocomplete_search
+
+Keys are the normalized product name and category, inserted from every word
+start ("کرم شب ترمیم" -> "کرم شب ترمیم", "شب ترمیم", "ترمیم"). Every node keeps
+the best AUTOCOMPLETE_LIMIT products of its subtree, ordered by a popularity
+weight computed at build time, so a lookup is a walk of len(prefix) nodes
+with no DB access.
+
+The trie is keyed on its own NAMES_VERSION_KEY counter (VersionCounter in
+the DB). Only product creation, deletion, name/category edits and bulk
+imports bump it, not ratings, stock or checkouts. Popularity weights are
+refreshed by a rebuild every AUTOCOMPLETE_REFRESH_INTERVAL seconds instead.
+The counter is read at most every AUTOCOMPLETE_VERSION_CHECK_INTERVAL
+seconds. A stale trie keeps answering while a background thread builds the
+new one. Only the very first build in a process runs on the request.
+"""
+
+import logging
+import math
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+
+from recommendation.text_processing import normalize_text
+from store.search_index import normalize_query_words
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_LIMIT = 10
+MAX_KEY_LEN = 40
+
+NAMES_VERSION_KEY = "autocomplete:names_version"
+# فیلدهایی که کلیدهای trie از آن‌ها ساخته می‌شوند
+TRIE_FIELDS = frozenset({'name', 'category'})
+
+_lock = threading.Lock()
+_trie = None
+_checked_at = 0.0
+_rebuilding = False
+
+
+@lru_cache(maxsize=65536)
+def normalize_key(text) -> str:
+    # دسته‌ها و بخش زیادی از نام‌ها تکراری‌اند؛ Hazm گران‌ترین بخش ساخت trie است
+    return normalize_text(text).lower()
+
+
+def popularity_weight(avg_rating, rating_count, units_sold) -> float:
+    return float(avg_rating or 0.0) * math.log1p(rating_count or 0) + math.log1p(units_sold or 0)
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children = {}
+        self.top = []  # [(-weight, pid)] sorted, at most AUTOCOMPLETE_LIMIT
+
+
+class PrefixTrie:
+    def __init__(self, version=None, limit=AUTOCOMPLETE_LIMIT):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.limit = limit
+        self.root = _Node()
+        self.names: Dict[int, str] = {}
+
+    def _offer(self, node, item):
+        top = node.top
+        if item in top:
+            return
+        if len(top) >= self.limit and item >= top[-1]:
+            return
+        top.append(item)
+        top.sort()
+        del top[self.limit:]
+
+    def insert(self, key: str, pid, weight: float):
+        item = (-weight, pid)
+        node = self.root
+        for ch in key[:MAX_KEY_LEN]:
+            node = node.children.setdefault(ch, _Node())
+            self._offer(node, item)
+
+    def add_product(self, pid, name, category, weight):
+        self.names[pid] = name
+        for text in (name, category):
+            words = normalize_key(text).split()
+            for i in range(len(words)):
+                self.insert(" ".join(words[i:]), pid, weight)
+
+    def complete(self, prefix: str, limit=AUTOCOMPLETE_LIMIT) -> List[Tuple[int, str]]:
+        node = self.root
+        for ch in prefix[:MAX_KEY_LEN]:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [(pid, self.names[pid]) for _, pid in node.top[:limit]]
+
+
+def build_prefix_trie(version=None) -> PrefixTrie:
+    from products.models import Product
+    from orders.models import OrderItem
+    units = dict(OrderItem.objects.values('product_id').annotate(units=Sum('quantity')).values_list('product_id', 'units'))
+    trie = PrefixTrie(version)
+    rows = Product.objects.values('id', 'name', 'category', 'avg_rating', 'rating_count')
+    for p in rows.iterator(chunk_size=2000):
+        weight = popularity_weight(p['avg_rating'], p['rating_count'], units.get(p['id']))
+        trie.add_product(p['id'], p['name'], p['category'], weight)
+    return trie
+
+
+def _names_version():
+    from recommendation.models import VersionCounter
+    return VersionCounter.get(NAMES_VERSION_KEY)
+
+
+def bump_names_version():
+    """Mark every process's trie stale; they rebuild in the background"""
+    from recommendation.models import VersionCounter
+    VersionCounter.bump(NAMES_VERSION_KEY)
+
+
+def reset_prefix_trie():
+    """Drop this process's trie; the next lookup builds it synchronously"""
+    global _trie
+    _trie = None
+
+
+def invalidate_prefix_trie():
+    """After bulk imports: every process rebuilds, this one right away"""
+    bump_names_version()
+    reset_prefix_trie()
+
+
+def _rebuild(version):
+    global _trie, _rebuilding
+    try:
+        _trie = build_prefix_trie(version)
+    except Exception:
+        logger.exception("autocomplete trie rebuild failed")
+    finally:
+        _rebuilding = False
+        # اتصال DB همین thread
+        connections.close_all()
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    with _lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, args=(version,), name='autocomplete-trie', daemon=True).start()
+
+
+def get_prefix_trie() -> PrefixTrie:
+    global _trie, _checked_at
+    trie = _trie
+    if trie is None:
+        with _lock:
+            if _trie is None:
+                _trie = build_prefix_trie(_names_version())
+                _checked_at = time.monotonic()
+            return _trie
+    now = time.monotonic()
+    if now - _checked_at < getattr(settings, 'AUTOCOMPLETE_VERSION_CHECK_INTERVAL', 2.0):
+        return trie
+    _checked_at = now
+    version = _names_version()
+    if version != trie.version or now - trie.built_at >= getattr(settings, 'AUTOCOMPLETE_REFRESH_INTERVAL', 15 * 60):
+        # trie قبلی تا آماده شدن نسخه جدید جواب می‌دهد
+        _rebuild_in_background(version)
+    return trie
+
+
+@lru_cache(maxsize=4096)
+def query_prefix(query: str) -> str:
+    # پیشوندهای تایپ‌شده بسیار تکراری‌اند؛ نرمال‌سازی Hazm فقط یک بار برای هر کدام
+    return normalize_key(" ".join(normalize_query_words(query)))
+
+
+def autocomplete(query: str, limit=AUTOCOMPLETE_LIMIT) -> List[Dict]:
+    prefix = query_prefix(query)
+    if not prefix:
+        return []
+    return [{'id': pid, 'name': name} for pid, name in get_prefix_trie().complete(prefix, limit)]
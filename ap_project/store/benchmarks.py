@@ -0,0 +1,151 @@
+"""
+میکروبنچمارک مسیرهای داغ (recommendations, store_view, search, category, checkout)
+
+Every path is requested through the Django test client as a synthetic user.
+The first call (catalog model, search index and seasonal table are built
+here) is reported on its own. Then `repeat` timed calls run with the result
+cache cleared before each one, and the median/max time and query count are
+reported. One more call runs under tracemalloc for the peak Python/NumPy
+allocation.
+
+recommendation_snapshot()/compare_snapshots() record the ranking of a few
+users and check a later run against it (same order, scores within
+`tolerance`). benchmark_hot_paths uses them to show that an optimization did
+not change the rankings.
+"""
+
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+GOLDEN_TOLERANCE = 1e-9
+
+
+@dataclass
+class HotPath:
+    name: str
+    method: str
+    url: str
+    setup: Optional[Callable] = None
+    data: Optional[Dict] = None
+    ajax: bool = False
+
+
+def _fill_cart(user, lines=3):
+    from cart.models import Cart, CartItem
+    from products.models import Product
+    cart, _ = Cart.objects.get_or_create(user=user)
+    products = Product.objects.filter(stock__gte=1).order_by('-stock', 'id')[:lines]
+    CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=1) for p in products])
+
+
+def hot_paths(user) -> List[HotPath]:
+    from products.models import Product
+    category = Product.objects.order_by('id').values_list('category', flat=True).first() or ''
+    word = (Product.objects.order_by('id').values_list('name', flat=True).first() or '').split(' ')[0]
+    return [
+        HotPath('recommendations', 'get', f'/recommendations/{user.username}/'),
+        HotPath('recommendations_top10', 'get', f'/recommendations/{user.username}/?limit=10'),
+        HotPath('store_view', 'get', '/'),
+        HotPath('search_products_json', 'get', f'/search/?q={word}'),
+        HotPath('category_view', 'get', f'/category/{category}/'),
+        HotPath('checkout', 'post', '/cart/checkout/', setup=lambda: _fill_cart(user), ajax=True),
+    ]
+
+
+def _request(client, path: HotPath):
+    extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if path.ajax else {}
+    response = getattr(client, path.method)(path.url, data=path.data, **extra)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{path.name}: HTTP {response.status_code} for {path.url}")
+    return response
+
+
+def measure(client, path: HotPath, repeat=5) -> Dict:
+    if path.setup:
+        path.setup()
+    started = time.perf_counter()
+    _request(client, path)
+    first_ms = (time.perf_counter() - started) * 1000
+
+    times, queries = [], []
+    for _ in range(repeat):
+        if path.setup:
+            path.setup()
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            _request(client, path)
+            times.append((time.perf_counter() - started) * 1000)
+        queries.append(len(ctx.captured_queries))
+
+    if path.setup:
+        path.setup()
+    cache.clear()
+    tracemalloc.start()
+    try:
+        _request(client, path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'path': path.name,
+        'first_ms': round(first_ms, 2),
+        'median_ms': round(statistics.median(times), 2) if times else None,
+        'max_ms': round(max(times), 2) if times else None,
+        'queries': int(statistics.median(queries)) if queries else None,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_hot_paths(user, repeat=5, only=None) -> List[Dict]:
+    client = Client()
+    client.force_login(user)
+    return [measure(client, path, repeat=repeat) for path in hot_paths(user) if not only or path.name in only]
+
+
+# ---------------- مقایسه با خروجی طلایی ----------------
+
+def recommendation_snapshot(usernames) -> Dict:
+    """username -> {'season', 'ranking': [[product_id, final_score], ...]}"""
+    from recommendation.cache import get_user_recommendations
+    snapshot = {}
+    for username in usernames:
+        cache.clear()
+        output = get_user_recommendations(username)
+        snapshot[username] = {
+            'season': output['params'].get('season_used'),
+            'ranking': [[r['product_id'], r['final_score']] for r in output['recommendations']],
+        }
+    return snapshot
+
+
+def compare_snapshots(golden: Dict, current: Dict, tolerance=GOLDEN_TOLERANCE) -> List[str]:
+    """Differences between two snapshots; empty when the rankings match"""
+    problems = []
+    for username, expected in golden.items():
+        got = current.get(username)
+        if got is None:
+            problems.append(f"{username}: missing")
+            continue
+        if expected['season'] != got['season']:
+            problems.append(f"{username}: golden was recorded in {expected['season']}, now {got['season']}")
+            continue
+        want_ids = [pid for pid, _ in expected['ranking']]
+        got_ids = [pid for pid, _ in got['ranking']]
+        if want_ids != got_ids:
+            diverge = next((i for i, (a, b) in enumerate(zip(want_ids, got_ids)) if a != b),
+                           min(len(want_ids), len(got_ids)))
+            problems.append(f"{username}: ranking differs from position {diverge}")
+            continue
+        diff = max((abs(a[1] - b[1]) for a, b in zip(expected['ranking'], got['ranking'])), default=0.0)
+        if diff > tolerance:
+            problems.append(f"{username}: max score difference {diff:.3g} > {tolerance:g}")
+    return problems
@@ -0,0 +1,150 @@
+"""
+
+cd ap_project
+python manage.py benchmark_hot_paths --scales 1000x1000 10000x10000 --repeat 5
+python manage.py benchmark_hot_paths --scales 1000x1000 --golden ../benchmarks/golden.json --write-golden   # ثبت رتبه‌بندی مرجع
+python manage.py benchmark_hot_paths --scales 1000x1000 --golden ../benchmarks/golden.json                  # بعد از بهینه‌سازی
+python manage.py benchmark_hot_paths --current-db --user u1                                                 # داده‌های فعلی
+
+هر مقیاس در یک دیتابیس تست جدا (مثل manage.py test) ساخته و بعد حذف می‌شود؛
+کاربر دیتابیس باید اجازه CREATE DATABASE داشته باشد.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from accounts.synthetic import SyntheticScale, generate_synthetic_data, load_seed_products
+from store.benchmarks import GOLDEN_TOLERANCE, compare_snapshots, recommendation_snapshot, run_hot_paths
+
+COLUMNS = ('path', 'first_ms', 'median_ms', 'max_ms', 'queries', 'peak_kb')
+
+
+class Command(BaseCommand):
+    help = ("Time the hot paths (recommendations, store_view, search, category, checkout) on seeded synthetic "
+            "data at several scales, with query counts and peak memory, and check rankings against a golden file")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', nargs='+', default=['1000x1000'], metavar='PRODUCTSxUSERS')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--paths', nargs='+', metavar='NAME', help="Only these hot paths")
+        parser.add_argument('--golden', metavar='PATH', help="Golden rankings file to compare with")
+        parser.add_argument('--write-golden', action='store_true', help="Write --golden instead of comparing")
+        parser.add_argument('--golden-users', type=int, default=5)
+        parser.add_argument('--tolerance', type=float, default=GOLDEN_TOLERANCE)
+        parser.add_argument('--json', metavar='PATH', help="Write all results as JSON")
+        parser.add_argument('--current-db', action='store_true', help="Benchmark the existing data, no generation")
+        parser.add_argument('--user', help="Username for --current-db (default: first user)")
+
+    def handle(self, *args, **options):
+        if options['write_golden'] and not options['golden']:
+            raise CommandError("--write-golden needs --golden PATH")
+        try:
+            scales = [SyntheticScale.parse(text) for text in options['scales']]
+        except ValueError as e:
+            raise CommandError(str(e))
+        golden = None
+        if options['golden'] and not options['write_golden']:
+            with open(options['golden'], 'r', encoding='utf-8') as f:
+                golden = json.load(f)
+            if golden.get('seed') != options['seed']:
+                raise CommandError(f"golden file was written with --seed {golden.get('seed')}")
+
+        catalog_dir = tempfile.mkdtemp(prefix='benchmark_')
+        # کش و فایل مدل کاتالوگ جدا از پروژه: اجرای بنچمارک روی کش/مدل واقعی اثری ندارد
+        isolated = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+            RECOMMENDATION_CATALOG_PATH=os.path.join(catalog_dir, 'catalog.pkl'),
+        )
+        setup_test_environment()
+        isolated.enable()
+        results, snapshots, problems = {}, {}, []
+        try:
+            if options['current_db']:
+                results['current'], snapshots['current'] = self.run_scale(None, options)
+            else:
+                seed_products = load_seed_products()
+                for scale in scales:
+                    results[scale.label], snapshots[scale.label] = self.run_scale(scale, options, seed_products)
+        finally:
+            self.reset_process_state()
+            isolated.disable()
+            teardown_test_environment()
+            shutil.rmtree(catalog_dir, ignore_errors=True)
+
+        if options['golden']:
+            if options['write_golden']:
+                with open(options['golden'], 'w', encoding='utf-8') as f:
+                    json.dump({'seed': options['seed'], 'scales': snapshots}, f, ensure_ascii=False, indent=1)
+                self.stdout.write(f"Golden rankings written to {options['golden']}")
+            else:
+                for label, snapshot in snapshots.items():
+                    if label not in golden['scales']:
+                        self.stdout.write(self.style.WARNING(f"{label}: not in golden file, not compared"))
+                        continue
+                    problems += [f"{label} {p}" for p in
+                                 compare_snapshots(golden['scales'][label], snapshot, options['tolerance'])]
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump({'seed': options['seed'], 'repeat': options['repeat'], 'results': results}, f, indent=1)
+        if problems:
+            raise CommandError("Rankings differ from the golden file:\n" + "\n".join(problems))
+        if golden is not None:
+            self.stdout.write(self.style.SUCCESS("Rankings match the golden file"))
+
+    def run_scale(self, scale, options, seed_products=None):
+        self.reset_process_state()
+        old_name = None
+        if scale is not None:
+            self.stdout.write(f"Scale {scale.label}: generating data ...")
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            if scale is not None:
+                started = time.perf_counter()
+                generate_synthetic_data(scale, seed=options['seed'], seed_products=seed_products)
+                self.stdout.write(f"  generated in {time.perf_counter() - started:.1f}s")
+            User = get_user_model()
+            users = User.objects.order_by('id')
+            if options['user']:
+                users = users.filter(username=options['user'])
+            elif scale is not None:
+                users = users.filter(username__startswith='syn')
+            user = users.first()
+            if user is None:
+                raise CommandError("No user to benchmark with")
+            # checkout و کش‌ها داده را تغییر می‌دهند؛ اندازه‌گیری در تراکنشی اجرا می‌شود که rollback می‌شود
+            with transaction.atomic():
+                rows = run_hot_paths(user, repeat=options['repeat'], only=options['paths'])
+                transaction.set_rollback(True)
+            snapshot = recommendation_snapshot(users.values_list('username', flat=True)[:options['golden_users']])
+            self.print_table(scale.label if scale else 'current database', rows)
+            return rows, snapshot
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def reset_process_state(self):
+        # مدل کاتالوگ، ایندکس جستجو و trie تکمیل خودکار در حافظه پروسه نگه داشته می‌شوند
+        from recommendation.catalog import invalidate_catalog_model
+        from store.autocomplete import reset_prefix_trie
+        from store.search_index import invalidate_search_index
+        invalidate_catalog_model()
+        invalidate_search_index()
+        reset_prefix_trie()
+
+    def print_table(self, title, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write("  " + "".join(f"{c:>22}" if i == 0 else f"{c:>11}" for i, c in enumerate(COLUMNS)))
+        for row in rows:
+            self.stdout.write("  " + "".join(
+                f"{str(row[c]):>22}" if i == 0 else f"{str(row[c]):>11}" for i, c in enumerate(COLUMNS)))
@@ -0,0 +1,18 @@
+"""
+
+cd ap_project
+python manage.py build_seasonal_rankings
+
+"""
+
+from django.core.management.base import BaseCommand
+from store.seasonal import rebuild_seasonal_rankings
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-season product ranking table used by the seasonal page and the store home shelf"
+
+    def handle(self, *args, **options):
+        counts = rebuild_seasonal_rankings()
+        summary = ", ".join(f"{season}: {n}" for season, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seasonal rankings rebuilt ({summary})"))
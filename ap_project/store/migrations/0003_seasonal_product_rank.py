@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_keyset_indexes'),
+        ('store', '0002_delete_searchhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeasonalProductRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.CharField(max_length=10)),
+                ('similarity', models.FloatField()),
+                ('rank', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='season_ranks', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['season', 'rank'], name='season_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('season', 'product'), name='season_rank_unique_product')],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.models import Product, Comment
+
+
+class SeasonalProductRank(models.Model):
+    """رتبه محصول برای هر فصل (store.seasonal)؛ کل جدول یکجا بازسازی می‌شود"""
+    season = models.CharField(max_length=10)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='season_ranks')
+    similarity = models.FloatField()
+    rank = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'product'], name='season_rank_unique_product'),
+        ]
+        indexes = [
+            models.Index(fields=['season', 'rank'], name='season_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.season} #{self.rank}: {self.product_id} ({self.similarity:.3f})'
+
+
+# ---------------- به‌روزرسانی ایندکس جستجو با تغییر محصولات ----------------
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_product_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    from store.search_index import INDEXED_MODEL_FIELDS, update_product_in_index
+    if raw:
+        return
+    if created or update_fields is None or INDEXED_MODEL_FIELDS.intersection(update_fields):
+        update_product_in_index(instance)
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_product_delete(sender, instance, **kwargs):
+    from store.search_index import remove_product_from_index
+    remove_product_from_index(instance.pk)
+
+
+# ---------------- نسخه trie تکمیل خودکار (فقط نام و دسته) ----------------
+
+@receiver(post_save, sender=Product)
+def bump_autocomplete_on_product_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    from store.autocomplete import TRIE_FIELDS, bump_names_version
+    if raw:
+        return
+    if created or update_fields is None or TRIE_FIELDS.intersection(update_fields):
+        bump_names_version()
+
+
+@receiver(post_delete, sender=Product)
+def bump_autocomplete_on_product_delete(sender, instance, **kwargs):
+    from store.autocomplete import bump_names_version
+    bump_names_version()
+
+
+# ---------------- باطل کردن رتبه‌بندی فصلی ----------------
+
+@receiver(post_save, sender=Product)
+def mark_seasonal_rankings_on_product_save(sender, instance, created, raw=False, **kwargs):
+    from recommendation.models import corpus_changed
+    from store.seasonal import mark_seasonal_rankings_stale
+    if raw:
+        return
+    if corpus_changed(instance, created):
+        mark_seasonal_rankings_stale()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def mark_seasonal_rankings_on_rating_change(sender, **kwargs):
+    # avg_rating تعیین می‌کند کدام محصولات (>= 3) رتبه‌بندی شوند
+    from store.seasonal import mark_seasonal_rankings_stale
+    mark_seasonal_rankings_stale()
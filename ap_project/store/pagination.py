@@ -0,0 +1,110 @@
+"""
+صفحه‌بندی keyset (cursor) برای لیست‌های محصولات با اسکرول بی‌نهایت
+
+Each sort mode orders by (column, id) so the order is total; the cursor is the
+(column, id) pair of the last row, encoded as an opaque urlsafe string. The
+next page is a range scan "after the cursor" on the (column, id) index instead
+of OFFSET, and has_more comes from fetching page_size + 1 rows instead of
+COUNT(*).
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+# sort -> (column, descending)
+SORT_COLUMNS = {
+    'newest': ('created_at', True),
+    'cheapest': ('price', False),
+    'expensive': ('price', True),
+    'alpha_asc': ('name', False),
+    'alpha_desc': ('name', True),
+}
+DEFAULT_SORT = 'newest'
+# column -> نوع مقدار cursor (created_at به صورت رشته ISO)
+CURSOR_VALUE_TYPES = {
+    'created_at': str,
+    'price': (int, float),
+    'name': str,
+}
+
+PRODUCT_LIST_FIELDS = ('id', 'name', 'price', 'image', 'stock', 'avg_rating', 'created_at')
+
+
+def sort_column(sort):
+    return SORT_COLUMNS.get(sort) or SORT_COLUMNS[DEFAULT_SORT]
+
+
+def page_number(value) -> int:
+    """?page= for old clients; anything that is not a positive int is page 1"""
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def order_for_sort(qs, sort):
+    column, desc = sort_column(sort)
+    return qs.order_by(f'-{column}', '-id') if desc else qs.order_by(column, 'id')
+
+
+def encode_cursor(sort, row) -> str:
+    column, _ = sort_column(sort)
+    value = row[column]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, row['id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(sort, cursor):
+    """
+    (value, id) of the cursor, or None (first page) if it is missing, invalid,
+    for another sort or its value/id have the wrong type for the column
+    """
+    if not cursor:
+        return None
+    try:
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if cursor_sort != sort:
+        return None
+    column, _ = sort_column(sort)
+    # bool زیرکلاس int است و نباید به عنوان قیمت یا id پذیرفته شود
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        return None
+    if isinstance(value, bool) or not isinstance(value, CURSOR_VALUE_TYPES[column]):
+        return None
+    if column == 'created_at':
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None
+    return value, last_id
+
+
+def keyset_page(qs, sort, cursor=None, page_size=16, fields=PRODUCT_LIST_FIELDS, page=1):
+    """
+    Returns (rows, next_cursor, has_more); rows are .values() dicts.
+    Without a cursor, `page` is honoured with OFFSET for old clients.
+    """
+    if sort not in SORT_COLUMNS:
+        sort = DEFAULT_SORT
+    column, desc = sort_column(sort)
+    qs = order_for_sort(qs, sort)
+    after = decode_cursor(sort, cursor)
+    if after is not None:
+        value, last_id = after
+        op = 'lt' if desc else 'gt'
+        qs = qs.filter(Q(**{f'{column}__{op}': value}) | Q(**{column: value, f'id__{op}': last_id}))
+        start = 0
+    else:
+        start = max(0, (page - 1) * page_size)
+    rows = list(qs.values(*fields)[start:start + page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(sort, rows[-1]) if has_more and rows else None
+    return rows, next_cursor, has_more
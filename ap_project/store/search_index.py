@@ -0,0 +1,227 @@
+"""
+ایندکس معکوس جستجوی فروشگاه (توکن -> شناسه محصولات)
+
+Postings are kept per field (name, category, tags, skin_type) over the same
+stemmed Hazm tokens stored in Product.products_tokens, so the search views can
+keep their field semantics while resolving queries with set intersection and
+union instead of icontains table scans.
+
+The index lives in process memory. Product save/delete receivers in
+store.models patch it in place and bump the SEARCH_VERSION_KEY VersionCounter
+row in the database, which every worker reads whatever the cache backend is.
+A process that sees a version it did not produce itself rebuilds the index
+on its next query.
+"""
+
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from ap_project.performance import span
+from recommendation.text_processing import tokenize
+
+SEARCH_VERSION_KEY = "search:index_version"
+SEARCH_FIELDS = ("name", "category", "tags", "skin_type")
+# فیلدهایی که تغییرشان ایندکس را تغییر می‌دهد
+INDEXED_MODEL_FIELDS = set(SEARCH_FIELDS) | {"products_tokens"}
+
+WORD_MAPPING = {
+    "کزمو": "کرم",
+    "کزم": "کرم",
+    "چرپ": "چرب",
+    "charb": "چرب",
+    "خشك": "خشک",
+    "خشگ": "خشک",
+    "معمولي": "معمولی",
+    "ترکبیی": "ترکیبی",
+    "ابرسان":"آبرسان",
+    "آب رسان":"آبرسان",
+    "آبرسلن":"آبرسان",
+}
+
+_lock = threading.Lock()
+_index = None
+
+
+def fix_word(word):
+    return WORD_MAPPING.get(word, word)
+
+
+def normalize_query_words(query: str) -> List[str]:
+    """Typo mapping (multi-word keys first, then word by word) -> list of query words"""
+    query = (query or "").strip()
+    for wrong, right in WORD_MAPPING.items():
+        if " " in wrong and wrong in query:
+            query = query.replace(wrong, right)
+    return [fix_word(word) for word in query.split()]
+
+
+def word_tokens(word: str) -> List[str]:
+    return tokenize(word)
+
+
+def product_field_tokens(p: Dict) -> Dict[str, Set[str]]:
+    """Stemmed tokens per search field, from products_tokens when available"""
+    pt = p.get("products_tokens")
+    out = {}
+    for field in SEARCH_FIELDS:
+        toks = pt.get(field) if isinstance(pt, dict) else None
+        if not isinstance(toks, list):
+            value = p.get(field)
+            if isinstance(value, (list, tuple)):
+                value = " ".join(str(v) for v in value)
+            toks = tokenize(value or "")
+        out[field] = set(toks)
+    return out
+
+
+class SearchIndex:
+    def __init__(self, version=None):
+        self.version = version
+        self.postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in SEARCH_FIELDS}
+        self.product_tokens: Dict[int, Dict[str, Set[str]]] = {}
+        self._vocab: Optional[List[str]] = None
+
+    def add(self, pid, field_tokens: Dict[str, Set[str]]):
+        self.remove(pid)
+        self.product_tokens[pid] = field_tokens
+        for field, toks in field_tokens.items():
+            postings = self.postings[field]
+            for tok in toks:
+                postings.setdefault(tok, set()).add(pid)
+        self._vocab = None
+
+    def remove(self, pid):
+        old = self.product_tokens.pop(pid, None)
+        if not old:
+            return
+        for field, toks in old.items():
+            postings = self.postings[field]
+            for tok in toks:
+                ids = postings.get(tok)
+                if ids is not None:
+                    ids.discard(pid)
+                    if not ids:
+                        del postings[tok]
+        self._vocab = None
+
+    def _sorted_vocab(self) -> List[str]:
+        if self._vocab is None:
+            vocab = set()
+            for postings in self.postings.values():
+                vocab.update(postings)
+            self._vocab = sorted(vocab)
+        return self._vocab
+
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [token]
+        vocab = self._sorted_vocab()
+        start = bisect.bisect_left(vocab, token)
+        end = bisect.bisect_left(vocab, token + "\uffff")
+        return vocab[start:end]
+
+    def lookup(self, token: str, fields: Iterable[str] = SEARCH_FIELDS, prefix: bool = False) -> Set[int]:
+        """Products with `token` (or a token starting with it) in any of `fields`"""
+        out = set()
+        for tok in self._expand(token, prefix):
+            for field in fields:
+                out |= self.postings[field].get(tok, set())
+        return out
+
+    def match_word(self, word: str, fields: Iterable[str] = SEARCH_FIELDS, prefix: bool = False) -> Set[int]:
+        """Products matching every token of one query word; the last token may be a prefix"""
+        toks = word_tokens(word)
+        if not toks:
+            return set()
+        fields = tuple(fields)
+        result = None
+        for i, tok in enumerate(toks):
+            ids = self.lookup(tok, fields, prefix=prefix and i == len(toks) - 1)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def match_all(self, words: List[str], fields: Iterable[str] = SEARCH_FIELDS, prefix_last: bool = False) -> Set[int]:
+        """Intersection over words (each word may match in any of `fields`)"""
+        result = None
+        fields = tuple(fields)
+        for i, word in enumerate(words):
+            ids = self.match_word(word, fields, prefix=prefix_last and i == len(words) - 1)
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def match_any(self, words: List[str], fields: Iterable[str] = SEARCH_FIELDS) -> Set[int]:
+        """Union over words"""
+        result = set()
+        fields = tuple(fields)
+        for word in words:
+            result |= self.match_word(word, fields)
+        return result
+
+
+def _current_version():
+    from recommendation.models import VersionCounter
+    return VersionCounter.get(SEARCH_VERSION_KEY)
+
+
+@span('search_index')
+def build_search_index(version=None) -> SearchIndex:
+    from products.models import Product
+    index = SearchIndex(version)
+    rows = Product.objects.values('id', 'name', 'category', 'tags', 'skin_type', 'products_tokens')
+    for p in rows.iterator(chunk_size=2000):
+        index.add(p['id'], product_field_tokens(p))
+    return index
+
+
+def get_search_index() -> SearchIndex:
+    global _index
+    version = _current_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = build_search_index(version)
+        return _index
+
+
+def _bump_version(expected_version):
+    """Bump the shared version; keep our in-place patch only if nobody else bumped meanwhile"""
+    from recommendation.models import VersionCounter
+    VersionCounter.bump(SEARCH_VERSION_KEY)
+    new_version = VersionCounter.get(SEARCH_VERSION_KEY)
+    if _index is not None:
+        _index.version = new_version if new_version == (expected_version or 0) + 1 else None
+
+
+def update_product_in_index(product):
+    """Patch the in-process index after a product was created or edited"""
+    with _lock:
+        expected = _index.version if _index is not None else None
+        if _index is not None:
+            p = {field: getattr(product, field, None) for field in SEARCH_FIELDS}
+            p['products_tokens'] = getattr(product, 'products_tokens', None)
+            _index.add(product.pk, product_field_tokens(p))
+        _bump_version(expected)
+
+
+def remove_product_from_index(product_id):
+    with _lock:
+        expected = _index.version if _index is not None else None
+        if _index is not None:
+            _index.remove(product_id)
+        _bump_version(expected)
+
+
+def invalidate_search_index():
+    """Force every process to rebuild (e.g. after bulk_create / queryset.update)"""
+    from recommendation.models import VersionCounter
+    global _index
+    with _lock:
+        _index = None
+        VersionCounter.bump(SEARCH_VERSION_KEY)
@@ -0,0 +1,166 @@
+"""
+رتبه‌بندی از پیش محاسبه‌شده محصولات فصلی (جدول SeasonalProductRank)
+
+For every season the products with avg_rating >= SEASONAL_MIN_RATING are
+ranked by TF-IDF cosine similarity to the season tokens (SEASONAL_VECTORS),
+the same computation seasonal_products_view used to run per request. All
+four seasons are rebuilt together by `python manage.py build_seasonal_rankings`
+or lazily. Catalog/rating changes bump the VERSION_KEY VersionCounter in the
+database, and the rebuild stores the version it read as BUILT_KEY. A read that
+finds them different starts a rebuild in a background thread and keeps
+serving the current table. Only a table that was never built is built on the
+request. Rebuilds are claimed with a conditional UPDATE of CLAIM_KEY (a unix
+timestamp), so across all processes at most one starts every
+SEASONAL_REBUILD_MIN_INTERVAL seconds.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ap_project.performance import span
+from products.seasonal_vectors import SEASONAL_VECTORS
+
+SEASON_KEYS = ('spring', 'summer', 'autumn', 'winter')
+PERSIAN_SEASONS = {'بهار': 'spring', 'تابستان': 'summer', 'پاییز': 'autumn', 'زمستان': 'winter'}
+SEASONAL_MIN_RATING = 3.0
+
+VERSION_KEY = "seasonal:version"
+BUILT_KEY = "seasonal:built_version"
+CLAIM_KEY = "seasonal:rebuild_claimed_at"
+
+logger = logging.getLogger(__name__)
+
+
+def season_key(persian_season) -> str:
+    return PERSIAN_SEASONS.get(persian_season, 'spring')
+
+
+def product_season_tokens(p: Dict) -> List[str]:
+    pt = p.get('products_tokens') or {}
+    if isinstance(pt, dict):
+        if isinstance(pt.get('tokens'), list):
+            return pt['tokens']
+        tmp = []
+        for v in pt.values():
+            if isinstance(v, list):
+                tmp.extend(v)
+        return tmp
+    if isinstance(pt, list):
+        return pt
+    return [str(p[f]) for f in ('name', 'description', 'brand', 'category') if p.get(f)]
+
+
+def compute_seasonal_rankings(products: Optional[List[Dict]] = None) -> Dict[str, List[Tuple[int, float]]]:
+    """season -> [(product id, similarity)] with similarity > 0, best first"""
+    from products.models import Product
+    if products is None:
+        products = list(Product.objects.filter(avg_rating__gte=SEASONAL_MIN_RATING).order_by('id').values(
+            'id', 'name', 'description', 'brand', 'category', 'products_tokens'))
+    ids = np.array([p['id'] for p in products], dtype=np.int64)
+    corpus = [" ".join(product_season_tokens(p)) for p in products]
+    rankings = {}
+    for key in SEASON_KEYS:
+        season_text = " ".join(SEASONAL_VECTORS.get(key, []))
+        if not corpus or not season_text:
+            rankings[key] = []
+            continue
+        # IDF مثل قبل روی محصولات + متن فصل fit می‌شود
+        with span('tfidf_fit'):
+            X = TfidfVectorizer().fit_transform(corpus + [season_text])
+        with span('similarity'):
+            sims = np.asarray((X[:-1] @ X[-1].T).todense()).ravel()
+        order = np.argsort(-sims, kind='stable')
+        order = order[sims[order] > 0]
+        rankings[key] = list(zip(ids[order].tolist(), sims[order].tolist()))
+    return rankings
+
+
+def _versions() -> Tuple[int, Optional[int]]:
+    """(current version, version the table was built from or None)"""
+    from recommendation.models import VersionCounter
+    found = dict(VersionCounter.objects.filter(name__in=(VERSION_KEY, BUILT_KEY)).values_list('name', 'value'))
+    return found.get(VERSION_KEY, 1), found.get(BUILT_KEY)
+
+
+def rebuild_seasonal_rankings() -> Dict[str, int]:
+    from recommendation.models import VersionCounter
+    from store.models import SeasonalProductRank
+    # نسخه قبل از خواندن محصولات: تغییری که حین ساخت رخ دهد جدول را stale نگه می‌دارد
+    version, _ = _versions()
+    rankings = compute_seasonal_rankings()
+    rows = [SeasonalProductRank(season=key, product_id=pid, similarity=sim, rank=rank)
+            for key, ranked in rankings.items() for rank, (pid, sim) in enumerate(ranked)]
+    with transaction.atomic():
+        SeasonalProductRank.objects.all().delete()
+        SeasonalProductRank.objects.bulk_create(rows, batch_size=2000)
+        VersionCounter.objects.update_or_create(name=BUILT_KEY, defaults={'value': version})
+    return {key: len(ranked) for key, ranked in rankings.items()}
+
+
+def mark_seasonal_rankings_stale():
+    from recommendation.models import VersionCounter
+    VersionCounter.bump(VERSION_KEY)
+
+
+def _claim_rebuild() -> bool:
+    """True for the one process allowed to rebuild now (at most once per SEASONAL_REBUILD_MIN_INTERVAL)"""
+    from recommendation.models import VersionCounter
+    now = int(time.time())
+    min_interval = getattr(settings, 'SEASONAL_REBUILD_MIN_INTERVAL', 300)
+    if VersionCounter.objects.filter(name=CLAIM_KEY, value__lte=now - min_interval).update(value=now):
+        return True
+    try:
+        with transaction.atomic():
+            VersionCounter.objects.create(name=CLAIM_KEY, value=now)
+        return True
+    except IntegrityError:
+        return False
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_seasonal_rankings()
+    except Exception:
+        logger.exception("seasonal rankings rebuild failed")
+    finally:
+        connections.close_all()
+
+
+def ensure_seasonal_rankings():
+    """Start a rebuild when the table is stale; build synchronously only if it was never built"""
+    version, built = _versions()
+    if built == version:
+        return
+    if built is None:
+        from store.models import SeasonalProductRank
+        if not SeasonalProductRank.objects.exists():
+            rebuild_seasonal_rankings()
+            return
+    if _claim_rebuild():
+        # جدول فعلی تا پایان بازسازی سرو می‌شود
+        threading.Thread(target=_rebuild_in_background, name='seasonal-rankings', daemon=True).start()
+
+
+def seasonal_products(persian_season, limit=None, min_similarity=0.0):
+    """Products of a season in ranking order, with .similarity_score attached"""
+    from store.models import SeasonalProductRank
+    ensure_seasonal_rankings()
+    qs = (SeasonalProductRank.objects
+          .filter(season=season_key(persian_season), similarity__gt=min_similarity,
+                  product__avg_rating__gte=SEASONAL_MIN_RATING)
+          .select_related('product').order_by('rank'))
+    if limit:
+        qs = qs[:limit]
+    products = []
+    for row in qs:
+        product = row.product
+        product.similarity_score = row.similarity
+        products.append(product)
+    return products